@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { AutoComplete, Radio, Select, InputNumber, Button, message, Table } from 'antd';
-import api from '../utils/Request';
+import api, { streamURL } from '../utils/Request';
 import { useRefresh } from '../utils/Context';
 
 
@@ -14,6 +14,7 @@ const OrderForm = () => {
     const [price, setPrice] = useState('');
     const [volume, setVolume] = useState(1);
     const [levelPrices, setLevelPrices] = useState({});
+    const [streamCode, setStreamCode] = useState('');
     const [autoCompleteOptions, setAutoCompleteOptions] = useState(instruments.map(name => ({ value: name })));
 
     const handleNameSearch = value => {
@@ -40,19 +41,27 @@ const OrderForm = () => {
 
     const handleNameSelect = value => {
         setName(value);
-        const fetchPoints = async () => {
-            api.get(`/query_points?code=${value}`)
-                .then(res => {
-                    console.log(res.data);
-                    setLevelPrices(res.data);
-                })
-                .catch(error => {
-                    console.error(error);
-                });
+        setLevelPrices({});
+        setStreamCode(value);
+    };
 
+    // 订阅所选合约的行情推送，切换合约或离开页面时关闭连接
+    useEffect(() => {
+        if (!streamCode) {
+            return undefined;
+        }
+        const ws = new WebSocket(streamURL(streamCode));
+        ws.onmessage = event => {
+            const data = JSON.parse(event.data);
+            if (data.error) {
+                console.error(data.error);
+            } else if (data[streamCode]) {
+                setLevelPrices(data[streamCode]);
+            }
         };
-        fetchPoints();
-    };
+        ws.onerror = error => console.error(error);
+        return () => ws.close();
+    }, [streamCode]);
 
     useEffect(() => {
         const fetchInstruments = async () => {
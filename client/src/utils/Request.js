@@ -13,4 +13,8 @@ const api = axios.create({
   baseURL: baseURL, // 设置为你的后端服务器地址
 });
 
+// 行情推送 WebSocket 地址
+export const streamURL = (codes) =>
+  (protocol === 'https:' ? 'wss:' : 'ws:') + "//" + host + ":" + port + "/ws/quotes?codes=" + encodeURIComponent(codes);
+
 export default api;
@@ -4,6 +4,9 @@ from dynaconf import Dynaconf
 import logging.config
 import yaml
 
+from app.internal import logs
+from app.internal.constants import ASYNC_LOGGING, LOG_QUEUE_SIZE, LOG_BATCH_SIZE, TICK_LOG_RATE
+
 
 account = Dynaconf(envvar_prefix="CTP", load_dotenv=True, environments=True, settings_files=["account.yaml"])
 
@@ -13,6 +16,11 @@ if os.path.exists("logging.yaml"):
         log_cfg = yaml.safe_load(f.read())
         logging.config.dictConfig(log_cfg)
 
+# 日志在后台线程中格式化、批量写出，SPI回调线程和事件循环只负责入队
+if account.get("async_logging", ASYNC_LOGGING):
+    logs.install(account.get("log_queue_size", LOG_QUEUE_SIZE), account.get("log_batch_size", LOG_BATCH_SIZE),
+                 account.get("tick_log_rate", TICK_LOG_RATE))
+
 
 logger = logging.getLogger(__name__)
 
@@ -1,47 +1,28 @@
 import logging
 
 from app.routes.api import api
-from app.internal.ctp import ctp_client
+from app.routes.middleware import cors_middle_req, cors_middle_res
+from app.internal.ctp import ctp_client, owner_socket
+from app.internal.serializer import dumps
 
-from sanic import Sanic, response, HTTPResponse
+from sanic import Sanic
 
 logger = logging.getLogger(__name__)
 logger.info('start')
 
-app = Sanic(name=__name__, configure_logging=False)
+# 所有response.json使用serializer中的编码器（优先orjson），NaN、无穷统一输出为null
+app = Sanic(name=__name__, configure_logging=False, dumps=dumps)
 app.config.RESPONSE_TIMEOUT = 6000000
 app.config.REQUEST_TIMEOUT = 6000000
 app.config.KEEP_ALIVE_TIMEOUT = 600000
 app.blueprint(api)
-
-
-@app.middleware("request")
-def cors_middle_req(request):
-    """路由需要启用OPTIONS方法"""
-    if request.method.lower() == 'options':
-        allow_headers = [
-            'Authorization',
-            'content-type'
-        ]
-        headers = {
-            'Access-Control-Allow-Methods':
-                ', '.join(request.app.router.get_supported_methods(request.path)),
-            'Access-Control-Max-Age': '86400',
-            'Access-Control-Allow-Headers': ', '.join(allow_headers),
-        }
-        return HTTPResponse('', headers=headers)
-
-
-@app.middleware("response")
-def cors_middle_res(request, response):
-    """跨域处理"""
-    allow_origin = '*'
-    response.headers.update(
-        {
-            'Access-Control-Allow-Origin': allow_origin,
-        }
-    )
+app.register_middleware(cors_middle_req, "request")
+app.register_middleware(cors_middle_res, "response")
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=7000, workers=1, debug=False, auto_reload=False, access_log=True)
+    if owner_socket:
+        # 由app/ctp_workers.py启动的owner进程：只接受worker转发的请求
+        app.run(unix=owner_socket, workers=1, debug=False, auto_reload=False, access_log=True)
+    else:
+        app.run(host='0.0.0.0', port=7000, workers=1, debug=False, auto_reload=False, access_log=True)
@@ -0,0 +1,52 @@
+'''
+多进程部署：一个owner进程（app/ctp_service.py，监听unix socket）持有全部CTP会话，
+把行情存储和各账户的持仓、资金、报单、成交快照发布到共享内存；本文件启动owner后，
+在7000端口以多个Sanic worker直接从共享内存返回行情快照和账户快照，其他请求转发到owner。
+
+    cd server && export PYTHONPATH=. && python app/ctp_workers.py
+'''
+import atexit
+import logging
+import os
+import subprocess
+import sys
+
+from sanic import Sanic
+
+from app.config import account
+from app.routes.worker import worker
+from app.routes.middleware import cors_middle_req, cors_middle_res
+from app.internal.serializer import dumps
+from app.internal.constants import WORKERS, OWNER_SOCKET
+
+logger = logging.getLogger(__name__)
+
+app = Sanic(name="ctp_workers", configure_logging=False, dumps=dumps)
+app.config.RESPONSE_TIMEOUT = 6000000
+app.config.REQUEST_TIMEOUT = 6000000
+app.config.KEEP_ALIVE_TIMEOUT = 600000
+app.blueprint(worker)
+app.register_middleware(cors_middle_req, "request")
+app.register_middleware(cors_middle_res, "response")
+
+
+def start_owner():
+    '''
+    owner与worker通过环境变量得到同一个共享内存前缀和unix socket路径，worker进程继承本进程的环境
+    '''
+    os.environ["CTP_SHARED_PREFIX"] = account.get("shared_prefix", None) or "ctp%d" % os.getpid()
+    os.environ["CTP_OWNER_SOCKET"] = account.get("owner_socket", None) or os.path.abspath(OWNER_SOCKET)
+    account.reload()
+    owner = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), "ctp_service.py")])
+    logger.info(f"owner started, pid={owner.pid}, prefix={account.shared_prefix}, socket={account.owner_socket}")
+
+    def stop_owner():
+        owner.terminate()
+        owner.wait()
+    atexit.register(stop_owner)
+
+
+if __name__ == '__main__':
+    start_owner()
+    app.run(host='0.0.0.0', port=7000, workers=account.get("workers", WORKERS), debug=False, auto_reload=False,
+            access_log=True)
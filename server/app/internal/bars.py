@@ -0,0 +1,215 @@
+import threading
+import time
+
+import numpy as np
+
+from app.internal.constants import BAR_HISTORY, FILTER
+from app.internal.recorder import session_ms, day_ms
+
+
+# 周期名称 -> 秒数
+INTERVALS = {"1s": 1, "1m": 60, "5m": 300, "15m": 900, "1h": 3600}
+INDEX = {name: index for index, name in enumerate(INTERVALS)}
+# 每根K线一行：起始时间戳(ms)、开、高、低、收、成交量、成交额、持仓量
+COLUMNS = ("ts", "open", "high", "low", "close", "volume", "turnover", "open_interest")
+INITIAL_ROWS = 16
+# 开盘前集合竞价的tick计入第一根K线
+AUCTION_MS = 5 * 60 * 1000
+_H = 3600 * 1000
+# 交易时段，单位为session_ms（夜盘记为负数）；K线不跨时段，10:15-10:30小节休息前后分属两根K线
+SESSIONS = {
+    "commodity": ((-3 * _H, 2 * _H + _H // 2), (9 * _H, 10 * _H + _H // 4), (10 * _H + _H // 2, 11 * _H + _H // 2),
+                  (13 * _H + _H // 2, 15 * _H)),
+    "index": ((9 * _H + _H // 2, 11 * _H + _H // 2), (13 * _H, 15 * _H)),
+    "bond": ((9 * _H + _H // 2, 11 * _H + _H // 2), (13 * _H, 15 * _H + _H // 4)),
+}
+
+
+def session_kind(exchange, product):
+    '''
+    中金所股指（含股指期权）与国债期货的交易时段不同于商品期货
+    '''
+    if exchange == "CFFEX":
+        return "bond" if product.startswith("T") else "index"
+    return "commodity"
+
+
+def locate(sessions, ms):
+    '''
+    返回(时段序号, 时段开始, 归入的时刻)；不在任何时段内时返回None。
+    收盘时刻的tick计入最后一根K线，开盘前集合竞价的tick计入第一根K线
+    '''
+    for index, (start, end) in enumerate(sessions):
+        if start <= ms <= end:
+            return index, start, min(ms, end - 1)
+        if start - AUCTION_MS <= ms < start:
+            return index, start, start
+    return None
+
+
+class BarSeries:
+    '''
+    一个合约一个周期的K线：当前K线保存在列表中逐tick更新，完成的K线写入有界环形数组
+    '''
+
+    __slots__ = ("step", "capacity", "rows", "count", "current")
+
+    def __init__(self, step, capacity):
+        self.step = step
+        self.capacity = capacity
+        self.rows = np.zeros((min(INITIAL_ROWS, capacity), len(COLUMNS)))
+        self.count = 0
+        # [起始时间戳, 开, 高, 低, 收, 成交量, 成交额, 持仓量]，起始时间戳同时用来判断是否进入下一根K线
+        self.current = None
+
+    def open(self, start_ts, price, volume, turnover, open_interest):
+        if self.current is not None:
+            self._push(self.current)
+        self.current = [start_ts, price, price, price, price, volume, turnover, open_interest]
+
+    def _push(self, bar):
+        rows = self.rows
+        if self.count == len(rows) and len(rows) < self.capacity:
+            # 按需倍增到上限，只有活跃合约的高频周期会用满
+            rows = self.rows = np.concatenate([rows, np.zeros((min(len(rows), self.capacity - len(rows)),
+                                                                len(COLUMNS)))])
+        rows[self.count % len(rows)] = bar
+        self.count += 1
+
+    def latest(self, n):
+        '''
+        最近n根K线（含未完成的当前K线），按时间顺序
+        '''
+        # 与tick线程并发读取，先取出引用，扩容时替换的是新数组
+        rows, count, bar = self.rows, self.count, self.current
+        current = [list(bar)] if bar else []
+        n = max(0, min(n - len(current), count, len(rows)))
+        if n:
+            end = count % len(rows)
+            index = np.arange(end - n, end) % len(rows)
+            done = rows[index].tolist()
+        else:
+            done = []
+        return done + current
+
+
+class _CodeState:
+    __slots__ = ("kind", "sessions", "series", "trading_day", "volume", "turnover")
+
+    def __init__(self, kind, capacity):
+        self.kind = kind
+        self.sessions = SESSIONS[kind]
+        self.series = tuple(BarSeries(step * 1000, capacity) for step in INTERVALS.values())
+        self.trading_day = None
+        self.volume = None
+        self.turnover = None
+
+
+class BarEngine:
+    '''
+    由实时tick增量生成各周期K线：每个tick对每个周期O(1)更新当前K线。
+    成交量、成交额为累计值的差，按交易日（TradingDay）和交易时段划分K线，不使用本机时间。
+    classify(code)返回(交易所, 品种)，用于确定交易时段
+    '''
+
+    def __init__(self, classify, history=BAR_HISTORY):
+        self._classify = classify
+        self.history = history
+        self._codes = {}
+        self._clock = {}
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._codes)
+
+    def onTick(self, tick):
+        '''
+        在总线的订阅线程中调用，tick为不再变化的副本
+        '''
+        state = self._codes.get(tick.code)
+        if state is None:
+            exchange, product = self._classify(tick.code)
+            with self._lock:
+                state = self._codes[tick.code] = _CodeState(session_kind(exchange, product), self.history)
+        volume, turnover = tick.volume, tick.turnover
+        if state.volume is None:
+            # 中途启动时第一条tick之前的成交量分不出属于哪根K线，不计入
+            traded, amount = 0, 0.0
+        elif state.trading_day != tick.trading_day or volume < state.volume:
+            # 新交易日的累计量从0开始
+            traded, amount = volume, turnover
+        else:
+            traded, amount = volume - state.volume, turnover - state.turnover
+        state.trading_day, state.volume, state.turnover = tick.trading_day, volume, turnover
+        price = tick.last_price
+        if price is None or FILTER(price) is None:
+            return
+        key = (state.kind, tick.update_time)
+        place = self._clock.get(key)
+        if place is None:
+            if len(self._clock) > 100000:
+                self._clock.clear()
+            place = self._clock[key] = locate(state.sessions, session_ms(tick.update_time))
+        if place is None:
+            return
+        segment, segment_start, ms = place
+        base = self._days.get(tick.trading_day)
+        if base is None:
+            base = self._days[tick.trading_day] = day_ms(tick.trading_day)
+        open_interest = tick.open_interest
+        # 逐tick路径上直接改写当前K线，不再调用方法
+        for series in state.series:
+            start = ms - ms % series.step
+            if start < segment_start:
+                start = segment_start
+            start += base
+            bar = series.current
+            if bar is None or bar[0] != start:
+                series.open(start, price, traded, amount, open_interest)
+                continue
+            if price > bar[2]:
+                bar[2] = price
+            elif price < bar[3]:
+                bar[3] = price
+            bar[4] = price
+            bar[5] += traded
+            bar[6] += amount
+            bar[7] = open_interest
+
+    def bars(self, code, interval, n):
+        '''
+        返回某合约某周期最近n根K线的字典列表，ts为按交易日对齐的毫秒时间戳
+        '''
+        if interval not in INTERVALS:
+            raise ValueError("不支持的K线周期<%s>，可选%s" % (interval, ",".join(INTERVALS)))
+        state = self._codes.get(code)
+        if state is None:
+            return []
+        rows = state.series[INDEX[interval]].latest(n)
+        return [_toDict(row) for row in rows]
+
+    def memory(self):
+        '''
+        K线数组占用的字节数
+        '''
+        with self._lock:
+            states = list(self._codes.values())
+        return sum(series.rows.nbytes for state in states for series in state.series)
+
+
+_trading_days = {}
+
+
+def _toDict(row):
+    ts = int(row[0])
+    # 夜盘的时间戳落在交易日前一天的晚上，加6小时即回到交易日
+    day = (ts + 6 * 3600 * 1000) // 86400000
+    trading_day = _trading_days.get(day)
+    if trading_day is None:
+        trading_day = _trading_days[day] = time.strftime("%Y%m%d", time.gmtime(day * 86400))
+    seconds = ts // 1000 % 86400
+    return {"ts": ts, "trading_day": trading_day,
+            "time": "%02d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60),
+            "open": row[1], "high": row[2], "low": row[3], "close": row[4], "volume": int(row[5]),
+            "turnover": row[6], "open_interest": row[7]}
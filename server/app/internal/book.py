@@ -0,0 +1,85 @@
+import datetime
+import threading
+
+from pytz import timezone
+
+from app.internal.serializer import share
+
+
+class OrderBook:
+    '''
+    当日报单簿与成交记录：登录后查询一次作为初始状态，之后由OnRtnOrder/OnRtnTrade增量维护。
+    读取返回缓存的快照，只有数据变化后的第一次读取才重新排序。
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders = {}
+        self._trades = {}
+        self._order_snapshot = None
+        self._trade_snapshot = None
+        self.orders_seeded = False
+        self.trades_seeded = False
+        self.updated_at = None
+
+    def seedOrders(self, rows):
+        '''
+        合并查询结果，已由推送更新过的报单以推送为准
+        '''
+        with self._lock:
+            for oid, order in rows:
+                self._orders.setdefault(oid, order)
+            self.orders_seeded = True
+            self._order_snapshot = None
+            self._touch()
+
+    def seedTrades(self, rows):
+        with self._lock:
+            for tid, trade in rows:
+                self._trades.setdefault(tid, trade)
+            self.trades_seeded = True
+            self._trade_snapshot = None
+            self._touch()
+
+    def onOrder(self, oid, order):
+        with self._lock:
+            self._orders[oid] = order
+            self._order_snapshot = None
+            self._touch()
+
+    def onTrade(self, tid, trade):
+        with self._lock:
+            self._trades[tid] = trade
+            self._trade_snapshot = None
+            self._touch()
+
+    def reset(self):
+        with self._lock:
+            self._orders = {}
+            self._trades = {}
+            self._order_snapshot = None
+            self._trade_snapshot = None
+            self.orders_seeded = False
+            self.trades_seeded = False
+
+    def order(self, oid):
+        return self._orders.get(oid)
+
+    def orders(self):
+        snapshot = self._order_snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = {i: j for i, j in sorted(self._orders.items(), key=lambda x: x[1]['insert_time'] + x[0])}
+                self._order_snapshot = share(snapshot)
+        return snapshot
+
+    def trades(self):
+        snapshot = self._trade_snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = {i: j for i, j in sorted(self._trades.items(), key=lambda x: x[1]['trade_time'] + x[0])}
+                self._trade_snapshot = share(snapshot)
+        return snapshot
+
+    def _touch(self):
+        self.updated_at = datetime.datetime.now(timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from app.internal.constants import BUS_CAPACITY
+from app.internal.instruments import product
+from app.internal.metrics import BUS_DROPPED
+
+
+logger = logging.getLogger(__name__)
+
+
+class TopicFilter:
+    '''
+    按合约代码、品种、交易所过滤，None表示不限；三者同时给出时需全部满足
+    '''
+
+    def __init__(self, codes=None, products=None, exchanges=None):
+        self.codes = None if codes is None else set(codes)
+        self.products = None if products is None else set(products)
+        self.exchanges = None if exchanges is None else set(exchanges)
+
+    def match(self, code, exchange, product):
+        return (self.codes is None or code in self.codes) and \
+            (self.products is None or product in self.products) and \
+            (self.exchanges is None or exchange in self.exchanges)
+
+    def to_dict(self):
+        return {name: sorted(value) if value is not None else None
+                for name, value in (("codes", self.codes), ("products", self.products),
+                                    ("exchanges", self.exchanges))}
+
+
+class Subscriber:
+    '''
+    总线上的订阅方：put在发布线程中调用，只能把tick放进自己的缓冲区，不能阻塞。
+    snapshot为True时收到的是不再变化的Tick副本，否则是按合约原地更新的Tick记录
+    '''
+
+    snapshot = False
+
+    def __init__(self, name, topics=None):
+        self.name = name
+        self.topics = topics or TopicFilter()
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, tick, now):
+        raise NotImplementedError
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def pending(self):
+        return 0
+
+    def lag(self):
+        '''
+        最早一条未处理tick已等待的秒数
+        '''
+        return 0.0
+
+    def stats(self):
+        return {"name": self.name, "type": type(self).__name__, "topics": self.topics.to_dict(),
+                "pending": self.pending, "delivered": self.delivered, "dropped": self.dropped,
+                "lag_ms": round(self.lag() * 1000, 3)}
+
+
+class ThreadSubscriber(Subscriber):
+    '''
+    逐tick消费：有界环形缓冲区加一个专用线程依次调用handler(tick)。
+    缓冲区满时丢弃最早的tick并计数，处理慢只影响自己
+    '''
+
+    snapshot = True
+
+    def __init__(self, name, handler, topics=None, capacity=BUS_CAPACITY):
+        super().__init__(name, topics)
+        self.handler = handler
+        self.capacity = capacity
+        self.errors = 0
+        self._ring = deque()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bus-%s" % name, daemon=True)
+        self._thread.start()
+
+    def put(self, tick, now):
+        ring = self._ring
+        if len(ring) >= self.capacity:
+            try:
+                ring.popleft()
+                self.dropped += 1
+                BUS_DROPPED.inc((self.name,))
+            except IndexError:
+                pass
+        ring.append((now, tick))
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def close(self, timeout=5):
+        '''
+        处理完缓冲区中剩余的tick后退出
+        '''
+        self.closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    @property
+    def pending(self):
+        return len(self._ring)
+
+    def lag(self):
+        try:
+            return time.monotonic() - self._ring[0][0]
+        except IndexError:
+            return 0.0
+
+    def _run(self):
+        ring = self._ring
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while ring:
+                try:
+                    _, tick = ring.popleft()
+                except IndexError:
+                    break
+                try:
+                    self.handler(tick)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error("订阅方<%s>处理tick出错: %r", self.name, e)
+                self.delivered += 1
+            if self.closed:
+                break
+
+    def stats(self):
+        return dict(super().stats(), errors=self.errors)
+
+
+class TickBus:
+    '''
+    行情分发总线：SPI回调线程发布tick，按各订阅方的过滤条件放入它们各自的缓冲区，
+    由订阅方自己的线程或事件循环消费。每个合约匹配到的订阅方缓存在路由表中，订阅变化时重建。
+    classify(code)返回(交易所, 品种)，用于按交易所、品种过滤
+    '''
+
+    def __init__(self, classify=None):
+        self._classify = classify or (lambda code: ("", product(code)))
+        self._lock = threading.Lock()
+        self._subscribers = ()
+        self._routes = {}
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    def attach(self, subscriber):
+        with self._lock:
+            self._subscribers += (subscriber,)
+            self._routes = {}
+        return subscriber
+
+    def detach(self, subscriber):
+        with self._lock:
+            self._subscribers = tuple(i for i in self._subscribers if i is not subscriber)
+            self._routes = {}
+
+    def subscribe(self, name, handler, codes=None, products=None, exchanges=None, capacity=BUS_CAPACITY):
+        '''
+        以专用线程逐tick调用handler，返回ThreadSubscriber，用unsubscribe取消
+        '''
+        return self.attach(ThreadSubscriber(name, handler, TopicFilter(codes, products, exchanges), capacity))
+
+    def unsubscribe(self, subscriber):
+        self.detach(subscriber)
+        subscriber.close()
+
+    def invalidate(self):
+        '''
+        订阅方的过滤条件或合约表变化后调用，路由表在下一个tick到达时按合约重建
+        '''
+        self._routes = {}
+
+    def publish(self, tick):
+        routes = self._routes
+        targets = routes.get(tick.code)
+        if targets is None:
+            targets = self._route(tick.code, routes)
+        if not targets:
+            return
+        now = time.monotonic()
+        copy = None
+        for subscriber in targets:
+            if subscriber.snapshot:
+                # 同一个副本由所有逐tick订阅方共用
+                if copy is None:
+                    copy = tick.copy()
+                subscriber.put(copy, now)
+            else:
+                subscriber.put(tick, now)
+
+    def _route(self, code, routes):
+        exchange, product = self._classify(code)
+        targets = tuple(i for i in self._subscribers if i.topics.match(code, exchange, product))
+        routes[code] = targets
+        return targets
+
+    def stats(self):
+        return [subscriber.stats() for subscriber in self._subscribers]
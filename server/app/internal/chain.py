@@ -0,0 +1,121 @@
+import numpy as np
+
+
+class ChainSlice:
+    '''
+    同一标的、同一到期日的期权：按行权价升序排列，calls/puts与strikes一一对应，缺少时为None
+    '''
+
+    __slots__ = ("underlying", "expire_date", "strikes", "calls", "puts")
+
+    def __init__(self, underlying, expire_date, strikes, calls, puts):
+        self.underlying = underlying
+        self.expire_date = expire_date
+        self.strikes = np.array(strikes, dtype=np.float64)
+        self.calls = calls
+        self.puts = puts
+
+    def atmIndex(self, price):
+        '''
+        距离价格最近的行权价位置，二分查找
+        '''
+        i = int(np.searchsorted(self.strikes, price))
+        if i == len(self.strikes):
+            return i - 1
+        if i > 0 and price - self.strikes[i - 1] <= self.strikes[i] - price:
+            return i - 1
+        return i
+
+    def rows(self, start=0, stop=None):
+        return [{"strike": strike, "call": call, "put": put} for strike, call, put in
+                zip(self.strikes[start: stop].tolist(), self.calls[start: stop], self.puts[start: stop])]
+
+
+class OptionChain:
+    '''
+    期权链索引：标的 -> 到期日 -> 按行权价排序的认购/认沽对，以及期权到所属链的反查
+    '''
+
+    def __init__(self, table):
+        underlying = table.column("underlying")
+        strike = table.column("strike_price")
+        rows = np.flatnonzero((underlying != "") & ~np.isnan(strike))
+        rows = rows[np.lexsort((strike[rows], table.column("expire_date")[rows], underlying[rows]))]
+        self._chains = {}
+        self._reverse = {}
+        groups = {}
+        for code, expire_date, strike_price, option_type, symbol in zip(
+                underlying[rows].tolist(), table.column("expire_date")[rows].tolist(), strike[rows].tolist(),
+                table.column("option_type")[rows].tolist(), table.column("symbol")[rows].tolist()):
+            levels = groups.get((code, expire_date))
+            if levels is None:
+                levels = groups[(code, expire_date)] = {}
+            level = levels.get(strike_price)
+            if level is None:
+                level = levels[strike_price] = [None, None]
+            level[0 if option_type == "call" else 1] = symbol
+        for (code, expire_date), levels in groups.items():
+            chain = ChainSlice(code, expire_date, list(levels), [v[0] for v in levels.values()],
+                               [v[1] for v in levels.values()])
+            self._chains.setdefault(code, {})[expire_date] = chain
+            for position, (call, put) in enumerate(zip(chain.calls, chain.puts)):
+                for symbol in (call, put):
+                    if symbol:
+                        self._reverse[symbol] = (chain, position)
+
+    def __contains__(self, underlying):
+        return underlying in self._chains
+
+    def underlyings(self):
+        return sorted(self._chains)
+
+    def expiries(self, underlying):
+        return sorted(self._chains.get(underlying, {}))
+
+    def slice(self, underlying, expire_date=None):
+        '''
+        标的的期权链，未指定到期日时取最近的一个
+        '''
+        chains = self._chains.get(underlying)
+        if not chains:
+            raise ValueError("标的<%s>没有期权" % underlying)
+        if expire_date is None:
+            expire_date = min(chains)
+        if expire_date not in chains:
+            raise ValueError("标的<%s>没有<%s>到期的期权" % (underlying, expire_date))
+        return chains[expire_date]
+
+    def chain(self, underlying, expire_date=None):
+        '''
+        {到期日: [{"strike", "call", "put"}]}
+        '''
+        expiries = [expire_date] if expire_date else self.expiries(underlying)
+        return {expiry: self.slice(underlying, expiry).rows() for expiry in expiries}
+
+    def near(self, underlying, price, n, expire_date=None):
+        '''
+        平值附近上下各n档行权价
+        '''
+        chain = self.slice(underlying, expire_date)
+        atm = chain.atmIndex(price)
+        return {"underlying": underlying, "expire_date": chain.expire_date, "price": price,
+                "atm_strike": float(chain.strikes[atm]), "strikes": chain.rows(max(0, atm - n), atm + n + 1)}
+
+    def lookup(self, symbol):
+        '''
+        期权所属的标的、到期日、行权价和类型；非期权返回None
+        '''
+        found = self._reverse.get(symbol)
+        if found is None:
+            return None
+        chain, position = found
+        return {"symbol": symbol, "underlying": chain.underlying, "expire_date": chain.expire_date,
+                "strike_price": float(chain.strikes[position]),
+                "option_type": "call" if chain.calls[position] == symbol else "put"}
+
+    def atm(self, symbol, price):
+        '''
+        期权所属链在标的价格下的平值行权价
+        '''
+        chain, _ = self._reverse[symbol]
+        return float(chain.strikes[chain.atmIndex(price)])
@@ -1,5 +1,5 @@
+import asyncio
 import datetime
-import time
 from copy import deepcopy
 import logging
 
@@ -9,14 +9,30 @@ from pytz import timezone
 
 from app.internal.quote import QuoteImpl
 from app.internal.trade import TraderImpl
+from app.internal.simulator import SimTraderImpl, SimQuoteImpl
+from app.internal.bus import TickBus
+from app.internal.stream import TickStream
+from app.internal.store import QuoteStore
+from app.internal.recorder import TickRecorder
+from app.internal.bars import BarEngine
+from app.internal.subscriptions import SubscriptionManager
+from app.internal.replay import TickReplay, ReplayTarget
+from app.internal.payload import Payload, PayloadCache
+from app.internal.instruments import product
+from app.internal.metrics import REGISTRY, TICKS, SUBSCRIBED_CODES, QUERY_QUEUE_DEPTH, QUERY_IN_FLIGHT, \
+    PENDING_ORDERS, BUS_LAG
+from app.internal.constants import QUERY_RATE, QUERY_BURST, RECORD_TICKS, ORDER_RATE, ORDER_BURST, BATCH_MAX_ORDERS, \
+    SIMULATOR, BAR_HISTORY, POINTS_IDLE
 
 
 logger = logging.getLogger(__name__)
-subscribe_logger = logging.getLogger('subscribe')
 
 
 class Client:
-    def __init__(self, md_front, td_front, broker_id, app_id, auth_code, user_id, password):
+    def __init__(self, md_front, td_front, broker_id, app_id, auth_code, user_id, password,
+                 query_rate=QUERY_RATE, query_burst=QUERY_BURST, record_ticks=RECORD_TICKS,
+                 order_rate=ORDER_RATE, order_burst=ORDER_BURST, simulator=SIMULATOR, bar_history=BAR_HISTORY,
+                 market=None, shared=None):
         self._md = None
         self._td = None
         self.md_front = md_front
@@ -26,67 +42,283 @@ class Client:
         self.auth_code = auth_code
         self.user_id = user_id
         self.password = password
+        self.query_rate = query_rate
+        self.query_burst = query_burst
+        self.order_rate = order_rate
+        self.order_burst = order_burst
+        # False为连接account.yaml中的前置；True或参数字典为连接本地模拟前置
+        self.simulator = simulator
+        # 多账户时由第一个账户（market）持有行情会话、合约表、行情存储和总线，其他账户只有自己的交易会话
+        self._market = market or self
+        # 多进程部署时为owner进程的SharedState，行情存储建在共享内存中供worker读取
+        self._shared = shared
+        # 账户 -> 交易会话，行情到达时逐个更新持仓盈亏；只在行情账户上维护
+        self._trader_map = {}
+        self._traders = ()
+        self._exchanges = {}
+        if market is not None:
+            self.quotes = market.quotes
+            self._subscriptions = market._subscriptions
+            self.bus = market.bus
+            self._stream = market._stream
+            self._points = market._points
+            self._store = None
+            self._recorder = None
+            self._bars = market._bars
+            self._payloads = market._payloads
+            return
         self.quotes = {}
-        self.subscribe_codes = []
+        # 合约 -> 释放查询价格所持订阅的定时器
+        self._points = {}
+        # 各消费方（HTTP订阅、推送连接、持仓、查询价格）持有的合约，合并成批量订阅，重连后自动重新订阅
+        self._subscriptions = SubscriptionManager()
+        # 落盘、推送等消费方挂在总线上，各自的缓冲区和线程互不影响，也不占用行情回调线程
+        self.bus = TickBus(self._classify)
+        self._stream = TickStream(self.bus)
+        self._store = None
+        self._recorder = TickRecorder() if record_ticks else None
+        if self._recorder:
+            self.bus.subscribe("recorder", self._recorder.record)
+        self._bars = BarEngine(self._classify, bar_history)
+        self.bus.subscribe("bars", self._bars.onTick)
+        self._payloads = PayloadCache()
+
+    @property
+    def ownsMarket(self):
+        return self._market is self
 
     def login(self):
         '''
-        登录行情、交易
+        登录行情、交易；共用行情的账户只登录交易会话，需在行情账户之后登录
         '''
         self._td = None
-        self._td = TraderImpl(self.td_front, self.broker_id, self.app_id, self.auth_code, self.user_id, self.password)
+        args = (self.td_front, self.broker_id, self.app_id, self.auth_code, self.user_id, self.password,
+                self.query_rate, self.query_burst, self.order_rate, self.order_burst)
+        options = dict(self.simulator) if isinstance(self.simulator, dict) else None
+        if not self.ownsMarket:
+            market = self._market
+            if not market._td:
+                raise RuntimeError("行情账户<%s>未登陆！" % market.user_id)
+            instruments = market._td._instruments
+            self._td = SimTraderImpl(*args, instruments=instruments, options=options) if self.simulator else \
+                TraderImpl(*args, instruments=instruments)
+            self._md = market._md
+            market._setTrader(self.user_id, self._td)
+            return
+        if self.simulator:
+            self._td = SimTraderImpl(*args, options=options)
+        else:
+            self._td = TraderImpl(*args)
+        self._setTrader(self.user_id, self._td)
+        self._store = self._shared.quoteStore(self._td._instruments) if self._shared else \
+            QuoteStore(self._td._instruments)
+        self._payloads.invalidate()
+        self._exchanges = {}
+        self.bus.invalidate()
         self._md = None
-        self._md = QuoteImpl(self.md_front)
-        self.subscribe_codes = []
+        self._md = SimQuoteImpl(self.md_front, options) if self.simulator else QuoteImpl(self.md_front)
+        self.setReceiver()
+        self._subscriptions.attach(self._md)
+        if self._recorder:
+            self._recorder.start()
 
     def logout(self):
         '''
         登出
         '''
+        # 新的交易会话有新的持仓引擎，旧引擎持有的订阅在这里释放
+        self._subscriptions.release(self._td._positions)
+        if not self.ownsMarket:
+            self._market._setTrader(self.user_id, None)
+            self._td.shutdown()
+            return
         self._md.shutdown()
         self._td.shutdown()
-        self.subscribe_codes = []
+        self._setTrader(self.user_id, None)
+        self._releasePoints()
+        self._subscriptions.detach()
+        if self._recorder:
+            self._recorder.stop()
 
-    def parse_hq(self, x):
-        subscribe_logger.info(x)
-        code = x.pop('code')
+    def _setTrader(self, user_id, td):
+        '''
+        登记或移除账户的交易会话；行情回调线程只读取不可变的元组
+        '''
+        if td is None:
+            self._trader_map.pop(user_id, None)
+        else:
+            self._trader_map[user_id] = td
+        self._traders = tuple(self._trader_map.values())
+
+    def parse_hq(self, tick):
+        '''
+        tick为QuoteImpl中按合约原地更新的Tick记录，需要字典时调用tick.to_dict()。
+        行情落盘由总线上的TickRecorder负责，这里不再逐条写日志
+        '''
+        self._dispatch(tick)
+        self._subscriptions.onTick(tick.code)
+        TICKS.inc((self._exchangeOf(tick.code),))
+
+    def _classify(self, code):
+        '''
+        总线按交易所、品种过滤时使用
+        '''
+        return self._exchangeOf(code), product(code)
+
+    def _exchangeOf(self, code):
+        exchange = self._exchanges.get(code)
+        if exchange is None:
+            instrument = self._td._instruments.get(code) if self._td else None
+            exchange = self._exchanges[code] = instrument["exchange"] if instrument else ""
+        return exchange
+
+    def _dispatch(self, tick):
+        '''
+        同步更新最新行情、行情快照和持仓盈亏，再发布到总线；只处理实时行情
+        '''
+        code = tick.code
         if code:
-            if code not in self.subscribe_codes:
-                self.subscribe_codes.append(code)
-            self.quotes.update({
-                code: x
-            })
+            self.quotes[code] = tick
+            if self._store:
+                self._store.write(tick)
+            for td in self._traders:
+                td.onTick(code, tick.price)
+            self.bus.publish(tick)
 
+    def replay(self, trading_days, codes=None, speed=1.0):
+        '''
+        回放已记录的行情，返回吞吐报告。回放写入独立的ReplayTarget（行情、行情存储、总线），
+        不会改动实时行情、持仓盈亏和报单取价。同步执行，耗时较长，需在线程池中调用
+        '''
+        market = self._market
+        target = ReplayTarget(market._classify, market._td._instruments if market._td else None)
+        try:
+            report = TickReplay(trading_days, codes, speed).run({"ReplayTarget.onTick": target.onTick})
+        finally:
+            consumers = target.close()
+        report["codes"] = len(target.quotes)
+        report["consumers"] = consumers
+        return report
 
     def setReceiver(self):
         '''
-        tick行情处理函数
+        tick行情处理函数，登录时设置；其他消费方通过self.bus订阅
         '''
         return self._md.setReceiver(self.parse_hq)
 
-    def subscribe(self, codes):
+    async def subscribe(self, codes, consumer="api"):
         '''
-        订阅合约代码
+        订阅合约代码：consumer持有这些合约，与同一时间窗内其他消费方的订阅合并成一次请求
         '''
         if not self._td:
             return '账户未登陆！'
         for code in codes:
             if code not in self._td._instruments:
                 raise ValueError("合约<%s>不存在" % code)
-        self._md.subscribe(codes)
+        await self._subscriptions.acquire(consumer, codes)
+
+    async def openStream(self, codes):
+        '''
+        打开行情推送，未订阅的合约先向CTP订阅；已有行情的合约立即推送一次最新tick
+        '''
+        subscriber = self._stream.open()
+        try:
+            await self.updateStream(subscriber, codes)
+        except Exception:
+            self._stream.close(subscriber)
+            raise
+        return subscriber
+
+    async def updateStream(self, subscriber, subscribe=(), unsubscribe=()):
+        '''
+        调整推送连接订阅的合约
+        '''
+        if not self._td:
+            raise RuntimeError('账户未登陆！')
+        if subscribe:
+            await self.subscribe(subscribe, subscriber)
+        self._stream.add(subscriber, subscribe)
+        self._stream.remove(subscriber, unsubscribe)
+        self._subscriptions.release(subscriber, unsubscribe)
+        for code in subscribe:
+            if self.quotes.get(code):
+                subscriber.put(self.quotes[code])
 
-    def subscribe_quote(self, codes):
+    def closeStream(self, subscriber):
+        subscriber.close()
+        self._stream.close(subscriber)
+        self._subscriptions.release(subscriber)
+
+    async def subscribe_quote(self, codes):
         '''
         订阅合约代码
         '''
         if not self._td:
             return '账户未登陆！'
         for code in codes:
-            if code in self.subscribe_codes:
-                self.subscribe_codes.remove(code)
             if code not in self._td._instruments:
                 raise ValueError("合约<%s>不存在" % code)
-        self._md.subscribe_quote(codes)
+        await self._market._md.subscribe_quote(codes)
+
+    def snapshot(self, fields, codes=None, exchange=None, product=None):
+        '''
+        批量行情快照，可按合约、交易所、品种过滤
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        return self._market._store.snapshot(fields, codes=codes, exchange=exchange, product=product)
+
+    def spreads(self, codes=None, exchange=None, product=None):
+        '''
+        已订阅合约的一档买卖价差
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        return self._market._store.spreads(codes=codes, exchange=exchange, product=product)
+
+    def getBars(self, codes, interval="1m", n=100):
+        '''
+        已订阅合约最近n根K线（含未完成的当前K线），由实时tick增量生成
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        return {code: self._bars.bars(code, interval, n) for code in codes}
+
+    def instrumentsStale(self):
+        '''
+        登录时使用的是前一天缓存的合约表
+        '''
+        return bool(self._td) and self._td.instruments_stale
+
+    async def refreshInstruments(self):
+        '''
+        增量刷新合约表，返回新增、删除、变化的合约代码
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        diff = await self._td.refreshInstruments()
+        self._payloads.invalidate()
+        return diff
+
+    def instrumentsPayload(self, kind, key=None):
+        '''
+        合约列表的预序列化响应，kind为future、option或symbols，key为交易所或标的期货；
+        合约表刷新前重复请求直接返回缓存的字节
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        if key is not None and key not in (self._td.instruments_future if kind == "future" else
+                                           self._td.instruments_option):
+            # 不存在的交易所或标的不进入缓存，避免任意参数撑大缓存
+            return Payload(self._instrumentsData(kind, key))
+        return self._payloads.get((kind, key), lambda: self._instrumentsData(kind, key))
+
+    def _instrumentsData(self, kind, key):
+        if kind == "future":
+            return self.get_instruments_future(key)
+        if kind == "option":
+            return self.get_instruments_option(key)
+        return [i['symbol'] for instruments in self.get_instruments_future().values() for i in instruments]
 
     def get_instruments_option(self, future=None):
         '''
@@ -98,6 +330,49 @@ class Client:
             return self._td.instruments_option
         return self._td.instruments_option.get(future, None)
 
+    def getOptionChain(self, underlying, expire_date=None):
+        '''
+        期权链：{到期日: [{"strike", "call", "put"}]}，按行权价升序
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        return self._td.option_chain.chain(underlying, expire_date)
+
+    async def getOptionStrikes(self, underlying, n, expire_date=None, price=None):
+        '''
+        标的最新价附近上下各n档行权价；未指定price时取标的行情
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        chain = self._td.option_chain
+        chain.slice(underlying, expire_date)
+        if price is None:
+            price = await self._lastPrice(underlying)
+        return chain.near(underlying, price, n, expire_date)
+
+    async def getOptionInfo(self, code):
+        '''
+        期权所属标的、到期日、行权价，以及按标的最新价计算的平值行权价
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        info = self._td.option_chain.lookup(code)
+        if info is None:
+            raise ValueError("合约<%s>不是期权" % code)
+        price = await self._lastPrice(info["underlying"])
+        info["underlying_price"] = price
+        info["atm_strike"] = self._td.option_chain.atm(code, price)
+        return info
+
+    async def _lastPrice(self, code):
+        tick = self.quotes.get(code)
+        if tick is not None and tick.price is not None:
+            return tick.price
+        data = await self.query_points(code)
+        if not data or data.get("price") is None:
+            raise RuntimeError("获取<%s>行情超时" % code)
+        return data["price"]
+
     def get_instruments_future(self, exchange=None):
         '''
         获取期货合约列表，可指定对应的交易所
@@ -106,13 +381,19 @@ class Client:
             return '账户未登陆！'
         if exchange is None:
             return self._td.instruments_future
-        return self._td.instruments_future[exchange]
+        return self._td.instruments_future.get(exchange, [])
+
+    async def unsubscribe(self, codes, consumer="api"):
+        '''
+        取消consumer对这些合约的订阅，没有其他消费方持有的合约才向CTP取消订阅
+        '''
+        self._subscriptions.release(consumer, codes)
 
-    def unsubscribe(self, codes):
+    def subscriptions(self, codes=None):
         '''
-        取消订阅
+        各合约的持有者、订阅应答状态、请求/应答/首个tick的时间，以及批量订阅的统计
         '''
-        self._md.unsubscribe(codes)
+        return {"stats": self._subscriptions.stats(), "codes": self._subscriptions.get(codes)}
 
     def getInstrument(self, code):
         '''
@@ -128,127 +409,258 @@ class Client:
             logger.error(e)
             return {}
 
-    def getAccount(self):
+    async def getAccount(self):
         '''
         获取账号资金情况
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.getAccount()
+        return await self._td.getAccount()
 
-    def getQuote(self, code):
+    async def getQuote(self, code):
         '''
         获取账号资金情况
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.getQuote(code)
+        return await self._td.getQuote(code)
+
+    async def reconcilePositions(self):
+        '''
+        持仓对账，返回持仓引擎与CTP查询结果的差异
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        return await self._td.reconcilePositions()
+
+    async def warmUp(self):
+        '''
+        登录后查询持仓、资金、报单和成交作为初始状态，并订阅持仓合约
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        await self._td.warmUp()
+        self._watchPositions()
+
+    def queryStats(self):
+        '''
+        查询调度器的队列深度与排队时间
+        '''
+        if not self._td:
+            return '账户未登陆！'
+        return self._td.queryStats()
+
+    def metrics(self):
+        '''
+        刷新仪表值后以Prometheus文本格式导出全部指标；未登录时只有计数和分布
+        '''
+        SUBSCRIBED_CODES.set(len(self._subscriptions.codes()))
+        if self._td:
+            stats = self._td.queryStats()
+            QUERY_QUEUE_DEPTH.set(stats["queue_depth"])
+            QUERY_IN_FLIGHT.set(stats["in_flight"])
+            PENDING_ORDERS.set(len(self._td._tracker))
+        lags = {}
+        for subscriber in self.bus.subscribers:
+            lags[subscriber.name] = max(lags.get(subscriber.name, 0.0), subscriber.lag())
+        for name, lag in lags.items():
+            BUS_LAG.set(lag, (name,))
+        return REGISTRY.render()
 
-    def getOrders(self):
+    def busStats(self):
+        '''
+        总线上各订阅方的过滤条件、待处理数、已处理数、丢弃数和延迟
+        '''
+        return {"subscribers": self.bus.stats(), "stream": self._stream.stats()}
+
+    async def getOrders(self):
         '''
         获取当天订单
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.getOrders()
+        return await self._td.getOrders()
 
-    def getTrades(self):
+    async def getTrades(self):
         '''
         获取当天订单
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.getTrades()
+        return await self._td.getTrades()
 
-    def getPositions(self):
+    def sharedState(self):
+        '''
+        已初始化的持仓、资金、报单、成交快照，由owner进程发布到共享内存
+        '''
+        if not self._td:
+            return {}
+        return self._td.sharedState()
+
+    async def getPositions(self):
         '''
         获取持仓
         '''
         if not self._td:
             return '账户未登陆！'
-        data = self._td.getPositions()
-        if data and data[0]:
-            for code in set(i['code'] for i in data[0]):
-                if code not in self.subscribe_codes:
-                    self.subscribe([code])
-            self.setReceiver()
+        data = await self._td.getPositions()
+        self._watchPositions()
         return data
 
+    def _watchPositions(self):
+        '''
+        持仓合约随开仓、平仓增减时调整持仓引擎持有的行情订阅，不等待订阅应答
+        '''
+        engine = self._td._positions
+        if engine.listener is None:
+            loop = asyncio.get_running_loop()
+            engine.listener = lambda: loop.call_soon_threadsafe(self._syncPositions, engine)
+            self._syncPositions(engine)
+
+    def _syncPositions(self, engine):
+        codes = engine.codes() if self._td and self._td._positions is engine else set()
+        held = self._subscriptions.held(engine)
+        # 平仓的合约释放，没有其他持有者时取消订阅
+        self._subscriptions.release(engine, held - codes)
+        if codes - held:
+            task = asyncio.ensure_future(self._subscriptions.acquire(engine, codes - held))
+            task.add_done_callback(_logFailure)
+
 
-    def orderMarket(self, code, direction, volume, target_price_type, offset_flag=None):
+    async def orderMarket(self, code, direction, volume, target_price_type, offset_flag=None):
         '''
         市价下单
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.orderMarket(code, direction, volume, target_price_type, offset_flag)
+        return await self._td.orderMarket(code, direction, volume, target_price_type, offset_flag)
 
-    def orderFAK(self, code, direction, volume, price, min_volume):
+    async def orderFAK(self, code, direction, volume, price, min_volume):
         '''
         FAK下单
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.orderFAK(code, direction, volume, price, min_volume)
+        return await self._td.orderFAK(code, direction, volume, price, min_volume)
 
-    def orderFOK(self, code, direction, volume, price):
+    async def orderFOK(self, code, direction, volume, price):
         '''
         FOK下单
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.orderFOK(code, direction, volume, price)
+        return await self._td.orderFOK(code, direction, volume, price)
 
-    def orderLimit(self, code, direction, volume, price, offset_flag=None):
+    async def orderLimit(self, code, direction, volume, price, offset_flag=None):
         '''
         限价单
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.orderLimit(code, direction, volume, price, offset_flag)
+        return await self._td.orderLimit(code, direction, volume, price, offset_flag)
 
-    def deleteOrder(self, order_id):
+    async def deleteOrder(self, order_id):
         '''
         撤销订单
         '''
         if not self._td:
             return '账户未登陆！'
-        return self._td.deleteOrder(order_id)
+        return await self._td.deleteOrder(order_id)
 
 
-    def query_points(self, code):
+    def checkOrders(self, orders):
+        '''
+        批量报单的整体校验，涨跌停板取自已订阅合约的最新tick；返回(规范化后的报单, 各项错误)
+        '''
+        if not self._td:
+            raise RuntimeError('账户未登陆！')
+        if len(orders) > BATCH_MAX_ORDERS:
+            raise ValueError("单次最多提交%d笔报单" % BATCH_MAX_ORDERS)
+        limits = {}
+        for order in orders:
+            tick = self.quotes.get(order.get("code")) if isinstance(order, dict) else None
+            if tick:
+                limits[tick.code] = (tick.lower_limit_price, tick.upper_limit_price)
+        return self._td.checkOrders(orders, limits)
+
+    def orderBatch(self, orders):
+        '''
+        提交checkOrders返回的报单，异步迭代得到每项结果
+        '''
+        return self._td.orderBatch(orders)
+
+    async def cancelTargets(self, order_ids=None, code=None):
+        '''
+        批量撤单的订单号：指定order_ids时校验后原样返回，否则为报单簿中code（None为全部合约）的未完成报单。
+        返回(订单号列表, 各项错误)
+        '''
+        if not self._td:
+            raise RuntimeError('账户未登陆！')
+        if order_ids is None:
+            return await self._td.activeOrders(code), []
+        if len(order_ids) > BATCH_MAX_ORDERS:
+            raise ValueError("单次最多撤销%d笔报单" % BATCH_MAX_ORDERS)
+        return order_ids, self._td.checkOrderIds(order_ids)
+
+    def cancelBatch(self, order_ids):
+        return self._td.cancelBatch(order_ids)
+
+    async def query_points(self, code):
         # 查询合约点数的方法
+        code = code.split(',')[0]
         logger.debug(f"query points for {code}")
         temp = self.quotes.get(code)
-        if temp and code in self.subscribe_codes:
+        if temp and self._subscriptions.isSubscribed(code):
+            temp = temp.to_dict()
             # 非交易时间且有上次价格，就用已有的价格；目前没有准确判断是否是交易时间的方法，只能推断
             if temp.get('trade_time', "").split(" ")[-1] in ["11:30:00", "15:00:00", "02:30:00", "06:00:00"]:
                 logger.debug(f"get points for {code} done with {temp} in non-trade time")
                 return temp
-        self.quotes[code] = None
         data = None
-        code = code.split(',')[0]
-        if code not in self.subscribe_codes:
-            self.subscribe([code])
-            self.setReceiver()
-        start = time.time()
-        # 超时5秒
-        try_subscribe = False
-        while time.time() - start < 5:
-            if self.quotes.get(code):
-                data = deepcopy(self.quotes[code])
-                break
-            if time.time() - start > 2 and not try_subscribe:
-                # 尝试重新订阅
-                self.unsubscribe([code])
-                self.subscribe([code])
-                self.setReceiver()
-                try_subscribe = True
-            time.sleep(0.1)
+        # 等待推送的下一个tick；self.quotes由所有账户、推送和持仓共用，不能清空其中的最新行情
+        subscriber = self._stream.open([code])
+        self._lingerPoints(code, None)
+        try:
+            await self.subscribe([code], "points")
+            batch = await self._waitTick(subscriber, 2)
+            if not batch:
+                # 重新发送订阅请求，不影响其他消费方对该合约的订阅
+                await self._subscriptions.refresh([code])
+                batch = await self._waitTick(subscriber, 3)
+            if batch:
+                data = deepcopy(batch[code].to_dict())
+        finally:
+            self._stream.close(subscriber)
+            self._lingerPoints(code)
         logger.debug(f"get points for {code} done with {data}")
         return data
 
-    def get_custom_price(self, code, price_type, plus):
+    def _lingerPoints(self, code, idle=POINTS_IDLE):
+        '''
+        查询结束后保留"points"对合约的订阅，空闲idle秒后释放，连续查询同一合约不反复订阅、取消订阅；
+        idle为None时只取消待执行的释放
+        '''
+        timer = self._points.pop(code, None)
+        if timer is not None:
+            timer.cancel()
+        if idle is not None:
+            self._points[code] = asyncio.get_running_loop().call_later(idle, self._releasePoints, code)
+
+    def _releasePoints(self, code=None):
+        codes = [code] if code else list(self._points)
+        for code in codes:
+            timer = self._points.pop(code, None)
+            if timer is not None:
+                timer.cancel()
+        self._subscriptions.release("points", codes)
+
+    async def _waitTick(self, subscriber, timeout):
+        try:
+            return await asyncio.wait_for(subscriber.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def get_custom_price(self, code, price_type, plus):
         try:
             instruments = self.getInstrument(code)
             plus = int(plus)
@@ -256,9 +668,9 @@ class Client:
                 plus *= -1
             price_tick = instruments.get("price_tick", 0.02)
 
-            data = self.query_points(code)
+            data = await self.query_points(code)
             if not data:
-                data = self.query_points(code)
+                data = await self.query_points(code)
             if not data:
                 return 0, "can not get price data"
             if not data[price_type][0]:
@@ -271,3 +683,6 @@ class Client:
             return 0, e
 
 
+def _logFailure(task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"subscribe positions error: {task.exception()}")
@@ -1,3 +1,28 @@
 MAX_TIMEOUT = 10
 DATA_DIR = "ctp_client_data/"
-FILTER = lambda x: None if x > 1.797e+308 else x
\ No newline at end of file
+FILTER = lambda x: None if x > 1.797e+308 else x
+FIRST_REQUEST_ID = 100
+QUERY_RATE = 1
+QUERY_BURST = 1
+RECONCILE_INTERVAL = 300
+STREAM_MAX_CODES = 2000
+RECORD_TICKS = False
+INSTRUMENT_TIMEOUT = 60
+ORDER_RATE = 10
+ORDER_BURST = 10
+BATCH_MAX_ORDERS = 200
+SIMULATOR = False
+LOOP_LAG_INTERVAL = 0.5
+ASYNC_LOGGING = True
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+TICK_LOG_RATE = 1
+BUS_CAPACITY = 100000
+BAR_HISTORY = 240
+SUBSCRIBE_WINDOW = 0.005
+POINTS_IDLE = 300
+WORKERS = 4
+OWNER_SOCKET = "ctp_owner.sock"
+SHARED_BLOB_SIZE = 8 * 1024 * 1024
+SHARED_PUBLISH_INTERVAL = 0.2
+SEQLOCK_RETRIES = 1000
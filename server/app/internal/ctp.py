@@ -1,5 +1,8 @@
 from app.config import account
 from app.internal.client import Client
+from app.internal.sessions import SessionRegistry
+from app.internal.shared import SharedState
+from app.internal.constants import QUERY_RATE, QUERY_BURST, RECORD_TICKS, ORDER_RATE, ORDER_BURST, SIMULATOR, BAR_HISTORY
 
 
 user_id = account.investor_id
@@ -9,5 +12,28 @@ td_front = account.trader_server
 md_front = account.md_server
 app_id = account.app_id
 auth_code = account.auth_code
+query_rate = account.get("query_rate", QUERY_RATE)
+query_burst = account.get("query_burst", QUERY_BURST)
+record_ticks = account.get("record_ticks", RECORD_TICKS)
+order_rate = account.get("order_rate", ORDER_RATE)
+order_burst = account.get("order_burst", ORDER_BURST)
+simulator = account.get("simulator", SIMULATOR)
+bar_history = account.get("bar_history", BAR_HISTORY)
+# 由app/ctp_workers.py启动时设置：本进程为owner，行情和账户快照发布到以此为前缀的共享内存
+shared_prefix = account.get("shared_prefix", None)
+owner_socket = account.get("owner_socket", None)
 
-ctp_client = Client(md_front, td_front, broker_id, app_id, auth_code, user_id, password)
\ No newline at end of file
+sessions = SessionRegistry()
+shared = SharedState(shared_prefix, sessions) if shared_prefix else None
+ctp_client = Client(md_front, td_front, broker_id, app_id, auth_code, user_id, password, query_rate, query_burst,
+                    record_ticks, order_rate, order_burst, simulator, bar_history, shared=shared)
+
+# 上面的账户持有行情会话；accounts中的其他账户共用它的行情和合约表，只建立各自的交易会话，
+# 未填写的项沿用上面的配置，流控按账户各自计算
+sessions.add(ctp_client)
+for item in account.get("accounts", None) or []:
+    sessions.add(Client(md_front, item.get("trader_server", td_front), item.get("broker_id", broker_id),
+                        item.get("app_id", app_id), item.get("auth_code", auth_code), item["investor_id"],
+                        item["password"], item.get("query_rate", query_rate), item.get("query_burst", query_burst),
+                        False, item.get("order_rate", order_rate), item.get("order_burst", order_burst), simulator,
+                        bar_history, market=ctp_client))
\ No newline at end of file
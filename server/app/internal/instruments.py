@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from collections.abc import Mapping
+
+import numpy as np
+
+from app.internal.constants import DATA_DIR
+
+
+logger = logging.getLogger(__name__)
+
+TABLE_PATH = DATA_DIR + "instruments.npy"
+META_PATH = DATA_DIR + "instruments.json"
+VERSION = 1
+_PRODUCT = re.compile(r"[A-Za-z]+")
+_OPTION = re.compile(r"([A-Za-z]+\d+)-?[CP]-?\d")
+
+# 合约字段按原字典的键顺序排列，symbol与underlying为预先建立的索引与分类
+FIELDS = (("name", "U40"), ("exchange", "U8"), ("multiple", "i8"), ("price_tick", "f8"), ("expire_date", "U10"),
+          ("long_margin_ratio", "f8"), ("short_margin_ratio", "f8"), ("option_type", "U4"),
+          ("strike_price", "f8"), ("is_trading", "?"))
+DTYPE = np.dtype([("symbol", "U40")] + list(FIELDS) + [("underlying", "U40"), ("product", "U8")])
+_NAMES = tuple(name for name, _ in FIELDS)
+# 为None时在数组中的取值
+_NULLS = {"expire_date": "", "long_margin_ratio": np.nan, "short_margin_ratio": np.nan, "option_type": "",
+          "strike_price": np.nan}
+
+
+def classify(symbol):
+    '''
+    期权返回标的期货代码，期货返回空字符串；兼容sc2302C510、SR301C5000、m2301-C-3000等写法
+    '''
+    match = _OPTION.match(symbol)
+    return match.group(1) if match else ""
+
+
+def product(symbol):
+    '''
+    品种代码，即合约代码开头的字母部分
+    '''
+    match = _PRODUCT.match(symbol)
+    return match.group(0) if match else ""
+
+
+class InstrumentTable(Mapping):
+    '''
+    合约表：所有合约按代码排序存为一个定长结构化数组，以.npy格式内存映射加载。
+    按字典方式访问时，单个合约的字典在首次访问时生成并缓存。
+    '''
+
+    def __init__(self, data, date):
+        self.date = date
+        # (数组, 代码->行号, 行号->字典)作为整体替换，刷新时读取方不会看到不一致的状态
+        self._state = (data, dict(zip(data["symbol"].tolist(), range(len(data)))), {})
+
+    @property
+    def _data(self):
+        return self._state[0]
+
+    @property
+    def _index(self):
+        return self._state[1]
+
+    @classmethod
+    def fromDict(cls, instruments, date):
+        '''
+        由OnRspQryInstrument得到的{代码: 字段字典}建立合约表
+        '''
+        symbols = sorted(instruments)
+        data = np.zeros(len(symbols), dtype=DTYPE)
+        data["symbol"] = symbols
+        for name, _ in FIELDS:
+            null = _NULLS.get(name)
+            data[name] = [null if instruments[s][name] is None else instruments[s][name] for s in symbols]
+        data["underlying"] = [classify(s) for s in symbols]
+        data["product"] = [product(s) for s in symbols]
+        return cls(data, date)
+
+    @classmethod
+    def load(cls, path=TABLE_PATH, meta_path=META_PATH):
+        '''
+        内存映射方式加载缓存的合约表，不存在或格式不符时返回None
+        '''
+        if not (os.path.exists(path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path) as fd:
+                meta = json.load(fd)
+            if meta.get("version") != VERSION:
+                return None
+            # 去掉memmap子类，逐行访问时少一层Python开销，数据仍然直接映射文件
+            data = np.load(path, mmap_mode="r").view(np.ndarray)
+        except (ValueError, OSError) as e:
+            logger.error("合约缓存读取失败: %s" % e)
+            return None
+        if data.dtype != DTYPE or len(data) != meta["count"]:
+            return None
+        return cls(data, meta["date"])
+
+    def save(self, path=TABLE_PATH, meta_path=META_PATH):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fd:
+            np.save(fd, np.ascontiguousarray(self._data))
+        os.replace(tmp_path, path)
+        with open(meta_path + ".tmp", "w") as fd:
+            json.dump({"version": VERSION, "date": self.date, "count": len(self._data)}, fd)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def __getitem__(self, symbol):
+        data, index, cache = self._state
+        row = index[symbol]
+        instrument = cache.get(row)
+        if instrument is None:
+            instrument = self._materialize(data, cache, [row])[0]
+        return instrument
+
+    def _materialize(self, data, cache, rows):
+        '''
+        批量生成并缓存合约字典，按列取值比逐行访问结构化数组快
+        '''
+        missing = [row for row in rows if row not in cache]
+        if missing:
+            columns = [data[name][missing].tolist() for name, _ in FIELDS]
+            for row, symbol, values in zip(missing, data["symbol"][missing].tolist(), zip(*columns)):
+                instrument = dict(zip(_NAMES, values))
+                for name, null in _NULLS.items():
+                    value = instrument[name]
+                    if value == null or value != value:
+                        instrument[name] = None
+                instrument["symbol"] = symbol
+                cache.setdefault(row, instrument)
+        return [cache[row] for row in rows]
+
+    def __contains__(self, symbol):
+        return symbol in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def column(self, name):
+        return self._data[name]
+
+    def index(self):
+        '''
+        {合约代码: 行号}的拷贝，行号与column返回的数组一致
+        '''
+        return dict(self._index)
+
+    def futures(self):
+        '''
+        {交易所: [期货合约字典]}
+        '''
+        data, _, cache = self._state
+        rows = np.flatnonzero(data["underlying"] == "")
+        return self._partition(data, cache, rows, data["exchange"][rows])
+
+    def options(self):
+        '''
+        {标的期货代码: [期权合约字典]}，按到期日、行权价、认购/认沽排序
+        '''
+        data, _, cache = self._state
+        rows = np.flatnonzero(data["underlying"] != "")
+        rows = rows[np.lexsort((data["option_type"][rows], data["strike_price"][rows], data["expire_date"][rows]))]
+        return self._partition(data, cache, rows, data["underlying"][rows])
+
+    def _partition(self, data, cache, rows, keys):
+        groups = defaultdict(list)
+        rows = rows.tolist()
+        for key, instrument in zip(keys.tolist(), self._materialize(data, cache, rows)):
+            groups[key].append(instrument)
+        return groups
+
+    def apply(self, instruments, date):
+        '''
+        用新查询到的全部合约更新合约表，未变化合约的字典对象保持不变；返回新增、删除、变化的合约代码
+        '''
+        fresh = InstrumentTable.fromDict(instruments, date)
+        data, index, cache = self._state
+        added = [s for s in fresh._index if s not in index]
+        removed = [s for s in index if s not in fresh._index]
+        # 比较结构化数组的整行，NaN字段不会相等，因此只对不同的行再按字典比较
+        common = [s for s in fresh._index if s in index]
+        old_rows = np.array([index[s] for s in common], dtype=np.int64)
+        new_rows = np.array([fresh._index[s] for s in common], dtype=np.int64)
+        fields = ["symbol"] + [name for name, _ in FIELDS]
+        same = np.ones(len(common), dtype=bool)
+        for name in fields:
+            old, new = data[name][old_rows], fresh._data[name][new_rows]
+            equal = old == new
+            if old.dtype.kind == "f":
+                equal |= np.isnan(old) & np.isnan(new)
+            same &= equal
+        fresh_cache = fresh._state[2]
+        changed = []
+        for symbol, old_row, new_row, unchanged in zip(common, old_rows.tolist(), new_rows.tolist(), same.tolist()):
+            if not unchanged:
+                changed.append(symbol)
+            elif old_row in cache:
+                fresh_cache[new_row] = cache[old_row]
+        self._state = fresh._state
+        self.date = date
+        return {"added": added, "removed": removed, "changed": changed}
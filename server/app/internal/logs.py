@@ -0,0 +1,206 @@
+import atexit
+import ctypes
+import logging
+import threading
+import time
+from collections import deque
+
+from app.internal.constants import LOG_QUEUE_SIZE, LOG_BATCH_SIZE, TICK_LOG_RATE
+from app.internal.metrics import LOG_DROPPED
+
+
+logger = logging.getLogger(__name__)
+
+
+class LogWriter:
+    '''
+    后台写日志线程：调用线程只把日志记录放入队列，格式化和I/O都在写线程中按批完成。
+    队列满时直接丢弃新记录并计数，不阻塞SPI回调线程和事件循环
+    '''
+
+    def __init__(self, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        # deque的append、popleft是原子操作，入队不需要加锁
+        self._records = deque()
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._reported = 0
+        self._reported_at = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, handlers, record):
+        if len(self._records) >= self.queue_size:
+            LOG_DROPPED.inc()
+            return
+        self._records.append((handlers, record))
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def close(self, timeout=5):
+        '''
+        写完队列中剩余的记录后退出
+        '''
+        self._closing = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._records:
+                batch = [self._records.popleft() for _ in range(min(self.batch_size, len(self._records)))]
+                self._write(batch)
+            self._reportDropped()
+            if self._closing and not self._records:
+                break
+
+    def _write(self, batch):
+        groups = {}
+        for handlers, record in batch:
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    groups.setdefault(handler, []).append(record)
+        for handler, records in groups.items():
+            if type(handler) in (logging.StreamHandler, logging.FileHandler):
+                _writeStream(handler, records)
+            else:
+                # 滚动文件等其他handler需要逐条判断，按原方式处理
+                for record in records:
+                    handler.handle(record)
+
+    def _reportDropped(self):
+        '''
+        每秒最多报告一次丢弃的条数
+        '''
+        now = time.monotonic()
+        if now - self._reported_at < 1 and not self._closing:
+            return
+        dropped = LOG_DROPPED.value()
+        if dropped > self._reported:
+            logger.warning("日志队列已满，已丢弃%d条日志", dropped - self._reported)
+            self._reported = dropped
+            self._reported_at = now
+
+
+def _writeStream(handler, records):
+    '''
+    一批记录格式化后一次写入、一次flush
+    '''
+    lines = []
+    for record in records:
+        if not handler.filter(record):
+            continue
+        try:
+            lines.append(handler.format(record) + handler.terminator)
+        except Exception:
+            handler.handleError(record)
+    if not lines:
+        return
+    handler.acquire()
+    try:
+        if isinstance(handler, logging.FileHandler) and handler.stream is None:
+            handler.stream = handler._open()
+        handler.stream.write("".join(lines))
+        handler.flush()
+    except Exception:
+        handler.handleError(records[-1])
+    finally:
+        handler.release()
+
+
+class QueuedHandler(logging.Handler):
+    '''
+    替换logger上原有的handler：记录连同原handler列表交给LogWriter，不在调用线程格式化。
+    参数在写出时才格式化，CTP结构体和字典在入队时浅拷贝，以免写出时内容已被覆盖
+    '''
+
+    def __init__(self, writer, handlers):
+        super().__init__()
+        self.writer = writer
+        self.handlers = tuple(handlers)
+
+    def handle(self, record):
+        # 不获取handler锁，入队本身是原子的
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def emit(self, record):
+        args = record.args
+        if args:
+            if isinstance(args, tuple):
+                record.args = tuple(_snapshot(arg) for arg in args)
+            elif isinstance(args, dict):
+                record.args = dict(args)
+        self.writer.put(self.handlers, record)
+
+
+def _snapshot(arg):
+    if isinstance(arg, ctypes.Structure):
+        return type(arg).from_buffer_copy(arg)
+    if isinstance(arg, dict):
+        return dict(arg)
+    return arg
+
+
+class SampledLogger:
+    '''
+    逐tick日志的采样：每个SampledLogger每秒最多写出rate条，其余略过，下一条写出时附带略过的条数。
+    未开启对应级别时与logger.isEnabledFor开销相同
+    '''
+
+    rate = TICK_LOG_RATE
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._next = 0
+        self._skipped = 0
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level) or self.rate <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next:
+            self._skipped += 1
+            return
+        self._next = now + 1.0 / self.rate
+        if self._skipped:
+            msg = "%s（略过%d条）" % (msg, self._skipped)
+            self._skipped = 0
+        self.logger.log(level, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+
+_writer = None
+
+
+def install(queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, tick_log_rate=TICK_LOG_RATE):
+    '''
+    把根logger及各已配置logger上的handler换成QueuedHandler，共用一个后台写线程；
+    没有配置handler时沿用logging默认的stderr输出。重复调用只更新采样频率
+    '''
+    global _writer
+    SampledLogger.rate = tick_log_rate
+    if _writer is not None:
+        return _writer
+    _writer = LogWriter(queue_size, batch_size)
+    loggers = [logging.getLogger()] + [item for item in logging.Logger.manager.loggerDict.values()
+                                       if isinstance(item, logging.Logger)]
+    for item in loggers:
+        handlers = [h for h in item.handlers if not isinstance(h, QueuedHandler)]
+        if not handlers and item is not logging.getLogger():
+            continue
+        for handler in handlers:
+            item.removeHandler(handler)
+        item.addHandler(QueuedHandler(_writer, handlers or [logging.lastResort]))
+    atexit.register(_writer.close)
+    return _writer
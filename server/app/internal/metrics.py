@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+
+from app.internal.constants import LOOP_LAG_INTERVAL
+
+
+# 秒；CTP请求、报单回报在毫秒到秒级，单个tick回调在微秒到毫秒级
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TICK_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+
+class _Metric:
+    '''
+    指标按线程分片记录：每个线程只写自己的分片，SPI回调线程和事件循环记录时不需要加锁，
+    导出时再把各分片相加。labels为与labelnames对应的标签值元组
+    '''
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # 线程退出后分片仍保留，计数不会回退
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _merged(self):
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            # 其他线程可能同时新增标签，先拷贝再遍历
+            for labels, value in list(shard.items()):
+                merged[labels] = self._add(merged.get(labels), value)
+        return merged
+
+    def _add(self, total, value):
+        return value if total is None else total + value
+
+    def _labels(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self.type)]
+        for labels, value in sorted(self._merged().items()):
+            lines.extend(self._samples(labels, value))
+        return lines
+
+    def _samples(self, labels, value):
+        return ["%s%s %s" % (self.name, self._labels(labels), _number(value))]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, labels=(), amount=1):
+        shard = self._local.__dict__.get("shard") or self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._merged().get(labels, 0)
+
+
+class Gauge(_Metric):
+    '''
+    仪表值只保留最后一次设置，直接写入共享字典
+    '''
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def _merged(self):
+        return dict(self._values)
+
+
+class Histogram(_Metric):
+    '''
+    每个标签组合一行：各桶计数（不累计）、+Inf桶计数和总和；导出时换算为累计计数
+    '''
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = self._local.__dict__.get("shard") or self._shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = [0] * (len(self.buckets) + 2)
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def _add(self, total, value):
+        return list(value) if total is None else [a + b for a, b in zip(total, value)]
+
+    def count(self, labels=()):
+        row = self._merged().get(labels)
+        return sum(row[:-1]) if row else 0
+
+    def _samples(self, labels, row):
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), row):
+            total += count
+            lines.append("%s_bucket%s %d" % (self.name, self._labels(labels, [("le", _number(bound))]), total))
+        lines.append("%s_sum%s %s" % (self.name, self._labels(labels), _number(row[-1])))
+        lines.append("%s_count%s %d" % (self.name, self._labels(labels), total))
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        '''
+        Prometheus文本格式
+        '''
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "ctp_request_seconds", "CTP请求从发送到最后一条回报（is_last）的耗时", ("request",)))
+ORDER_ACK_SECONDS = REGISTRY.register(Histogram(
+    "ctp_order_ack_seconds", "报单、撤单从发送到收到确认或拒绝回报的耗时", ("action",)))
+TICK_SECONDS = REGISTRY.register(Histogram(
+    "ctp_tick_callback_seconds", "OnRtnDepthMarketData回调处理单个tick的耗时", buckets=TICK_BUCKETS))
+TICKS = REGISTRY.register(Counter(
+    "ctp_ticks_total", "收到的tick数，按交易所；rate()即每秒tick数", ("exchange",)))
+TIMEOUTS = REGISTRY.register(Counter(
+    "ctp_timeouts_total", "等待CTP回报超时的次数", ("operation",)))
+API_ERRORS = REGISTRY.register(Counter(
+    "ctp_api_errors_total", "CTP请求函数返回非0的次数：-1网络连接失败，-2未处理请求超过许可数，-3每秒发送请求数超过许可数",
+    ("code",)))
+SUBSCRIBED_CODES = REGISTRY.register(Gauge(
+    "ctp_subscribed_codes", "已订阅行情的合约数"))
+QUERY_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "ctp_query_queue_depth", "查询流控队列中等待发送的查询数"))
+QUERY_IN_FLIGHT = REGISTRY.register(Gauge(
+    "ctp_query_in_flight", "已发送、等待回报的查询数"))
+PENDING_ORDERS = REGISTRY.register(Gauge(
+    "ctp_pending_orders", "等待回报的报单和撤单数"))
+LOOP_LAG = REGISTRY.register(Gauge(
+    "ctp_event_loop_lag_seconds", "事件循环定时唤醒的延迟"))
+BUS_DROPPED = REGISTRY.register(Counter(
+    "ctp_bus_dropped_total", "行情总线订阅方缓冲区已满时丢弃的tick数", ("subscriber",)))
+BUS_LAG = REGISTRY.register(Gauge(
+    "ctp_bus_lag_seconds", "行情总线订阅方最早一条未处理tick已等待的时间", ("subscriber",)))
+LOG_DROPPED = REGISTRY.register(Counter(
+    "ctp_log_dropped_total", "日志队列已满时丢弃的日志条数"))
+
+
+async def monitorLoopLag(interval=LOOP_LAG_INTERVAL):
+    '''
+    定时休眠，实际唤醒时间与预期之差即事件循环被阻塞的时长
+    '''
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        LOOP_LAG.set(max(0.0, time.monotonic() - started - interval))
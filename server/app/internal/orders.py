@@ -0,0 +1,178 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+
+from app.internal.constants import MAX_TIMEOUT
+from app.internal.metrics import ORDER_ACK_SECONDS, TIMEOUTS
+
+
+logger = logging.getLogger(__name__)
+
+
+class PendingOrder:
+    '''
+    单笔在途报单或撤单：登记的键、等待它的future，以及截止时间；报单另记录时间条件，决定何时算完成
+    '''
+
+    def __init__(self, key, name, loop, timeout, time_condition=None):
+        self.key = key
+        self.name = name
+        self.time_condition = time_condition
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self._loop = loop
+        self._future = loop.create_future()
+
+    @property
+    def order_ref(self):
+        return self.key[2]
+
+    async def wait(self):
+        remaining = max(0, self.deadline - time.monotonic())
+        try:
+            return await asyncio.wait_for(self._future, remaining)
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc((self.name,))
+            raise TimeoutError("%s超时" % self.name)
+
+    def resolve(self, result=None, error=None):
+        self._loop.call_soon_threadsafe(_resolveFuture, self._future, result, error)
+
+
+class OrderTracker:
+    '''
+    在途报单按(FrontID, SessionID, OrderRef)登记，撤单按单号登记；
+    OnRtnOrder回报据此分发到各自的请求，多笔报单可以同时在途、各自完成
+    '''
+
+    def __init__(self):
+        self._refs = itertools.count(1)
+        self._front_id = None
+        self._session_id = None
+        self._inserts = {}
+        self._actions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._inserts) + len(self._actions)
+
+    def setSession(self, front_id, session_id, max_order_ref=0):
+        '''
+        登录后记录会话，报单引用从登录返回的MaxOrderRef之后继续递增
+        '''
+        with self._lock:
+            self._front_id = front_id
+            self._session_id = session_id
+            self._refs = itertools.count(max_order_ref + 1)
+
+    def registerInsert(self, time_condition, name, timeout=MAX_TIMEOUT):
+        '''
+        分配报单引用并登记，需在发送ReqOrderInsert之前调用，以免回报先于登记到达
+        '''
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            key = (self._front_id, self._session_id, next(self._refs))
+            pending = PendingOrder(key, name, loop, timeout, time_condition)
+            self._inserts[key] = pending
+        return pending
+
+    def registerAction(self, order_id, name, timeout=MAX_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if order_id in self._actions:
+                raise RuntimeError("订单<%s>正在撤销" % order_id)
+            pending = PendingOrder(order_id, name, loop, timeout)
+            self._actions[order_id] = pending
+        return pending
+
+    def discard(self, pending):
+        with self._lock:
+            if self._inserts.get(pending.key) is pending:
+                del self._inserts[pending.key]
+            elif self._actions.get(pending.key) is pending:
+                del self._actions[pending.key]
+
+    def onOrder(self, order):
+        '''
+        OnRtnOrder回报：先匹配本会话的在途报单，再匹配在途撤单；返回是否有请求因此完成
+        '''
+        # 同一投资者其他终端、会话的报单也会推送，它们的报单引用不一定是数字
+        if self._inserts and (order.FrontID, order.SessionID) == (self._front_id, self._session_id):
+            order_ref = _orderRef(order.OrderRef)
+            pending = self._inserts.get((order.FrontID, order.SessionID, order_ref))
+            if pending is not None and self._insertDone(pending, order):
+                return True
+        if self._actions:
+            pending = self._actions.get("%s@%s" % (order.OrderSysID, order.InstrumentID))
+            if pending is not None and self._actionDone(pending, order):
+                return True
+        return False
+
+    def insertFailed(self, order_ref, error):
+        '''
+        OnRspOrderInsert、OnErrRtnOrderInsert：柜台或交易所拒绝本会话的报单
+        '''
+        order_ref = _orderRef(order_ref)
+        if order_ref is None:
+            return False
+        return self._finish(self._inserts, (self._front_id, self._session_id, order_ref), error=error)
+
+    def actionFailed(self, order_id, error):
+        return self._finish(self._actions, order_id, error=error)
+
+    def _insertDone(self, pending, order):
+        if order.OrderStatus == 'a':  # THOST_FTDC_OST_Unknown
+            return False
+        if order.OrderSubmitStatus == '4':  # THOST_FTDC_OSS_InsertRejected
+            return self._finish(self._inserts, pending.key, error=order.StatusMsg)
+        if pending.time_condition == '1':  # THOST_FTDC_TC_IOC
+            # THOST_FTDC_OST_AllTraded = 0, THOST_FTDC_OST_Canceled = 5
+            if order.OrderStatus in ('0', '5'):
+                logger.info("已执行IOC单，成交量：%d" % order.VolumeTraded)
+                return self._finish(self._inserts, pending.key, order.VolumeTraded)
+        elif order.OrderSubmitStatus in ("3", "0") and order.OrderSysID:  # THOST_FTDC_OSS_Accepted
+            order_id = "%s@%s" % (order.OrderSysID, order.InstrumentID)
+            logger.info("已提交限价单（单号：<%s>）" % order_id)
+            return self._finish(self._inserts, pending.key, order_id)
+        return False
+
+    def _actionDone(self, pending, order):
+        status = {"order_id": pending.key, "status": order.StatusMsg}
+        if order.OrderSubmitStatus == '5':  # THOST_FTDC_OSS_CancelRejected
+            return self._finish(self._actions, pending.key, status, order.StatusMsg)
+        # THOST_FTDC_OST_AllTraded = 0, THOST_FTDC_OST_Canceled = 5
+        if order.OrderStatus in ('0', '5'):
+            logger.info("已撤销限价单，单号：<%s>" % pending.key)
+            return self._finish(self._actions, pending.key, status)
+        return False
+
+    def _finish(self, entries, key, result=None, error=None):
+        with self._lock:
+            pending = entries.pop(key, None)
+        if pending is None:
+            return False
+        ORDER_ACK_SECONDS.observe(time.monotonic() - pending.started,
+                                  ("insert" if entries is self._inserts else "cancel",))
+        pending.resolve(result, error)
+        return True
+
+
+def _resolveFuture(future, result, error):
+    if future.done():
+        return
+    if error:
+        future.set_exception(RuntimeError(error))
+    else:
+        future.set_result(result)
+
+
+def _orderRef(order_ref):
+    '''
+    报单引用转为整数，空白或非数字（不是本会话分配的）时为None
+    '''
+    try:
+        return int(order_ref)
+    except ValueError:
+        return None
@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只提供gzip
+    brotli = None
+
+from app.internal.serializer import dumpb
+
+
+class Payload:
+    '''
+    预先序列化的响应体：JSON字节、按内容计算的强ETag，以及按需生成并缓存的压缩版本
+    '''
+
+    def __init__(self, data):
+        self.body = dumpb(data)
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def matches(self, if_none_match):
+        '''
+        If-None-Match是否命中当前ETag
+        '''
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+    def encode(self, accept_encoding):
+        '''
+        按Accept-Encoding返回(响应体, Content-Encoding)：取q值最高的编码，q值相同时优先brotli，q=0的编码不使用
+        '''
+        accepted = _qualities(accept_encoding)
+        best, encoding = 0, None
+        for name in ("br", "gzip") if brotli else ("gzip",):
+            q = accepted.get(name, accepted.get("*", 0))
+            if q > best:
+                best, encoding = q, name
+        if encoding is None:
+            return self.body, None
+        return self._compressed(encoding), encoding
+
+    def _compressed(self, encoding):
+        body = self._encoded.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(encoding)
+                if body is None:
+                    if encoding == "br":
+                        body = brotli.compress(self.body, quality=5)
+                    else:
+                        body = gzip.compress(self.body, 6)
+                    self._encoded[encoding] = body
+        return body
+
+
+def _qualities(accept_encoding):
+    '''
+    解析Accept-Encoding为{编码: q值}，没有q参数时为1，q值无法解析时为0
+    '''
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, *params = item.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class PayloadCache:
+    '''
+    按key缓存Payload；内容来源（如合约表）变化时调用invalidate
+    '''
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key, build):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = Payload(build())
+            self._entries[key] = entry
+            self.builds += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def invalidate(self):
+        self._entries = {}
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "builds": self.builds,
+                "bytes": sum(len(entry.body) for entry in self._entries.values())}
@@ -0,0 +1,276 @@
+import datetime
+import threading
+import time
+
+from pytz import timezone
+
+from app.internal.serializer import share
+
+
+class PositionEngine:
+    '''
+    持仓与盈亏引擎：登录后查询一次持仓作为初始状态，OnRtnTrade增量更新数量和成本，
+    已订阅合约的tick按最新价计算浮动盈亏。定期与ReqQryInvestorPosition对账。
+    '''
+
+    # 作为行情订阅的消费方时显示的名称
+    name = "positions"
+
+    def __init__(self, instruments, decimal_places):
+        self._instruments = instruments
+        self._decimal_places = decimal_places
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._prices = {}
+        self._close_profit = 0.0
+        self._anchor = None
+        self.seeded = False
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+        # 只有价格变化时不加版本号，下次取快照时重建
+        self._stale = False
+        self._changed = None
+        self._formatted = (None, None)
+        # 持仓查询应答之后、seed之前到达的成交，seed后重放
+        self._pending = None
+        # 持仓合约增减时调用，可能在SPI线程中
+        self.listener = None
+
+    def seed(self, rows):
+        '''
+        用持仓查询结果重建状态；同一合约同一方向的今仓、昨仓记录合并为一行
+        '''
+        positions = {}
+        for row in rows:
+            key = (row['code'], row['direction'])
+            if key not in positions:
+                positions[key] = dict(row)
+                continue
+            position = positions[key]
+            for name in ("volume", "margin", "cost", "position_cost", "position_profit", "profit",
+                         "yd_position", "today_position", "open_volume", "close_volume",
+                         "long_frozen", "short_frozen"):
+                position[name] += row[name]
+        with self._lock:
+            self._positions = positions
+            for position in positions.values():
+                self._refresh(position)
+            self.seeded = True
+            pending, self._pending = self._pending or (), None
+            for trade in pending:
+                self._apply(*trade)
+            self._touch()
+        self._notify()
+
+    def hold(self):
+        '''
+        持仓查询的最后一条应答时在SPI线程中调用：此后到达的成交不在查询结果中，先记录下来，seed时重放
+        '''
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+
+    def reset(self):
+        with self._lock:
+            self._positions = {}
+            self._close_profit = 0.0
+            self._anchor = None
+            self.seeded = False
+            self._pending = None
+            self._version += 1
+
+    def onTrade(self, code, direction, offset_flag, price, volume):
+        '''
+        direction为买卖方向(0买1卖)，offset_flag为CTP开平标志
+        '''
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((code, direction, offset_flag, price, volume))
+            self._apply(code, direction, offset_flag, price, volume)
+
+    def _apply(self, code, direction, offset_flag, price, volume):
+        if not self.seeded or code not in self._instruments:
+            return
+        multiple = self._instruments[code]['multiple']
+        amount = price * volume * multiple
+        if offset_flag == '0':  # THOST_FTDC_OF_Open
+            key = (code, "short" if direction else "long")
+            position = self._positions.get(key)
+            if position is None:
+                position = self._positions[key] = self._newPosition(code, key[1])
+                self._notify()
+            ratio = self._instruments[code]["short_margin_ratio" if direction else "long_margin_ratio"] or 0
+            position["volume"] += volume
+            position["today_position"] += volume
+            position["open_volume"] += volume
+            position["cost"] += amount
+            position["position_cost"] += amount
+            position["margin"] += amount * ratio
+        else:
+            key = (code, "long" if direction else "short")
+            position = self._positions.get(key)
+            if position is None or position["volume"] <= 0:
+                return
+            volume = min(volume, position["volume"])
+            ratio = volume / position["volume"]
+            position_cost = position["position_cost"] * ratio
+            sign = 1 if key[1] == "long" else -1
+            self._close_profit += sign * (price * volume * multiple - position_cost)
+            if offset_flag == '3':  # THOST_FTDC_OF_CloseToday
+                position["today_position"] -= volume
+            else:
+                # 先平昨仓，昨仓不足的部分平今仓
+                yd_left = position["volume"] - position["today_position"]
+                position["today_position"] -= max(0, volume - yd_left)
+            position["close_volume"] += volume
+            position["cost"] -= position["cost"] * ratio
+            position["position_cost"] -= position_cost
+            position["margin"] -= position["margin"] * ratio
+            position["volume"] -= volume
+            if position["volume"] == 0:
+                del self._positions[key]
+                self._touch()
+                self._notify()
+                return
+        self._refresh(position)
+        self._touch()
+
+    def onTick(self, code, price):
+        if price is None or (code, "long") not in self._positions and (code, "short") not in self._positions:
+            return
+        with self._lock:
+            self._prices[code] = price
+            for direction in ("long", "short"):
+                position = self._positions.get((code, direction))
+                if position:
+                    self._refresh(position)
+            self._stale = True
+            self._changed = time.time()
+
+    def positions(self):
+        '''
+        持仓快照，数据未变化时返回同一个列表（共享对象，不要修改），编码结果也随之复用
+        '''
+        with self._lock:
+            if self._snapshot_version != self._version or self._stale:
+                rows = [self._output(position) for position in self._positions.values()]
+                rows.sort(key=lambda x: x['code'])
+                self._snapshot = share(rows)
+                self._snapshot_version = self._version
+                self._stale = False
+            return self._snapshot
+
+    @property
+    def updated_at(self):
+        '''
+        最后一次变化的时间，读取时才格式化
+        '''
+        changed = self._changed
+        if changed is None:
+            return None
+        second = int(changed)
+        if self._formatted[0] != second:
+            text = datetime.datetime.fromtimestamp(second, timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
+            self._formatted = (second, text)
+        return self._formatted[1]
+
+    def codes(self):
+        '''
+        有持仓的合约
+        '''
+        with self._lock:
+            return set(code for code, _ in self._positions)
+
+    def volume(self, code, direction):
+        '''
+        合约某方向的持仓数量，没有持仓时为0
+        '''
+        position = self._positions.get((code, direction))
+        return position["volume"] if position else 0
+
+    def anchorAccount(self, account):
+        '''
+        记录查询资金时的浮动盈亏、平仓盈亏和保证金，之后的资金按相对变化推算
+        '''
+        with self._lock:
+            self._anchor = (account, self._totalPositionProfit(), self._close_profit, self._totalMargin())
+
+    def account(self):
+        '''
+        实时资金：查询得到的资金 + 此后浮动盈亏、平仓盈亏与保证金的变化（不含手续费，由对账修正）
+        '''
+        if self._anchor is None:
+            return None
+        with self._lock:
+            account, position_profit, close_profit, margin = self._anchor
+            profit_delta = self._totalPositionProfit() - position_profit
+            balance_delta = profit_delta + self._close_profit - close_profit
+            margin_delta = self._totalMargin() - margin
+        return {"balance": round(account["balance"] + balance_delta, 2),
+                "margin": round(account["margin"] + margin_delta, 2),
+                "available": round(account["available"] + balance_delta - margin_delta, 2),
+                "profit": round(account["profit"] + profit_delta, 2)}
+
+    def reconcile(self, rows):
+        '''
+        与持仓查询结果比对数量和成本，返回差异列表，并以查询结果为准重建状态
+        '''
+        expected = PositionEngine(self._instruments, self._decimal_places)
+        expected.seed(rows)
+        drift = []
+        with self._lock:
+            # 查询结果之后的成交已计入本引擎，比对前同样加到查询结果上
+            for trade in self._pending or ():
+                expected._apply(*trade)
+            keys = set(self._positions) | set(expected._positions)
+            for key in sorted(keys):
+                ours = self._positions.get(key, {})
+                theirs = expected._positions.get(key, {})
+                for name in ("volume", "today_position", "cost"):
+                    a, b = ours.get(name, 0), theirs.get(name, 0)
+                    if abs(a - b) > 0.01:
+                        drift.append({"code": key[0], "direction": key[1], "field": name,
+                                      "engine": round(a, 2), "ctp": round(b, 2)})
+        self.seed(rows)
+        return drift
+
+    def _newPosition(self, code, direction):
+        return {"code": code, "direction": direction, "volume": 0, "margin": 0.0, "cost": 0.0,
+                "position_cost": 0.0, "position_date": '1', "yd_position": 0, "today_position": 0,
+                "long_frozen": 0, "short_frozen": 0, "open_volume": 0, "close_volume": 0,
+                "settlement_price": 0.0, "position_profit": 0.0, "profit": 0.0, "open_cost_price": 0.0,
+                "decimal_places": self._decimal_places(code)}
+
+    def _refresh(self, position):
+        code = position["code"]
+        multiple = self._instruments[code]['multiple']
+        volume = position["volume"]
+        position["open_cost_price"] = position["cost"] / volume / multiple if volume else 0.0
+        price = self._prices.get(code)
+        if price is None:
+            return
+        sign = 1 if position["direction"] == "long" else -1
+        market_value = price * volume * multiple
+        position["position_profit"] = sign * (market_value - position["position_cost"])
+        position["profit"] = sign * (market_value - position["cost"])
+
+    def _output(self, position):
+        row = dict(position)
+        for name in ("margin", "cost", "position_cost", "position_profit", "profit", "open_cost_price"):
+            row[name] = round(row[name], 2)
+        return row
+
+    def _totalPositionProfit(self):
+        return sum(i["position_profit"] for i in self._positions.values())
+
+    def _totalMargin(self):
+        return sum(i["margin"] for i in self._positions.values())
+
+    def _notify(self):
+        if self.listener is not None:
+            self.listener()
+
+    def _touch(self):
+        self._version += 1
+        self._changed = time.time()
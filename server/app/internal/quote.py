@@ -1,12 +1,19 @@
 import ctpwrapper as CTP
 import ctpwrapper.ApiStructure as CTPStruct
 from app.internal.spi import SpiHelper
-from app.internal.constants import DATA_DIR, FILTER
+from app.internal.constants import DATA_DIR
+from app.internal.tick import Tick
+from app.internal.metrics import TICK_SECONDS
+from app.internal.logs import SampledLogger
 import os
 import logging
+import time
 
 
 logger = logging.getLogger("subscribe")
+# 逐tick的日志按采样频率写出
+tick_logger = SampledLogger(logger)
+quote_logger = SampledLogger(logger)
 
 
 class QuoteImpl(SpiHelper, CTP.MdApiPy):
@@ -14,6 +21,8 @@ class QuoteImpl(SpiHelper, CTP.MdApiPy):
         SpiHelper.__init__(self)
         CTP.MdApiPy.__init__(self)
         self._receiver = None
+        self._listener = None
+        self._ticks = {}
         flow_dir = DATA_DIR + "md_flow/"
         os.makedirs(flow_dir, exist_ok=True)
         self.Create(flow_dir)
@@ -23,9 +32,11 @@ class QuoteImpl(SpiHelper, CTP.MdApiPy):
 
     def OnRspError(self, pRspInfo, nRequestID, bIsLast):
         logger.info("OnRspError:")
-        logger.info("requestID:", nRequestID)
+        logger.info("requestID: %s", nRequestID)
         logger.info(pRspInfo)
         logger.info(bIsLast)
+        if pRspInfo and pRspInfo.ErrorID != 0:
+            self.completeRequest(nRequestID, pRspInfo.ErrorMsg)
 
     def __del__(self):
         self.Release()
@@ -38,12 +49,14 @@ class QuoteImpl(SpiHelper, CTP.MdApiPy):
     def OnFrontConnected(self):
         logger.info("已连接行情服务器...")
         field = CTPStruct.ReqUserLoginField()
-        logger.info(f"OnFrontConnected, {field=}")
+        logger.info("OnFrontConnected, field=%r", field)
         self.checkApiReturnInCallback(self.ReqUserLogin(field, 0))
         self.status = 0
 
     def OnFrontDisconnected(self, nReason):
         logger.info("已断开行情服务器:{}...".format(nReason))
+        if self._listener:
+            self._listener.onFrontDisconnected()
 
     def OnHeartBeatWarning(self, nTimeLapse):
         """心跳超时警告。当长时间未收到报文时，该方法被调用。
@@ -59,33 +72,54 @@ class QuoteImpl(SpiHelper, CTP.MdApiPy):
         logger.info("已登录行情会话...")
         self.status = 1
         self.notifyCompletion()
+        # 首次登录在构造函数中完成，此时还没有listener；之后的登录都是断线重连
+        if self._listener:
+            self._listener.onLogin()
 
     def setReceiver(self, func):
         old_func = self._receiver
         self._receiver = func
         return old_func
 
-    def subscribe(self, codes):
-        self.resetCompletion()
-        self.checkApiReturn(self.SubscribeMarketData(codes))
-        self.waitCompletion("订阅行情")
-
-    def subscribe_quote(self, codes):
-        self.resetCompletion()
-        self.checkApiReturn(self.SubscribeForQuoteRsp(codes))
-        self.waitCompletion("订阅询价")
+    def setListener(self, listener):
+        '''
+        listener接收逐个合约的订阅应答和断线、重新登录通知，见SubscriptionManager
+        '''
+        self._listener = listener
+
+    async def subscribe(self, codes):
+        '''
+        一次请求订阅全部codes，收到最后一个应答后返回；单个合约的错误报告给listener
+        '''
+        async with self.requestLock():
+            self.resetCompletion()
+            self.checkApiReturn(self.SubscribeMarketData(codes))
+            await self.waitCompletionAsync("订阅行情")
+
+    async def subscribe_quote(self, codes):
+        async with self.requestLock():
+            self.resetCompletion()
+            self.checkApiReturn(self.SubscribeForQuoteRsp(codes))
+            await self.waitCompletionAsync("订阅询价")
 
     def OnRspSubMarketData(self, field, info, _, is_last):
-        logger.info(f"OnRspSubMarketData, {field=}")
-        if not self.checkRspInfoInCallback(info):
-            assert (is_last)
+        logger.info("OnRspSubMarketData, field=%r", field)
+        error = info.ErrorMsg if info and info.ErrorID != 0 else None
+        code = field.InstrumentID if field else ""
+        if error:
+            logger.warning("订阅<%s>的行情失败: %s", code, error)
+        else:
+            logger.info("已订阅<%s>的行情...", code)
+        if self._listener:
+            self._listener.onRspSubscribe(code, error)
+        elif error:
+            self.notifyCompletion(error)
             return
-        logger.info("已订阅<%s>的行情..." % field.InstrumentID)
         if is_last:
             self.notifyCompletion()
 
     def OnRspSubForQuoteRsp(self, field, info, _, is_last):
-        logger.info(f"OnRspSubForQuoteRsp, {field=}, {info=}")
+        logger.info("OnRspSubForQuoteRsp, field=%r, info=%r", field, info)
         if not self.checkRspInfoInCallback(info):
             assert (is_last)
             return
@@ -96,66 +130,33 @@ class QuoteImpl(SpiHelper, CTP.MdApiPy):
     def OnRtnDepthMarketData(self, field):
         if not self._receiver:
             return
-        logger.info(f"OnRtnDepthMarketData, {field=}")
-        self._receiver({"trade_time": field.TradingDay[:4] + '-' + field.TradingDay[4:6] + '-' + field.TradingDay[
-                                                                                                 6:] + " " + field.UpdateTime,
-                        "update_sec": int(field.UpdateMillisec),
-                        "code": field.InstrumentID, "price": FILTER(field.LastPrice),
-                        "open": FILTER(field.OpenPrice), "close": FILTER(field.ClosePrice),
-                        "highest": FILTER(field.HighestPrice), "lowest": FILTER(field.LowestPrice),
-                        "upper_limit": FILTER(field.UpperLimitPrice),
-                        "lower_limit": FILTER(field.LowerLimitPrice),
-                        "settlement": FILTER(field.SettlementPrice), "volume": field.Volume,
-                        "turnover": field.Turnover, "open_interest": int(field.OpenInterest),
-                        "pre_close": FILTER(field.PreClosePrice),
-                        "pre_settlement": FILTER(field.PreSettlementPrice),
-                        "pre_open_interest": int(field.PreOpenInterest),
-                        "ask1": (FILTER(field.AskPrice1), field.AskVolume1),
-                        "bid1": (FILTER(field.BidPrice1), field.BidVolume1),
-                        "ask2": (FILTER(field.AskPrice2), field.AskVolume2),
-                        "bid2": (FILTER(field.BidPrice2), field.BidVolume2),
-                        "ask3": (FILTER(field.AskPrice3), field.AskVolume3),
-                        "bid3": (FILTER(field.BidPrice3), field.BidVolume3),
-                        "ask4": (FILTER(field.AskPrice4), field.AskVolume4),
-                        "bid4": (FILTER(field.BidPrice4), field.BidVolume4),
-                        "ask5": (FILTER(field.AskPrice5), field.AskVolume5),
-                        "bid5": (FILTER(field.BidPrice5), field.BidVolume5)})
+        started = time.perf_counter()
+        tick_logger.info("OnRtnDepthMarketData, field=%r", field)
+        self._receiver(self._updateTick(field))
+        TICK_SECONDS.observe(time.perf_counter() - started)
 
     def OnRtnForQuoteRsp(self, field):
-        logger.info(f"OnRtnForQuoteRsp, {field=}")
+        quote_logger.info("OnRtnForQuoteRsp, field=%r", field)
         if not self._receiver:
             return
-        self._receiver({"trade_time": field.TradingDay[:4] + '-' + field.TradingDay[4:6] + '-' + field.TradingDay[
-                                                                                                 6:] + " " + field.UpdateTime,
-                        "update_sec": int(field.UpdateMillisec),
-                        "code": field.InstrumentID, "price": FILTER(field.LastPrice),
-                        "open": FILTER(field.OpenPrice), "close": FILTER(field.ClosePrice),
-                        "highest": FILTER(field.HighestPrice), "lowest": FILTER(field.LowestPrice),
-                        "upper_limit": FILTER(field.UpperLimitPrice),
-                        "lower_limit": FILTER(field.LowerLimitPrice),
-                        "settlement": FILTER(field.SettlementPrice), "volume": field.Volume,
-                        "turnover": field.Turnover, "open_interest": int(field.OpenInterest),
-                        "pre_close": FILTER(field.PreClosePrice),
-                        "pre_settlement": FILTER(field.PreSettlementPrice),
-                        "pre_open_interest": int(field.PreOpenInterest),
-                        "ask1": (FILTER(field.AskPrice1), field.AskVolume1),
-                        "bid1": (FILTER(field.BidPrice1), field.BidVolume1),
-                        "ask2": (FILTER(field.AskPrice2), field.AskVolume2),
-                        "bid2": (FILTER(field.BidPrice2), field.BidVolume2),
-                        "ask3": (FILTER(field.AskPrice3), field.AskVolume3),
-                        "bid3": (FILTER(field.BidPrice3), field.BidVolume3),
-                        "ask4": (FILTER(field.AskPrice4), field.AskVolume4),
-                        "bid4": (FILTER(field.BidPrice4), field.BidVolume4),
-                        "ask5": (FILTER(field.AskPrice5), field.AskVolume5),
-                        "bid5": (FILTER(field.BidPrice5), field.BidVolume5)})
-
-    def unsubscribe(self, codes):
-        self.resetCompletion()
-        self.checkApiReturn(self.UnSubscribeMarketData(codes))
-        self.waitCompletion("取消订阅行情")
+        self._receiver(self._updateTick(field))
+
+    def _updateTick(self, field):
+        code = field.InstrumentID
+        tick = self._ticks.get(code)
+        if tick is None:
+            tick = self._ticks[code] = Tick(code)
+        tick.update(field)
+        return tick
+
+    async def unsubscribe(self, codes):
+        async with self.requestLock():
+            self.resetCompletion()
+            self.checkApiReturn(self.UnSubscribeMarketData(codes))
+            await self.waitCompletionAsync("取消订阅行情")
 
     def OnRspUnSubMarketData(self, field, info, _, is_last):
-        logger.info(f"OnRspUnSubMarketData, {field=}")
+        logger.info("OnRspUnSubMarketData, field=%r", field)
         if not self.checkRspInfoInCallback(info):
             assert (is_last)
             return
@@ -0,0 +1,302 @@
+import calendar
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from app.internal.constants import DATA_DIR
+
+
+logger = logging.getLogger(__name__)
+
+TICK_DIR = DATA_DIR + "ticks/"
+# 每个合约的数据按块连续存放，一块内的记录可以零拷贝读取
+BLOCK_RECORDS = 256
+GROW_BLOCKS = 1024
+FLUSH_INTERVAL = 0.2
+INDEX_INTERVAL = 1.0
+# 超过这个时间没有写入的交易日文件才关闭，换日前后两个交易日的文件可以同时打开
+DAY_FILE_IDLE = 1800
+
+RECORD_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("last", "<f8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("upper_limit", "<f8"), ("lower_limit", "<f8"), ("settlement", "<f8"),
+    ("pre_close", "<f8"), ("pre_settlement", "<f8"),
+    ("volume", "<i8"), ("turnover", "<f8"), ("open_interest", "<f8"), ("pre_open_interest", "<f8"),
+    ("bid_price", "<f8", (5,)), ("bid_volume", "<i4", (5,)),
+    ("ask_price", "<f8", (5,)), ("ask_volume", "<i4", (5,)),
+])
+RECORD = struct.Struct("<q10dq3d5d5i5d5i")
+assert RECORD.size == RECORD_DTYPE.itemsize
+RECORD_SIZE = RECORD.size
+BLOCK_SIZE = BLOCK_RECORDS * RECORD_SIZE
+
+
+def session_ms(update_time):
+    '''
+    交易日内单调递增的毫秒数：夜盘(18点以后)记为前一天，保证夜盘排在日盘之前
+    '''
+    ms = (int(update_time[:2]) * 3600 + int(update_time[3:5]) * 60 + int(update_time[6:8])) * 1000
+    return ms - 86400000 if ms >= 18 * 3600000 else ms
+
+
+def day_ms(trading_day):
+    return calendar.timegm(time.strptime(trading_day, "%Y%m%d")) * 1000
+
+
+def timestamp(trading_day, update_time, millisec=0):
+    '''
+    按交易日对齐的北京时间毫秒时间戳，用于同一交易日内按时间排序和区间查询
+    '''
+    return day_ms(trading_day) + session_ms(update_time) + millisec
+
+
+class DayFile:
+    '''
+    一个交易日的行情文件：ticks.dat按块追加记录，index.json记录每个合约的块号和块内记录数
+    '''
+
+    def __init__(self, trading_day, base_dir=TICK_DIR):
+        self.trading_day = trading_day
+        self.path = os.path.join(base_dir, trading_day)
+        os.makedirs(self.path, exist_ok=True)
+        self._data_path = os.path.join(self.path, "ticks.dat")
+        self._index_path = os.path.join(self.path, "index.json")
+        self.blocks = {}
+        self.used_blocks = 0
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as fd:
+                index = json.load(fd)
+            self.blocks = {code: [list(i) for i in blocks] for code, blocks in index["blocks"].items()}
+            self.used_blocks = index["used_blocks"]
+        self._fd = open(self._data_path, "a+b")
+        self._capacity = 0
+        self._mmap = None
+        self._grow(max(self.used_blocks, GROW_BLOCKS))
+        self.dirty = False
+        self.written = time.monotonic()
+
+    def _grow(self, blocks):
+        if self._mmap is not None:
+            self._mmap.close()
+        size = max(os.path.getsize(self._data_path), blocks * BLOCK_SIZE)
+        self._fd.truncate(size)
+        self._capacity = size // BLOCK_SIZE
+        self._mmap = mmap.mmap(self._fd.fileno(), size)
+
+    def append(self, code, record):
+        blocks = self.blocks.get(code)
+        if blocks is None:
+            blocks = self.blocks[code] = []
+        if not blocks or blocks[-1][1] == BLOCK_RECORDS:
+            if self.used_blocks == self._capacity:
+                self._grow(self._capacity + GROW_BLOCKS)
+            blocks.append([self.used_blocks, 0])
+            self.used_blocks += 1
+        block = blocks[-1]
+        offset = block[0] * BLOCK_SIZE + block[1] * RECORD_SIZE
+        self._mmap[offset: offset + RECORD_SIZE] = record
+        block[1] += 1
+
+    def saveIndex(self):
+        self._mmap.flush()
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as fd:
+            json.dump({"block_records": BLOCK_RECORDS, "record_size": RECORD.size,
+                       "used_blocks": self.used_blocks, "blocks": self.blocks}, fd)
+        os.replace(tmp_path, self._index_path)
+        self.dirty = False
+
+    def close(self):
+        self.saveIndex()
+        self._mmap.close()
+        self._fd.close()
+
+
+class TickRecorder:
+    '''
+    行情记录器：SPI线程只把tick打包成定长记录放入队列，后台线程批量写入按交易日划分的内存映射文件
+    '''
+
+    def __init__(self, base_dir=TICK_DIR):
+        self._base_dir = base_dir
+        self._queue = deque()
+        self._files = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._clock_cache = {}
+        # 夜盘自然日 -> 交易日，从TradingDay与ActionDay不同的tick（如上期所）得到
+        self._night_days = {}
+        self.recorded = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tick-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._flush()
+        for day_file in self._files.values():
+            day_file.close()
+        self._files = {}
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    def record(self, tick):
+        '''
+        在行情回调线程中调用，只做打包和入队
+        '''
+        trading_day = tick.trading_day
+        if tick.update_time >= "18" or tick.update_time < "03":
+            trading_day = self._nightTradingDay(trading_day, tick.action_day)
+        key = (trading_day, tick.update_time)
+        clock = self._clock_cache.get(key)
+        if clock is None:
+            if len(self._clock_cache) > 100000:
+                self._clock_cache.clear()
+            clock = self._clock_cache[key] = timestamp(*key)
+        self._queue.append((trading_day, tick.code, RECORD.pack(
+            clock + tick.update_millisec,
+            tick.last_price, tick.open_price, tick.highest_price, tick.lowest_price, tick.close_price,
+            tick.upper_limit_price, tick.lower_limit_price, tick.settlement_price,
+            tick.pre_close_price, tick.pre_settlement_price,
+            tick.volume, tick.turnover, tick.open_interest, tick.pre_open_interest,
+            tick.bid_price1, tick.bid_price2, tick.bid_price3, tick.bid_price4, tick.bid_price5,
+            tick.bid_volume1, tick.bid_volume2, tick.bid_volume3, tick.bid_volume4, tick.bid_volume5,
+            tick.ask_price1, tick.ask_price2, tick.ask_price3, tick.ask_price4, tick.ask_price5,
+            tick.ask_volume1, tick.ask_volume2, tick.ask_volume3, tick.ask_volume4, tick.ask_volume5)))
+
+    def _nightTradingDay(self, trading_day, action_day):
+        '''
+        郑商所夜盘的TradingDay是自然日，按同一自然日其他交易所的TradingDay改为真实交易日，
+        夜盘与次日日盘记入同一个文件；还没有收到其他交易所的夜盘行情时保持原值
+        '''
+        if trading_day != action_day:
+            if self._night_days.get(action_day) != trading_day:
+                if len(self._night_days) > 100:
+                    self._night_days.clear()
+                self._night_days[action_day] = trading_day
+            return trading_day
+        return self._night_days.get(action_day, trading_day)
+
+    def _run(self):
+        last_index = time.monotonic()
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self._flush()
+            now = time.monotonic()
+            if now - last_index >= INDEX_INTERVAL:
+                for trading_day, day_file in list(self._files.items()):
+                    if day_file.dirty:
+                        day_file.saveIndex()
+                    elif now - day_file.written >= DAY_FILE_IDLE:
+                        self._close(trading_day)
+                last_index = now
+
+    def _flush(self):
+        queue = self._queue
+        popleft = queue.popleft
+        count = 0
+        day_file = None
+        while queue:
+            trading_day, code, record = popleft()
+            if day_file is None or day_file.trading_day != trading_day:
+                day_file = self._files.get(trading_day) or self._open(trading_day)
+                day_file.written = time.monotonic()
+            day_file.append(code, record)
+            day_file.dirty = True
+            count += 1
+        self.recorded += count
+
+    def _open(self, trading_day):
+        '''
+        打开交易日文件；其他交易日的文件保持打开，空闲DAY_FILE_IDLE秒后由后台线程关闭
+        '''
+        day_file = self._files[trading_day] = DayFile(trading_day, self._base_dir)
+        logger.info("开始记录交易日%s的行情..." % trading_day)
+        return day_file
+
+    def _close(self, trading_day):
+        self._files.pop(trading_day).close()
+        logger.info("已结束记录交易日%s的行情..." % trading_day)
+
+
+class TickReader:
+    '''
+    读取某个交易日的行情记录，返回直接映射文件内容的NumPy视图
+    '''
+
+    def __init__(self, trading_day, base_dir=TICK_DIR):
+        self.trading_day = trading_day
+        path = os.path.join(base_dir, trading_day)
+        with open(os.path.join(path, "index.json")) as fd:
+            index = json.load(fd)
+        assert index["record_size"] == RECORD.size
+        self._block_records = index["block_records"]
+        self._blocks = index["blocks"]
+        data_path = os.path.join(path, "ticks.dat")
+        self._data = np.memmap(data_path, dtype=RECORD_DTYPE, mode="r") if os.path.getsize(data_path) else \
+            np.zeros(0, dtype=RECORD_DTYPE)
+
+    @property
+    def codes(self):
+        return list(self._blocks)
+
+    @property
+    def data(self):
+        return self._data
+
+    def count(self, code):
+        return sum(count for _, count in self._blocks.get(code, []))
+
+    def views(self, code, start=None, end=None):
+        '''
+        返回[start, end)时间范围内的记录，每个数据块一个零拷贝视图
+        '''
+        views = []
+        for block, count in self._blocks.get(code, []):
+            offset = block * self._block_records
+            view = self._data[offset: offset + count]
+            if start is not None:
+                view = view[np.searchsorted(view["ts"], start, "left"):]
+            if end is not None:
+                view = view[:np.searchsorted(view["ts"], end, "left")]
+            if len(view):
+                views.append(view)
+        return views
+
+    def positions(self, code, start=None, end=None):
+        '''
+        [start, end)时间范围内记录在文件中的序号，可直接用于self.data的索引
+        '''
+        positions = []
+        for block, count in self._blocks.get(code, []):
+            offset = block * self._block_records
+            ts = self._data["ts"][offset: offset + count]
+            lo = 0 if start is None else np.searchsorted(ts, start, "left")
+            hi = count if end is None else np.searchsorted(ts, end, "left")
+            if hi > lo:
+                positions.append(np.arange(offset + lo, offset + hi, dtype=np.int64))
+        return np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+
+    def read(self, code, start=None, end=None):
+        '''
+        时间范围内的记录；跨多个数据块时拼接为一个新数组
+        '''
+        views = self.views(code, start, end)
+        if len(views) == 1:
+            return views[0]
+        return np.concatenate(views) if views else np.zeros(0, dtype=RECORD_DTYPE)
@@ -0,0 +1,86 @@
+import asyncio
+import itertools
+import threading
+import time
+
+from app.internal.constants import MAX_TIMEOUT, FIRST_REQUEST_ID
+from app.internal.metrics import REQUEST_SECONDS, TIMEOUTS
+
+
+class PendingRequest:
+    '''
+    单个在途请求：请求号、结果累加器、截止时间以及等待它的future
+    '''
+
+    def __init__(self, request_id, name, loop, timeout):
+        self.request_id = request_id
+        self.name = name
+        self.rows = []
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self._loop = loop
+        self._future = loop.create_future()
+
+    async def wait(self):
+        remaining = max(0, self.deadline - time.monotonic())
+        try:
+            return await asyncio.wait_for(self._future, remaining)
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc((self.name,))
+            raise TimeoutError("%s超时" % self.name)
+
+    def resolve(self, error=None):
+        self._loop.call_soon_threadsafe(_resolveFuture, self._future, self.rows, error)
+
+
+class RequestRegistry:
+    '''
+    为每次请求分配单调递增的请求号，SPI回调按nRequestID把数据和完成状态路由到各自的请求
+    '''
+
+    def __init__(self, first_id=FIRST_REQUEST_ID):
+        self._ids = itertools.count(first_id)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def register(self, name, timeout=MAX_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pending = PendingRequest(next(self._ids), name, loop, timeout)
+            self._pending[pending.request_id] = pending
+        return pending
+
+    def append(self, request_id, row):
+        pending = self._pending.get(request_id)
+        if pending is None:
+            return False
+        pending.rows.append(row)
+        return True
+
+    def complete(self, request_id, error=None):
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+        if pending is None:
+            return False
+        REQUEST_SECONDS.observe(time.monotonic() - pending.started, (pending.name,))
+        pending.resolve(error)
+        return True
+
+    def discard(self, request_id):
+        '''
+        请求结束（包括超时和发送失败）后由SpiHelper.request移除，迟到的应答随之被忽略
+        '''
+        with self._lock:
+            self._pending.pop(request_id, None)
+
+
+def _resolveFuture(future, rows, error):
+    if future.done():
+        return
+    if error:
+        future.set_exception(RuntimeError(error))
+    else:
+        future.set_result(rows)
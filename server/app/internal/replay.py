@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from itertools import repeat
+
+import numpy as np
+
+from app.internal.recorder import TickReader, TICK_DIR, day_ms
+from app.internal.tick import Tick
+from app.internal.bus import TickBus
+from app.internal.bars import BarEngine
+from app.internal.store import QuoteStore
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK = 65536
+# 1x/Nx回放时行情时间中超过该秒数的空档（午休、夜盘与日盘之间）直接跳过
+MAX_GAP = 60
+# 每发布这么多个tick采样一次回放总线上各消费方的滞后
+LAG_SAMPLE = 256
+
+# 记录字段 -> CTP字段
+_SCALARS = (("last", "LastPrice"), ("open", "OpenPrice"), ("high", "HighestPrice"), ("low", "LowestPrice"),
+            ("close", "ClosePrice"), ("upper_limit", "UpperLimitPrice"), ("lower_limit", "LowerLimitPrice"),
+            ("settlement", "SettlementPrice"), ("pre_close", "PreClosePrice"),
+            ("pre_settlement", "PreSettlementPrice"), ("volume", "Volume"), ("turnover", "Turnover"),
+            ("open_interest", "OpenInterest"), ("pre_open_interest", "PreOpenInterest"))
+_LEVELS = tuple((name, tuple("%s%d" % (ctp, i) for i in range(1, 6))) for name, ctp in (
+    ("bid_price", "BidPrice"), ("bid_volume", "BidVolume"), ("ask_price", "AskPrice"), ("ask_volume", "AskVolume")))
+
+
+# 按DepthMarketDataField字段名还原的一条行情，交给Tick.update使用
+ReplayField = namedtuple("ReplayField", ("InstrumentID", "TradingDay", "ActionDay", "UpdateTime", "UpdateMillisec") +
+                         tuple(ctp for _, ctp in _SCALARS) + tuple(ctp for _, names in _LEVELS for ctp in names))
+
+
+class ReceiverStats:
+    def __init__(self, name, size):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.latency = np.zeros(size, dtype=np.int64)
+
+    def report(self):
+        latency = np.sort(self.latency[:self.calls]) / 1000
+        if not self.calls:
+            return {"calls": 0, "errors": self.errors}
+        return {"calls": self.calls, "errors": self.errors, "avg_us": round(float(latency.mean()), 2),
+                "p50_us": round(float(latency[self.calls // 2]), 2),
+                "p99_us": round(float(latency[min(self.calls - 1, int(self.calls * 0.99))]), 2),
+                "max_us": round(float(latency[-1]), 2)}
+
+
+class ReplayTarget:
+    '''
+    回放专用的最新行情、行情存储和总线，与实时行情完全隔离：不更新持仓盈亏，
+    不覆盖Client.quotes、/get_snapshot和/query_points使用的数据。instruments为None时不建行情存储。
+    总线上挂一个独立的K线引擎，与实时行情的K线走同样的订阅线程，用来压测下游消费方
+    '''
+
+    def __init__(self, classify, instruments=None):
+        self.quotes = {}
+        self.store = QuoteStore(instruments) if instruments is not None else None
+        self.bus = TickBus(classify)
+        self.bars = BarEngine(classify)
+        self.bus.subscribe("bars", self.bars.onTick)
+        self._published = 0
+        self._max_lag = {}
+
+    def onTick(self, tick):
+        self.quotes[tick.code] = tick
+        if self.store:
+            self.store.write(tick)
+        self.bus.publish(tick)
+        self._published += 1
+        if not self._published % LAG_SAMPLE:
+            for subscriber in self.bus.subscribers:
+                lag = subscriber.lag()
+                if lag > self._max_lag.get(subscriber.name, 0.0):
+                    self._max_lag[subscriber.name] = lag
+
+    def close(self):
+        '''
+        等各消费方处理完缓冲区中剩余的tick后关闭，返回它们的处理数、丢弃数、最大滞后和收尾耗时
+        '''
+        report = {}
+        for subscriber in self.bus.subscribers:
+            started = time.perf_counter()
+            self.bus.unsubscribe(subscriber)
+            report[subscriber.name] = {"delivered": subscriber.delivered, "dropped": subscriber.dropped,
+                                       "errors": subscriber.errors,
+                                       "max_lag_ms": round(self._max_lag.get(subscriber.name, 0.0) * 1000, 3),
+                                       "drain_ms": round((time.perf_counter() - started) * 1000, 3)}
+        return report
+
+
+class TickReplay:
+    '''
+    读取TickRecorder记录的行情，按(时间, 合约代码, 记录顺序)的确定顺序回放给接收函数。
+    接收函数与QuoteImpl.setReceiver的一致，参数为按合约原地更新的Tick记录。
+    speed为回放倍速，None表示不等待、尽快回放。
+    '''
+
+    def __init__(self, trading_days, codes=None, speed=1.0, base_dir=TICK_DIR):
+        self.trading_days = sorted(trading_days)
+        self.codes = set(codes) if codes else None
+        if speed is not None and speed <= 0:
+            raise ValueError("回放速度必须大于0")
+        self.speed = speed
+        self._base_dir = base_dir
+        self._stop = threading.Event()
+        self.ticks = {}
+
+    def stop(self):
+        self._stop.set()
+
+    def _load(self, trading_day):
+        '''
+        返回(reader, 代码数组, 按回放顺序排列的合约序号, 记录序号)
+        '''
+        if not os.path.exists(os.path.join(self._base_dir, trading_day, "index.json")):
+            raise ValueError("交易日<%s>没有行情记录" % trading_day)
+        reader = TickReader(trading_day, self._base_dir)
+        codes = sorted(code for code in reader.codes if self.codes is None or code in self.codes)
+        positions = [reader.positions(code) for code in codes]
+        sources = [np.full(len(p), i, dtype=np.int32) for i, p in enumerate(positions)]
+        if not positions:
+            return reader, codes, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+        positions = np.concatenate(positions)
+        sources = np.concatenate(sources)
+        order = np.lexsort((positions, sources, reader.data["ts"][positions]))
+        return reader, codes, sources[order], positions[order]
+
+    def run(self, receivers):
+        '''
+        同步执行回放，返回吞吐报告；receivers为接收函数列表或{名称: 接收函数}
+        '''
+        if not isinstance(receivers, dict):
+            receivers = {getattr(r, "__qualname__", repr(r)): r for r in receivers}
+        days = [self._load(day) for day in self.trading_days]
+        total = sum(len(positions) for _, _, _, positions in days)
+        stats = [ReceiverStats(name, total) for name in receivers]
+        targets = list(zip(receivers.values(), stats))
+        self._stop.clear()
+        self.replayed = 0
+        self.max_lag = 0.0
+        started = time.perf_counter()
+        for reader, codes, sources, positions in days:
+            self._replayDay(reader, codes, sources, positions, targets)
+            if self._stop.is_set():
+                break
+        elapsed = time.perf_counter() - started
+        report = {"trading_days": self.trading_days, "speed": self.speed or "max", "ticks": self.replayed,
+                  "elapsed": round(elapsed, 3),
+                  "ticks_per_sec": round(self.replayed / elapsed, 1) if elapsed else 0.0,
+                  "max_lag_ms": round(self.max_lag * 1000, 3),
+                  "receivers": {s.name: s.report() for s in stats}}
+        logger.info("回放完成: %s" % report)
+        return report
+
+    def _replayDay(self, reader, codes, sources, positions, targets):
+        trading_day = reader.trading_day
+        base = day_ms(trading_day)
+        prev_day = time.strftime("%Y%m%d", time.gmtime(base / 1000 - 86400))
+        ticks = [self.ticks.setdefault(code, Tick(code)) for code in codes]
+        names = np.array(codes, dtype=object)
+        origin = None
+        wall = time.perf_counter()
+        last_ts = None
+        for i in range(0, len(positions), CHUNK):
+            chunk = sources[i: i + CHUNK]
+            rows = reader.data[positions[i: i + CHUNK]]
+            stamps = rows["ts"]
+            # 同一秒的行情共用一次时间字符串转换；夜盘记录的时间戳在交易日之前
+            seconds, inverse = np.unique((stamps - base) // 1000, return_inverse=True)
+            clock = [(prev_day, second + 86400) if second < 0 else (trading_day, second) for second in seconds.tolist()]
+            action_days = np.array([day for day, _ in clock], dtype=object)[inverse].tolist()
+            update_times = np.array(["%02d:%02d:%02d" % (t // 3600, t // 60 % 60, t % 60) for _, t in clock],
+                                    dtype=object)[inverse].tolist()
+            columns = [names[chunk].tolist(), repeat(trading_day), action_days, update_times,
+                       ((stamps - base) % 1000).tolist()]
+            columns += [rows[name].tolist() for name, _ in _SCALARS]
+            columns += [rows[name][:, level].tolist() for name, _ in _LEVELS for level in range(5)]
+            for source, ts, field in zip(chunk.tolist(), stamps.tolist(), map(ReplayField._make, zip(*columns))):
+                if self._stop.is_set():
+                    return
+                if self.speed is not None:
+                    if origin is None:
+                        origin = ts
+                    elif ts - last_ts > MAX_GAP * 1000:
+                        origin += ts - last_ts - MAX_GAP * 1000
+                    last_ts = ts
+                    delay = wall + (ts - origin) / 1000 / self.speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    elif -delay > self.max_lag:
+                        self.max_lag = -delay
+                tick = ticks[source]
+                tick.update(field)
+                self.replayed += 1
+                for receiver, stat in targets:
+                    begin = time.perf_counter_ns()
+                    try:
+                        receiver(tick)
+                    except Exception as e:
+                        stat.errors += 1
+                        logger.error("回放接收函数%s出错: %s" % (stat.name, e))
+                    stat.latency[stat.calls] = time.perf_counter_ns() - begin
+                    stat.calls += 1
@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+from app.internal.constants import QUERY_RATE, QUERY_BURST
+
+
+# 数值越小越优先：下单前的持仓刷新优先于资金，资金优先于报单/成交，合约查询最后
+PRIORITY_POSITION = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_ORDER = 2
+PRIORITY_INSTRUMENT = 3
+
+
+class TokenBucket:
+    '''
+    令牌桶，rate为每秒补充的令牌数，burst为桶容量
+    '''
+
+    def __init__(self, rate=QUERY_RATE, burst=QUERY_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._stamp = clock()
+
+    def reserve(self):
+        '''
+        预约一个令牌，返回需要等待的秒数；令牌可以透支，后续预约依次排在后面
+        '''
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        self._tokens -= 1
+        return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class _Job:
+    def __init__(self, key, priority, factory, future, enqueued):
+        self.key = key
+        self.priority = priority
+        self.factory = factory
+        self.future = future
+        self.enqueued = enqueued
+
+
+class QueryScheduler:
+    '''
+    统一管理CTP查询流控：按优先级排队、令牌桶限速、相同查询合并为一次请求
+    '''
+
+    def __init__(self, rate=QUERY_RATE, burst=QUERY_BURST, clock=time.monotonic, sleep=asyncio.sleep):
+        self._bucket = TokenBucket(rate, burst, clock)
+        self._clock = clock
+        self._sleep = sleep
+        self._seq = itertools.count()
+        self._queue = []
+        self._jobs = {}
+        self._dispatcher = None
+        self._in_flight = 0
+        self._dispatched = 0
+        self._coalesced = 0
+        self._waits = deque(maxlen=1000)
+
+    def reserve(self):
+        '''
+        供事件循环之外的同步查询（如登录时的合约查询）占用流控额度
+        '''
+        return self._bucket.reserve()
+
+    async def submit(self, key, priority, factory):
+        '''
+        factory返回发送查询并等待结果的协程；key相同且尚未完成的查询共享同一结果
+        '''
+        job = self._jobs.get(key)
+        if job is None:
+            future = asyncio.get_running_loop().create_future()
+            # 等待方都已取消时失败结果无人读取，取走异常避免"exception was never retrieved"
+            future.add_done_callback(_retrieve)
+            job = _Job(key, priority, factory, future, self._clock())
+            self._jobs[key] = job
+            heapq.heappush(self._queue, (priority, next(self._seq), job))
+            if self._dispatcher is None or self._dispatcher.done():
+                self._dispatcher = asyncio.ensure_future(self._dispatch())
+        else:
+            self._coalesced += 1
+        return await asyncio.shield(job.future)
+
+    async def _dispatch(self):
+        while self._queue:
+            delay = self._bucket.reserve()
+            if delay > 0:
+                await self._sleep(delay)
+            # 等待令牌期间到达的高优先级查询可以插队
+            _, _, job = heapq.heappop(self._queue)
+            self._waits.append(self._clock() - job.enqueued)
+            self._dispatched += 1
+            self._in_flight += 1
+            asyncio.ensure_future(self._run(job))
+
+    async def _run(self, job):
+        try:
+            job.future.set_result(await job.factory())
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            job.future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            self._jobs.pop(job.key, None)
+
+    def stats(self):
+        waits = sorted(self._waits)
+        return {"queue_depth": len(self._queue), "in_flight": self._in_flight,
+                "dispatched": self._dispatched, "coalesced": self._coalesced,
+                "wait_avg": round(sum(waits) / len(waits), 3) if waits else 0,
+                "wait_p99": round(percentile(waits, 0.99), 3),
+                "wait_max": round(waits[-1], 3) if waits else 0}
+
+
+def _retrieve(future):
+    if not future.cancelled():
+        future.exception()
+
+
+def percentile(values, q):
+    '''
+    values需已排序
+    '''
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * q))]
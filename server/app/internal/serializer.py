@@ -0,0 +1,146 @@
+import json
+import math
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+import numpy as np
+
+
+# 按orjson、ujson、标准库json的顺序选用可用的编码器
+BACKEND = "orjson" if orjson else "ujson" if ujson else "json"
+SHARED_CACHE_SIZE = 64
+
+
+def _sanitize(obj):
+    '''
+    NaN、正负无穷转换为None，与FILTER把无效价格转为None的处理一致；NumPy类型转换为Python类型
+    '''
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _sanitize(obj.tolist())
+    if isinstance(obj, np.generic):
+        return _sanitize(obj.item())
+    return obj
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return _sanitize(obj.tolist())
+    if isinstance(obj, np.generic):
+        return _sanitize(obj.item())
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError("无法序列化类型<%s>" % type(obj).__name__)
+
+
+if orjson:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _encode(obj):
+        # orjson把NaN、无穷编码为null
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+elif ujson:
+    def _encode(obj):
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, allow_nan=False).encode()
+        except (OverflowError, ValueError, TypeError):
+            return ujson.dumps(_sanitize(obj), ensure_ascii=False, escape_forward_slashes=False,
+                               default=_default).encode()
+else:
+    def _encode(obj):
+        try:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False,
+                              default=_default).encode()
+        except ValueError:
+            return json.dumps(_sanitize(obj), ensure_ascii=False, separators=(",", ":"),
+                              default=_default).encode()
+
+
+class _SharedCache:
+    '''
+    只读共享对象（行情字典、报单/持仓快照）的编码结果，按对象身份缓存；持有对象引用，避免id被复用
+    '''
+
+    def __init__(self, size=SHARED_CACHE_SIZE):
+        self._size = size
+        self._entries = OrderedDict()
+        # 共享对象的id集合，用于快速判断一个容器中是否有共享对象
+        self.ids = frozenset()
+        self._lock = threading.Lock()
+
+    def share(self, obj):
+        with self._lock:
+            if id(obj) not in self._entries:
+                self._entries[id(obj)] = [obj, None]
+                if len(self._entries) > self._size:
+                    self._entries.popitem(last=False)
+                self.ids = frozenset(self._entries)
+        return obj
+
+    def get(self, obj):
+        entry = self._entries.get(id(obj))
+        if entry is None or entry[0] is not obj:
+            return None
+        if entry[1] is None:
+            entry[1] = _encode(obj)
+        return entry[1]
+
+
+_shared = _SharedCache()
+
+
+def share(obj):
+    '''
+    标记obj为只读共享对象，之后作为响应的顶层或第一层元素时只编码一次
+    '''
+    return _shared.share(obj)
+
+
+def dumpb(obj):
+    '''
+    编码为UTF-8 JSON字节；对列表、元组、字典的第一层元素使用共享对象的缓存
+    '''
+    ids = _shared.ids
+    if not ids:
+        return _encode(obj)
+    if id(obj) in ids:
+        cached = _shared.get(obj)
+        if cached is not None:
+            return cached
+    if isinstance(obj, (list, tuple)):
+        if not ids.isdisjoint(map(id, obj)):
+            return b"[" + b",".join(_shared.get(item) or _encode(item) for item in obj) + b"]"
+    elif isinstance(obj, dict):
+        if not ids.isdisjoint(map(id, obj.values())):
+            return b"{" + b",".join(_encode(str(key)) + b":" + (_shared.get(value) or _encode(value))
+                                    for key, value in obj.items()) + b"}"
+    return _encode(obj)
+
+
+def dumps(obj, **kwargs):
+    '''
+    供Sanic的response.json使用；路由中传入的ensure_ascii等参数忽略，始终输出未转义的UTF-8。
+    返回bytes，Sanic会直接作为响应体
+    '''
+    return dumpb(obj)
+
+
+def dumpText(obj):
+    '''
+    WebSocket文本帧需要str
+    '''
+    return dumpb(obj).decode()
@@ -0,0 +1,74 @@
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRegistry:
+    '''
+    一个进程内托管多个账户：第一个加入的账户持有行情会话、合约表和行情存储，
+    其他账户以market=该账户构造Client，共用这些数据，各自只有交易会话和查询、报单流控
+    '''
+
+    def __init__(self):
+        self._clients = {}
+        self.default = None
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __iter__(self):
+        return iter(self._clients.values())
+
+    def add(self, client):
+        if client.user_id in self._clients:
+            raise ValueError("账户<%s>重复" % client.user_id)
+        if self.default is None:
+            self.default = client
+        elif client._market is not self.default:
+            raise ValueError("账户<%s>需共用行情账户<%s>" % (client.user_id, self.default.user_id))
+        self._clients[client.user_id] = client
+        return client
+
+    def get(self, account=None):
+        '''
+        按账户取Client，未指定时为默认账户（行情账户）
+        '''
+        if not account:
+            return self.default
+        client = self._clients.get(account)
+        if client is None:
+            raise ValueError("账户<%s>不存在" % account)
+        return client
+
+    def login(self, account=None):
+        '''
+        登录指定账户，或按加入顺序登录全部账户（行情账户最先）；
+        返回{账户: 错误信息}，全部成功时为空。行情账户登录失败时直接抛出
+        '''
+        if account:
+            self.get(account).login()
+            return {}
+        errors = {}
+        for user_id, client in self._clients.items():
+            try:
+                client.login()
+            except Exception as e:
+                if client is self.default:
+                    raise
+                logger.error("账户<%s>登录失败: %r", user_id, e)
+                errors[user_id] = str(e)
+        return errors
+
+    def logout(self, account=None):
+        '''
+        登出指定账户或全部账户，行情账户最后登出
+        '''
+        clients = [self.get(account)] if account else list(self._clients.values())[::-1]
+        for client in clients:
+            if client._td:
+                client.logout()
+
+    def accounts(self):
+        return [{"account": client.user_id, "market": client.ownsMarket, "logged_in": client._td is not None}
+                for client in self._clients.values()]
@@ -0,0 +1,356 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from app.internal.store import QuoteStore, ROW, WIDTH
+from app.internal.serializer import dumpb
+from app.internal.constants import SHARED_BLOB_SIZE, SHARED_PUBLISH_INTERVAL, SEQLOCK_RETRIES
+
+
+logger = logging.getLogger(__name__)
+
+# 版本号(uint64) + 数据长度(uint64)；版本号为奇数表示正在写入
+HEADER = struct.Struct("=QQ")
+KINDS = ("position", "account", "orders", "trades")
+
+
+def segmentName(prefix, name):
+    return "%s_%s" % (prefix, name)
+
+
+def _create(name, size):
+    '''
+    创建命名共享内存；同名的段是上次异常退出时遗留的，先解除再创建
+    '''
+    try:
+        return SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        stale = SharedMemory(name=name)
+        stale.unlink()
+        stale.close()
+        return SharedMemory(name=name, create=True, size=size)
+
+
+def _attach(name):
+    '''
+    worker只读挂载owner创建的段；不能登记到resource_tracker，否则worker退出时会把段解除
+    '''
+    shm = SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# 顺序锁依赖写入方的存储按程序顺序对读取方可见、读取方的读取不乱序，x86（TSO）上成立；
+# 其他架构需要在版本号与数据之间加内存屏障
+class SharedBlob:
+    '''
+    一段带版本号的共享内存：单个写入方整块替换数据，多个读取方无锁读取，读到写入中或被覆盖的数据时重读
+    '''
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self._owner = owner
+        self._header = np.ndarray((2,), dtype=np.uint64, buffer=shm.buf)
+        self.capacity = shm.size - HEADER.size
+
+    @classmethod
+    def create(cls, name, size=SHARED_BLOB_SIZE):
+        return cls(_create(name, HEADER.size + size), True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name), False)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def version(self):
+        return int(self._header[0])
+
+    def write(self, data):
+        '''
+        写入一份完整数据，超出容量时抛出ValueError且保留原数据
+        '''
+        if len(data) > self.capacity:
+            raise ValueError("共享内存<%s>容量%d字节，数据%d字节" % (self.name, self.capacity, len(data)))
+        header = self._header
+        header[0] += 1
+        self._shm.buf[HEADER.size:HEADER.size + len(data)] = data
+        header[1] = len(data)
+        header[0] += 1
+
+    def clear(self):
+        '''
+        标记为无数据，读取方回退到owner进程
+        '''
+        self.write(b"")
+
+    def read(self):
+        '''
+        返回(版本号, 数据)；从未写入或已清空时数据为None
+        '''
+        header = self._header
+        buf = self._shm.buf
+        for _ in range(SEQLOCK_RETRIES):
+            version = int(header[0])
+            if version & 1:
+                continue
+            length = int(header[1])
+            data = bytes(buf[HEADER.size:HEADER.size + length])
+            if int(header[0]) == version:
+                return version, data or None
+        raise RuntimeError("共享内存<%s>读取冲突" % self.name)
+
+    def close(self):
+        self._header = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # 仍有请求持有视图，由垃圾回收关闭
+            pass
+        if self._owner:
+            self._shm.unlink()
+
+
+class SharedQuoteStore(QuoteStore):
+    '''
+    owner进程的行情存储：数组放在命名共享内存中，每行一个版本号，写入前后各加一，
+    worker按版本号判断读到的行是否完整
+    '''
+
+    def __init__(self, instruments, name):
+        super().__init__(instruments)
+        rows = len(self.codes)
+        self._shm = _create(name, max(1, rows * (ROW.size + 8)))
+        self._values = np.ndarray((rows, WIDTH), buffer=self._shm.buf)
+        self._buffer = memoryview(self._values).cast("B")
+        self._versions = np.ndarray((rows,), dtype=np.int64, buffer=self._shm.buf, offset=rows * ROW.size)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def write(self, tick):
+        row = self._index.get(tick.code)
+        if row is None:
+            return
+        versions = self._versions
+        versions[row] += 1
+        super().write(tick)
+        versions[row] += 1
+
+    def unlink(self):
+        '''
+        重新登录后旧的一代不再写入：解除命名，已挂载的worker读完后各自释放
+        '''
+        self._shm.unlink()
+
+
+class QuoteView(QuoteStore):
+    '''
+    worker进程中owner行情存储的只读视图，接口与QuoteStore相同；索引来自owner发布的index
+    '''
+
+    def __init__(self, quotes):
+        self.codes = np.array(quotes["codes"], dtype=object)
+        self._index = {code: row for row, code in enumerate(quotes["codes"])}
+        self.exchange = np.array(quotes["exchange"], dtype="U8")
+        self.product = np.array(quotes["product"], dtype="U8")
+        rows = len(self.codes)
+        self._shm = _attach(quotes["name"])
+        self._values = np.ndarray((rows, WIDTH), buffer=self._shm.buf)
+        self._versions = np.ndarray((rows,), dtype=np.int64, buffer=self._shm.buf, offset=rows * ROW.size)
+        self.name = quotes["name"]
+
+    def write(self, tick):
+        raise RuntimeError("行情共享内存只能由owner进程写入")
+
+    def rows(self, rows):
+        '''
+        向量化的顺序锁读取：整批拷贝后只重读写入中或前后版本不一致的行
+        '''
+        versions = self._versions
+        before = versions[rows]
+        values = self._values[rows]
+        torn = np.flatnonzero((before != versions[rows]) | (before & 1).astype(bool))
+        for _ in range(SEQLOCK_RETRIES):
+            if not len(torn):
+                return values
+            retry = rows[torn]
+            before = versions[retry]
+            values[torn] = self._values[retry]
+            torn = torn[(before != versions[retry]) | (before & 1).astype(bool)]
+        raise RuntimeError("行情共享内存读取冲突")
+
+
+class SharedState:
+    '''
+    owner进程：行情存储放在共享内存中，并定时把各账户已初始化的持仓、资金、报单、成交发布到共享内存。
+    索引段（index）记录行情段名称、合约列及账户列表，worker据此挂载
+    '''
+
+    def __init__(self, prefix, sessions, size=SHARED_BLOB_SIZE, interval=SHARED_PUBLISH_INTERVAL):
+        self.prefix = prefix
+        self.interval = interval
+        self._sessions = sessions
+        self._size = size
+        self._generation = 0
+        self._store = None
+        # 首次发布时创建：Sanic的主进程也会导入本模块，共享内存只应由处理请求的进程创建
+        self._index = None
+        self._blobs = {}
+        # (类型, 账户序号) -> (快照对象, 更新时间, 编码结果)，未变化时跳过编码和写入
+        self._published = {}
+        self._logged_in = None
+        # 索引在登录线程和事件循环中都会发布，顺序锁只允许一个写入方
+        self._lock = threading.Lock()
+
+    def quoteStore(self, instruments):
+        '''
+        行情账户登录时调用：新建一代共享内存行情存储，发布索引后解除上一代
+        '''
+        self._generation += 1
+        store = SharedQuoteStore(instruments, segmentName(self.prefix, "quotes%d" % self._generation))
+        previous, self._store = self._store, store
+        self.publishIndex()
+        if previous:
+            previous.unlink()
+        return store
+
+    def publishIndex(self):
+        with self._lock:
+            if self._index is None:
+                self._index = SharedBlob.create(segmentName(self.prefix, "index"), self._size)
+            clients = list(self._sessions)
+            self._logged_in = [client._td is not None for client in clients]
+            store = self._store
+            quotes = None
+            if store is not None:
+                quotes = {"name": store.name, "codes": store.codes.tolist(), "exchange": store.exchange.tolist(),
+                          "product": store.product.tolist()}
+            self._index.write(dumpb({"pid": os.getpid(), "generation": self._generation, "quotes": quotes,
+                                     "accounts": [client.user_id for client in clients],
+                                     "logged_in": self._logged_in}))
+
+    def publish(self):
+        '''
+        发布一轮；对象和更新时间都未变化的快照不重新编码，编码结果未变化的不重新写入
+        '''
+        clients = list(self._sessions)
+        if [client._td is not None for client in clients] != self._logged_in:
+            self.publishIndex()
+        for i, client in enumerate(clients):
+            state = client.sharedState()
+            for kind in KINDS:
+                data = state.get(kind)
+                key = (kind, i)
+                last = self._published.get(key)
+                if data is None:
+                    if last is not None:
+                        self._blobs[key].clear()
+                        del self._published[key]
+                    continue
+                if last is not None and last[0] is data[0] and last[1] == data[1]:
+                    continue
+                payload = dumpb(data)
+                if last is None or last[2] != payload:
+                    self._write(key, payload)
+                self._published[key] = (data[0], data[1], payload)
+
+    def _write(self, key, payload):
+        blob = self._blobs.get(key)
+        if blob is None:
+            blob = self._blobs[key] = SharedBlob.create(segmentName(self.prefix, "%s_%d" % key), self._size)
+        try:
+            blob.write(payload)
+        except ValueError as e:
+            logger.warning("发布%s失败，worker将转发到owner: %s", key, e)
+            blob.clear()
+
+    async def run(self):
+        while True:
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"publish shared state error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def close(self):
+        for blob in self._blobs.values():
+            blob.close()
+        self._blobs = {}
+        self._published = {}
+        if self._store is not None:
+            self._store.unlink()
+            self._store = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+class SharedReader:
+    '''
+    worker进程：按owner发布的索引挂载行情段和账户快照段，索引版本变化时重新挂载
+    '''
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._index_blob = None
+        self._version = None
+        self._meta = None
+        self._quotes = None
+        self._blobs = {}
+
+    def _refresh(self):
+        if self._index_blob is None:
+            try:
+                self._index_blob = SharedBlob.attach(segmentName(self.prefix, "index"))
+            except FileNotFoundError:
+                return None
+        if self._index_blob.version() != self._version:
+            version, data = self._index_blob.read()
+            meta = json.loads(data) if data else None
+            quotes = meta and meta["quotes"]
+            if quotes is None:
+                self._quotes = None
+            elif self._quotes is None or self._quotes.name != quotes["name"]:
+                self._quotes = QuoteView(quotes)
+            self._meta, self._version = meta, version
+        return self._meta
+
+    def quotes(self):
+        '''
+        行情账户已登录时返回QuoteView，否则为None
+        '''
+        meta = self._refresh()
+        if not meta or not meta["logged_in"] or not meta["logged_in"][0]:
+            return None
+        return self._quotes
+
+    def state(self, kind, account=None):
+        '''
+        账户快照的JSON字节，未发布或账户不存在时为None
+        '''
+        meta = self._refresh()
+        if not meta:
+            return None
+        accounts = meta["accounts"]
+        i = accounts.index(account) if account in accounts else None if account else 0
+        if i is None or i >= len(accounts) or not meta["logged_in"][i]:
+            return None
+        key = (kind, i)
+        blob = self._blobs.get(key)
+        if blob is None:
+            try:
+                blob = self._blobs[key] = SharedBlob.attach(segmentName(self.prefix, "%s_%d" % key))
+            except FileNotFoundError:
+                return None
+        return blob.read()[1]
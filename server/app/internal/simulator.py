@@ -0,0 +1,695 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import ctpwrapper.ApiStructure as CTPStruct
+
+from app.internal.constants import DATA_DIR
+from app.internal.quote import QuoteImpl
+from app.internal.trade import TraderImpl
+
+
+logger = logging.getLogger(__name__)
+
+SIM_DIR = DATA_DIR + "sim/"
+# 模拟前置的默认参数，account.yaml中simulator下的同名键覆盖
+SIM_OPTIONS = {
+    "futures": 120,         # 期货合约数
+    "options": 10,          # 每个期货合约上的期权行权价档数（认购、认沽各一个），0为不生成期权
+    "rtt": 0.002,           # 报单、撤单的往返时延（秒）
+    "query_delay": 0.01,    # 查询从发出到第一条回报的时延（秒）
+    "row_delay": 0.0,       # 查询回报相邻两条之间的间隔（秒）
+    "query_limit": 0,       # 每秒允许的查询数，超过时返回-3，0为不限制
+    "positions": 10,        # 登录时已有的持仓合约数
+    "orders": 20,           # 登录时已有的未成交报单数
+    "trades": 20,           # 登录时已有的成交数
+    "tick_rate": 2.0,       # 每个已订阅合约每秒的tick数
+    "balance": 10000000.0,  # 初始权益
+    "seed": 1,
+}
+EXCHANGES = ("SHFE", "DCE", "CZCE", "CFFEX", "INE", "GFEX")
+MARGIN_RATIO = 0.1
+LIMIT_RATIO = 0.07
+INSTRUMENT_NAME_BYTES = 20
+# CTP以DBL_MAX表示无效价格
+DBL_MAX = sys.float_info.max
+
+
+def _name(prefix, code):
+    '''
+    InstrumentName最多20字节（另有结尾的\\0），加上前缀超长时只用合约代码
+    '''
+    name = prefix + code
+    return name if len(name.encode("gbk")) <= INSTRUMENT_NAME_BYTES else code
+
+
+def _struct(cls, values):
+    '''
+    ctpwrapper把str按UTF-8写入、按GBK读出；与真实前置一致，中文字段以GBK字节传入
+    '''
+    return cls(**{k: v.encode("gbk") if isinstance(v, str) else v for k, v in values.items()})
+
+
+def _now():
+    return time.strftime("%H:%M:%S")
+
+
+def _ok():
+    return CTPStruct.RspInfoField(ErrorID=0, ErrorMsg="")
+
+
+def _error(error_id, message):
+    return CTPStruct.RspInfoField(ErrorID=error_id, ErrorMsg=message.encode("gbk"))
+
+
+class _Dispatcher:
+    '''
+    回调线程：按到期时间依次执行回调，相当于CTP API内部的回调线程
+    '''
+
+    def __init__(self, name):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def later(self, delay, callback, *args):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), callback, args))
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if not self._running:
+                    return
+                _, _, callback, args = heapq.heappop(self._heap)
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.exception("模拟回调<%s>出错: %s" % (getattr(callback, "__name__", callback), e))
+
+
+class _Account:
+    '''
+    模拟柜台上一个投资者的报单、成交、持仓与资金
+    '''
+
+    def __init__(self, investor_id, balance):
+        self.investor_id = investor_id
+        self.balance = balance
+        self.close_profit = 0.0
+        self.orders = {}
+        self.trades = []
+        # (合约, PosiDirection) -> {"volume", "cost", "yd"}
+        self.positions = {}
+        self.sessions = set()
+
+
+class SimExchange:
+    '''
+    模拟前置背后的柜台与交易所：生成合约，按随机游走产生行情，撮合报单并维护持仓和资金。
+    同一进程中的行情、交易会话共享一个实例
+    '''
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, options=None):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(options)
+            return cls._shared
+
+    def __init__(self, options=None):
+        self.options = dict(SIM_OPTIONS, **(options or {}))
+        self._random = random.Random(self.options["seed"])
+        self._lock = threading.RLock()
+        self._sys_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._sessions = itertools.count(1)
+        self._queries = []
+        self.trading_day = time.strftime("%Y%m%d")
+        self.instruments = {}
+        self._prices = {}
+        self._build()
+        self._accounts = {}
+        self._md_apis = {}
+        self._resting = {}
+        self._market = threading.Thread(target=self._runMarket, name="sim-market", daemon=True)
+        self._market.start()
+
+    def _build(self):
+        rnd = self._random
+        expire = time.strftime("%Y%m%d", time.localtime(time.time() + 60 * 86400))
+        for i in range(self.options["futures"]):
+            product = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(2))
+            code = "%s%s%02d" % (product, time.strftime("%y"), i % 12 + 1)
+            while code in self.instruments:
+                code = code[:2] + "x" + code[2:]
+            exchange = EXCHANGES[i % len(EXCHANGES)]
+            price = float(rnd.randrange(1000, 6000))
+            self._addInstrument(code, _name("模拟期货", code), exchange, 10, 1.0, expire, price)
+            step = max(1.0, round(price * 0.02))
+            for k in range(self.options["options"]):
+                strike = price + (k - self.options["options"] // 2) * step
+                for option_type in ("C", "P"):
+                    symbol = "%s%s%d" % (code, option_type, strike)
+                    self._addInstrument(symbol, _name("模拟期权", symbol), exchange, 10, 0.5, expire,
+                                        max(0.5, round(abs(price - strike) * 0.5 + step)), option_type, strike)
+
+    def _addInstrument(self, code, name, exchange, multiple, price_tick, expire, price, option_type=None,
+                       strike=0.0):
+        self.instruments[code] = {
+            "InstrumentID": code, "InstrumentName": name, "ExchangeID": exchange, "VolumeMultiple": multiple,
+            "PriceTick": price_tick, "ExpireDate": expire, "IsTrading": 1,
+            "LongMarginRatio": MARGIN_RATIO if option_type is None else DBL_MAX,
+            "ShortMarginRatio": MARGIN_RATIO if option_type is None else DBL_MAX,
+            "ProductClass": '1' if option_type is None else '2',
+            "OptionsType": {"C": '1', "P": '2'}.get(option_type, '0'),
+            "StrikePrice": strike if option_type else DBL_MAX,
+            # 单字符字段不能为空：上市、综合持仓、使用历史持仓、大边单边保证金、非组合
+            "InstLifePhase": '1', "PositionType": '2', "PositionDateType": '1', "MaxMarginSideAlgorithm": '1',
+            "CombinationType": '0'}
+        band = max(price_tick, round(price * LIMIT_RATIO / price_tick) * price_tick)
+        self._prices[code] = {"last": price, "pre_settlement": price, "open": price, "high": price, "low": price,
+                              "upper": price + band, "lower": max(price_tick, price - band), "volume": 0,
+                              "turnover": 0.0, "open_interest": 10000.0, "tick": price_tick}
+
+    # ---- 查询与会话 ----
+
+    def newSession(self):
+        return next(self._sessions)
+
+    def allowQuery(self):
+        '''
+        按query_limit模拟CTP的查询流控，超出时请求返回-3
+        '''
+        limit = self.options["query_limit"]
+        if not limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            self._queries = [t for t in self._queries if now - t < 1]
+            if len(self._queries) >= limit:
+                return False
+            self._queries.append(now)
+            return True
+
+    def account(self, investor_id, session=None):
+        with self._lock:
+            account = self._accounts.get(investor_id)
+            if account is None:
+                account = self._accounts[investor_id] = _Account(investor_id, self.options["balance"])
+                self._seedAccount(account)
+            if session is not None:
+                account.sessions.add(session)
+            return account
+
+    def _seedAccount(self, account):
+        rnd = random.Random("%s:%s" % (self.options["seed"], account.investor_id))
+        futures = [code for code, i in self.instruments.items() if i["ProductClass"] == '1']
+        for code in rnd.sample(futures, min(self.options["positions"], len(futures))):
+            direction = rnd.choice(('2', '3'))
+            volume = rnd.randrange(1, 6)
+            price = self._prices[code]["pre_settlement"]
+            account.positions[(code, direction)] = {"volume": volume, "yd": volume,
+                                                    "cost": price * volume * self._multiple(code)}
+        for _ in range(self.options["orders"]):
+            code = rnd.choice(futures)
+            prices = self._prices[code]
+            direction = rnd.choice(('0', '1'))
+            price = prices["lower"] if direction == '0' else prices["upper"]
+            order = self._newOrder(account, None, code, direction, '0', price, rnd.randrange(1, 6), '3', '2')
+            order.update(OrderSysID=self._sysId(), OrderSubmitStatus='3', OrderStatus='3', StatusMsg="未成交")
+            self._resting.setdefault(code, []).append(order)
+        for _ in range(self.options["trades"]):
+            code = rnd.choice(futures)
+            self._newTrade(account, {"InstrumentID": code, "ExchangeID": self.instruments[code]["ExchangeID"],
+                                     "OrderRef": "", "OrderSysID": self._sysId(), "Direction": rnd.choice(('0', '1')),
+                                     "CombOffsetFlag": '0'}, self._prices[code]["pre_settlement"], 1)
+
+    def _multiple(self, code):
+        return self.instruments[code]["VolumeMultiple"]
+
+    def _sysId(self):
+        return "%12d" % next(self._sys_ids)
+
+    def orderFields(self, investor_id):
+        with self._lock:
+            return [_struct(CTPStruct.OrderField, order) for order in self.account(investor_id).orders.values()]
+
+    def tradeFields(self, investor_id):
+        with self._lock:
+            return [_struct(CTPStruct.TradeField, trade) for trade in self.account(investor_id).trades]
+
+    def positionFields(self, investor_id):
+        with self._lock:
+            rows = []
+            for (code, direction), position in self.account(investor_id).positions.items():
+                if not position["volume"]:
+                    continue
+                volume, multiple = position["volume"], self._multiple(code)
+                last = self._prices[code]["last"]
+                sign = 1 if direction == '2' else -1
+                rows.append(CTPStruct.InvestorPositionField(
+                    InstrumentID=code, ExchangeID=self.instruments[code]["ExchangeID"], PosiDirection=direction,
+                    HedgeFlag='1', PositionDate='1', YdPosition=position["yd"], Position=volume,
+                    TodayPosition=volume - min(volume, position["yd"]), OpenVolume=0, CloseVolume=0,
+                    OpenCost=position["cost"], PositionCost=position["cost"],
+                    UseMargin=last * volume * multiple * MARGIN_RATIO,
+                    PositionProfit=sign * (last * volume * multiple - position["cost"]),
+                    SettlementPrice=self._prices[code]["pre_settlement"], TradingDay=self.trading_day))
+            return rows
+
+    def accountField(self, investor_id):
+        with self._lock:
+            account = self.account(investor_id)
+            margin, profit = 0.0, 0.0
+            for (code, direction), position in account.positions.items():
+                value = self._prices[code]["last"] * position["volume"] * self._multiple(code)
+                margin += value * MARGIN_RATIO
+                profit += (value - position["cost"]) * (1 if direction == '2' else -1)
+            balance = account.balance + account.close_profit + profit
+            return CTPStruct.TradingAccountField(AccountID=investor_id, Balance=balance, CurrMargin=margin,
+                                                 Available=balance - margin, PositionProfit=profit,
+                                                 CloseProfit=account.close_profit, CurrencyID="CNY", BizType='1',
+                                                 TradingDay=self.trading_day)
+
+    # ---- 报单撮合 ----
+
+    def _newOrder(self, account, session, code, direction, offset_flag, price, volume, time_cond, price_type,
+                  order_ref="", volume_cond='1', min_volume=1):
+        front_id, session_id = session if session else (0, 0)
+        order = {"BrokerID": "", "InvestorID": account.investor_id, "InstrumentID": code,
+                 "ExchangeID": self.instruments[code]["ExchangeID"], "OrderRef": order_ref, "FrontID": front_id,
+                 "SessionID": session_id, "OrderSysID": "", "Direction": direction, "CombOffsetFlag": offset_flag,
+                 "CombHedgeFlag": '1', "LimitPrice": price, "VolumeTotalOriginal": volume, "VolumeTraded": 0,
+                 "VolumeTotal": volume, "MinVolume": min_volume, "TimeCondition": time_cond,
+                 "VolumeCondition": volume_cond, "OrderPriceType": price_type, "OrderStatus": 'a',
+                 "OrderSubmitStatus": '0', "ContingentCondition": '1', "ForceCloseReason": '0',
+                 "OrderSource": '0', "OrderType": '0', "StatusMsg": "报单已提交", "InsertDate": self.trading_day,
+                 "InsertTime": _now(), "ActiveTime": "", "UpdateTime": "", "CancelTime": "",
+                 "TradingDay": self.trading_day}
+        if session is None:
+            account.orders[(front_id, session_id, "sys" + str(len(account.orders)))] = order
+        else:
+            account.orders[(front_id, session_id, order_ref)] = order
+        return order
+
+    def checkInsert(self, investor_id, field):
+        '''
+        柜台风控：合约、价格、数量与可平仓位；返回错误信息，None表示通过
+        '''
+        code = field.InstrumentID
+        if code not in self.instruments:
+            return 16, "CTP:找不到合约"
+        if field.VolumeTotalOriginal <= 0:
+            return 15, "CTP:报单字段有误"
+        prices = self._prices[code]
+        if field.OrderPriceType == '2' and not prices["lower"] <= field.LimitPrice <= prices["upper"]:
+            return 15, "CTP:报单价格超出涨跌停板"
+        if field.CombOffsetFlag != '0':
+            direction = '3' if field.Direction == '0' else '2'
+            with self._lock:
+                account = self.account(investor_id)
+                held = account.positions.get((code, direction), {}).get("volume", 0)
+                frozen = sum(o["VolumeTotal"] for o in account.orders.values()
+                             if o["InstrumentID"] == code and o["CombOffsetFlag"] != '0'
+                             and o["Direction"] == field.Direction and o["OrderStatus"] in ('1', '3', 'a'))
+            if field.VolumeTotalOriginal + frozen > held:
+                return 30, "CTP:平仓量超过持仓量"
+        return None
+
+    def insert(self, investor_id, session, field):
+        '''
+        登记报单，返回报单字典；随后由accept在交易所时延后撮合
+        '''
+        with self._lock:
+            account = self.account(investor_id)
+            price_type = field.OrderPriceType
+            return self._newOrder(account, session, field.InstrumentID, field.Direction, field.CombOffsetFlag,
+                                  field.LimitPrice, field.VolumeTotalOriginal, field.TimeCondition, price_type,
+                                  field.OrderRef, field.VolumeCondition, field.MinVolume)
+
+    def accept(self, investor_id, order):
+        '''
+        交易所接受报单并立即撮合：可成交的按对手价全部成交，IOC未成交撤销，GFD未成交挂单等待行情
+        '''
+        with self._lock:
+            account = self.account(investor_id)
+            order.update(OrderSysID=self._sysId(), OrderSubmitStatus='3', OrderStatus='3', StatusMsg="未成交",
+                         ActiveTime=_now(), UpdateTime=_now())
+            self._publish(account, order)
+            fill = self._crossPrice(order)
+            if fill is not None:
+                self._fill(account, order, fill)
+            elif order["TimeCondition"] == '1':  # THOST_FTDC_TC_IOC
+                order.update(OrderStatus='5', StatusMsg="已撤单报单被拒绝", CancelTime=_now())
+                self._publish(account, order)
+            else:
+                self._resting.setdefault(order["InstrumentID"], []).append(order)
+
+    def cancel(self, investor_id, field):
+        '''
+        撤销挂单，返回错误信息或None；找不到或已完成的报单撤单被拒绝
+        '''
+        with self._lock:
+            account = self.account(investor_id)
+            resting = self._resting.get(field.InstrumentID, [])
+            for order in resting:
+                if order["OrderSysID"] == field.OrderSysID and order["InvestorID"] == investor_id:
+                    resting.remove(order)
+                    order.update(OrderStatus='5', OrderSubmitStatus='1', StatusMsg="已撤单", CancelTime=_now(),
+                                 UpdateTime=_now())
+                    self._publish(account, order)
+                    return None
+        return 26, "CTP:报单已全成交或已撤销，不能再撤"
+
+    def _crossPrice(self, order):
+        prices = self._prices[order["InstrumentID"]]
+        tick = prices["tick"]
+        bid, ask = prices["last"] - tick, prices["last"] + tick
+        market = order["OrderPriceType"] != '2'
+        if order["Direction"] == '0':
+            return ask if market or order["LimitPrice"] >= ask else None
+        return bid if market or order["LimitPrice"] <= bid else None
+
+    def _fill(self, account, order, price):
+        volume = order["VolumeTotal"]
+        order.update(VolumeTraded=order["VolumeTraded"] + volume, VolumeTotal=0, OrderStatus='0',
+                     StatusMsg="全部成交", UpdateTime=_now())
+        self._publish(account, order)
+        trade = self._newTrade(account, order, price, volume)
+        for session in account.sessions:
+            session.later(session.OnRtnTrade, _struct(CTPStruct.TradeField, trade))
+
+    def _newTrade(self, account, order, price, volume):
+        code, multiple = order["InstrumentID"], self._multiple(order["InstrumentID"])
+        trade = {"BrokerID": "", "InvestorID": account.investor_id, "InstrumentID": code,
+                 "ExchangeID": order["ExchangeID"], "OrderRef": order["OrderRef"], "OrderSysID": order["OrderSysID"],
+                 "TradeID": "%12d" % next(self._trade_ids), "Direction": order["Direction"],
+                 "OffsetFlag": order["CombOffsetFlag"], "HedgeFlag": '1', "TradingRole": '1',
+                 "TradeType": '0', "PriceSource": '0', "TradeSource": '0', "Price": price, "Volume": volume,
+                 "TradeDate": self.trading_day, "TradeTime": _now(), "TradingDay": self.trading_day}
+        account.trades.append(trade)
+        if order["CombOffsetFlag"] == '0':
+            key = (code, '2' if order["Direction"] == '0' else '3')
+            position = account.positions.setdefault(key, {"volume": 0, "yd": 0, "cost": 0.0})
+            position["volume"] += volume
+            position["cost"] += price * volume * multiple
+        else:
+            key = (code, '3' if order["Direction"] == '0' else '2')
+            position = account.positions.get(key)
+            if position and position["volume"]:
+                closed = min(volume, position["volume"])
+                cost = position["cost"] * closed / position["volume"]
+                sign = 1 if key[1] == '2' else -1
+                account.close_profit += sign * (price * closed * multiple - cost)
+                position["cost"] -= cost
+                position["volume"] -= closed
+                position["yd"] = min(position["yd"], position["volume"])
+        return trade
+
+    def _publish(self, account, order):
+        for session in account.sessions:
+            session.later(session.OnRtnOrder, _struct(CTPStruct.OrderField, order))
+
+    # ---- 行情 ----
+
+    def subscribe(self, api, codes):
+        with self._lock:
+            for code in codes:
+                self._md_apis.setdefault(code, set()).add(api)
+
+    def unsubscribe(self, api, codes=None):
+        with self._lock:
+            for code in list(self._md_apis) if codes is None else codes:
+                apis = self._md_apis.get(code)
+                if apis:
+                    apis.discard(api)
+                    if not apis:
+                        del self._md_apis[code]
+
+    def _runMarket(self):
+        rnd = random.Random(self.options["seed"] + 1)
+        interval = 1.0 / self.options["tick_rate"] if self.options["tick_rate"] > 0 else None
+        next_time = time.monotonic()
+        while interval:
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+            with self._lock:
+                targets = [(code, list(apis)) for code, apis in self._md_apis.items() if code in self._prices]
+            for code, apis in targets:
+                field = self._step(rnd, code)
+                for api in apis:
+                    api.later(api.OnRtnDepthMarketData, field)
+
+    def _step(self, rnd, code):
+        '''
+        价格按最小变动价位随机游走一步，撮合可以成交的挂单，返回行情字段
+        '''
+        with self._lock:
+            p = self._prices[code]
+            tick = p["tick"]
+            p["last"] = min(p["upper"], max(p["lower"], p["last"] + rnd.choice((-1, 0, 0, 1)) * tick))
+            p["high"], p["low"] = max(p["high"], p["last"]), min(p["low"], p["last"])
+            volume = rnd.randrange(1, 20)
+            p["volume"] += volume
+            p["turnover"] += volume * p["last"] * self._multiple(code)
+            self._matchResting(code)
+            now = time.time()
+            levels = {}
+            for level in range(1, 6):
+                levels["BidPrice%d" % level] = p["last"] - level * tick
+                levels["AskPrice%d" % level] = p["last"] + level * tick
+                levels["BidVolume%d" % level] = rnd.randrange(1, 100)
+                levels["AskVolume%d" % level] = rnd.randrange(1, 100)
+            return CTPStruct.DepthMarketDataField(
+                TradingDay=self.trading_day, ActionDay=time.strftime("%Y%m%d", time.localtime(now)),
+                InstrumentID=code, ExchangeID=self.instruments[code]["ExchangeID"], LastPrice=p["last"],
+                PreSettlementPrice=p["pre_settlement"], PreClosePrice=p["pre_settlement"],
+                PreOpenInterest=p["open_interest"], OpenPrice=p["open"], HighestPrice=p["high"],
+                LowestPrice=p["low"], Volume=p["volume"], Turnover=p["turnover"], OpenInterest=p["open_interest"],
+                ClosePrice=DBL_MAX, SettlementPrice=DBL_MAX, UpperLimitPrice=p["upper"],
+                LowerLimitPrice=p["lower"], UpdateTime=time.strftime("%H:%M:%S", time.localtime(now)),
+                UpdateMillisec=int(now * 1000) % 1000, **levels)
+
+    def _matchResting(self, code):
+        resting = self._resting.get(code)
+        if not resting:
+            return
+        for order in list(resting):
+            price = self._crossPrice(order)
+            if price is not None:
+                resting.remove(order)
+                account = self._accounts.get(order["InvestorID"])
+                if account:
+                    self._fill(account, order, order["LimitPrice"])
+
+
+class SimTraderApi:
+    '''
+    替代CTP.TraderApiPy的模拟交易前置：与真实API相同的方法名和回调顺序，回调在独立线程中按时延触发
+    '''
+
+    def Create(self, flow_dir=""):
+        self._dispatcher = _Dispatcher("sim-td")
+        self._sim_session = None
+
+    def RegisterFront(self, front):
+        pass
+
+    def SubscribePrivateTopic(self, resume_type):
+        pass
+
+    def SubscribePublicTopic(self, resume_type):
+        pass
+
+    def Init(self):
+        self._dispatcher.later(0, self.OnFrontConnected)
+
+    def Release(self):
+        if getattr(self, "_dispatcher", None) is None:
+            return
+        self._dispatcher.stop()
+        self._dispatcher = None
+        if self._sim_session is not None:
+            account = self._exchange.account(self._user_id)
+            account.sessions.discard(self)
+
+    def later(self, callback, *args):
+        '''
+        供SimExchange推送回报，与请求的回调走同一个线程，保证顺序
+        '''
+        if self._dispatcher:
+            self._dispatcher.later(0, callback, *args)
+
+    def _reply(self, callback, field, req_id, info=None, delay=None):
+        self._dispatcher.later(self._exchange.options["rtt"] / 2 if delay is None else delay, callback, field,
+                               info or _ok(), req_id, True)
+
+    def _replyRows(self, callback, rows, req_id):
+        if not self._exchange.allowQuery():
+            return -3
+        delay, row_delay = self._exchange.options["query_delay"], self._exchange.options["row_delay"]
+        if not rows:
+            self._dispatcher.later(delay, callback, None, _ok(), req_id, True)
+        for i, row in enumerate(rows):
+            self._dispatcher.later(delay + i * row_delay, callback, row, _ok(), req_id, i == len(rows) - 1)
+        return 0
+
+    def ReqAuthenticate(self, field, req_id):
+        self._reply(self.OnRspAuthenticate, CTPStruct.RspAuthenticateField(BrokerID=field.BrokerID,
+                                                                           UserID=field.UserID, AppType='1'), req_id)
+        return 0
+
+    def ReqUserLogin(self, field, req_id):
+        self._sim_session = (1, self._exchange.newSession())
+        self._exchange.account(field.UserID, self)
+        self._reply(self.OnRspUserLogin, CTPStruct.RspUserLoginField(
+            TradingDay=self._exchange.trading_day, LoginTime=_now(), BrokerID=field.BrokerID, UserID=field.UserID,
+            SystemName="SimFront", FrontID=self._sim_session[0], SessionID=self._sim_session[1],
+            MaxOrderRef="0"), req_id)
+        return 0
+
+    def ReqSettlementInfoConfirm(self, field, req_id):
+        self._reply(self.OnRspSettlementInfoConfirm, CTPStruct.SettlementInfoConfirmField(
+            BrokerID=field.BrokerID, InvestorID=field.InvestorID, ConfirmDate=self._exchange.trading_day,
+            ConfirmTime=_now()), req_id)
+        return 0
+
+    def ReqQryInstrument(self, field, req_id):
+        return self._replyRows(self.OnRspQryInstrument,
+                               [_struct(CTPStruct.InstrumentField, i) for i in self._exchange.instruments.values()],
+                               req_id)
+
+    def ReqQryTradingAccount(self, field, req_id):
+        return self._replyRows(self.OnRspQryTradingAccount, [self._exchange.accountField(self._user_id)], req_id)
+
+    def ReqQryInvestorPosition(self, field, req_id):
+        return self._replyRows(self.OnRspQryInvestorPosition, self._exchange.positionFields(self._user_id), req_id)
+
+    def ReqQryOrder(self, field, req_id):
+        return self._replyRows(self.OnRspQryOrder, self._exchange.orderFields(self._user_id), req_id)
+
+    def ReqQryTrade(self, field, req_id):
+        return self._replyRows(self.OnRspQryTrade, self._exchange.tradeFields(self._user_id), req_id)
+
+    def ReqQryQuote(self, field, req_id):
+        return self._replyRows(self.OnRspQryQuote, [], req_id)
+
+    def ReqOrderInsert(self, field, req_id):
+        error = self._exchange.checkInsert(self._user_id, field)
+        if error:
+            info = _error(*error)
+            self._reply(self.OnRspOrderInsert, field, req_id, info)
+            self._dispatcher.later(self._exchange.options["rtt"] / 2, self.OnErrRtnOrderInsert, field, info)
+            return 0
+        order = self._exchange.insert(self._user_id, self._sim_session, field)
+        self._dispatcher.later(self._exchange.options["rtt"] / 2, self.OnRtnOrder,
+                               _struct(CTPStruct.OrderField, order))
+        self._dispatcher.later(self._exchange.options["rtt"], self._exchange.accept, self._user_id, order)
+        return 0
+
+    def ReqOrderAction(self, field, req_id):
+        def cancel():
+            error = self._exchange.cancel(self._user_id, field)
+            if error:
+                self.OnRspOrderAction(field, _error(*error), req_id, True)
+
+        self._dispatcher.later(self._exchange.options["rtt"], cancel)
+        return 0
+
+
+class SimMdApi:
+    '''
+    替代CTP.MdApiPy的模拟行情前置：登录、订阅应答，订阅后按tick_rate推送行情
+    '''
+
+    def Create(self, flow_dir=""):
+        self._dispatcher = _Dispatcher("sim-md")
+
+    def RegisterFront(self, front):
+        pass
+
+    def Init(self):
+        self._dispatcher.later(0, self.OnFrontConnected)
+
+    def Release(self):
+        if getattr(self, "_dispatcher", None) is None:
+            return
+        self._exchange.unsubscribe(self)
+        self._dispatcher.stop()
+        self._dispatcher = None
+
+    def later(self, callback, *args):
+        if self._dispatcher:
+            self._dispatcher.later(0, callback, *args)
+
+    def ReqUserLogin(self, field, req_id):
+        self._dispatcher.later(0, self.OnRspUserLogin, CTPStruct.RspUserLoginField(
+            TradingDay=self._exchange.trading_day, LoginTime=_now(), SystemName="SimFront"), _ok(), req_id, True)
+        return 0
+
+    def _ack(self, callback, codes):
+        for i, code in enumerate(codes):
+            self._dispatcher.later(self._exchange.options["rtt"] / 2, callback,
+                                   CTPStruct.SpecificInstrumentField(InstrumentID=code), _ok(), 0,
+                                   i == len(codes) - 1)
+
+    def SubscribeMarketData(self, codes):
+        self._ack(self.OnRspSubMarketData, codes)
+        self._exchange.subscribe(self, codes)
+        return 0
+
+    def UnSubscribeMarketData(self, codes):
+        self._exchange.unsubscribe(self, codes)
+        self._ack(self.OnRspUnSubMarketData, codes)
+        return 0
+
+    def SubscribeForQuoteRsp(self, codes):
+        self._ack(self.OnRspSubForQuoteRsp, codes)
+        return 0
+
+
+class SimTraderImpl(SimTraderApi, TraderImpl):
+    '''
+    连接模拟前置的交易会话；合约表缓存在单独的目录，不与真实前置的缓存混用
+    '''
+
+    instrument_paths = (SIM_DIR + "instruments.npy", SIM_DIR + "instruments.json")
+
+    def __init__(self, *args, options=None, **kwargs):
+        os.makedirs(SIM_DIR, exist_ok=True)
+        self._exchange = SimExchange.shared(options)
+        TraderImpl.__init__(self, *args, **kwargs)
+
+
+class SimQuoteImpl(SimMdApi, QuoteImpl):
+    '''
+    连接模拟前置的行情会话
+    '''
+
+    def __init__(self, front, options=None):
+        self._exchange = SimExchange.shared(options)
+        QuoteImpl.__init__(self, front)
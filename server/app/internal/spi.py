@@ -1,28 +1,90 @@
+import asyncio
 import threading
 from app.internal.constants import MAX_TIMEOUT
+from app.internal.registry import RequestRegistry
+from app.internal.metrics import API_ERRORS, TIMEOUTS
 
 
 class SpiHelper:
     def __init__(self):
         self._event = threading.Event()
         self._error = None
+        self._waiter = None
+        self._waiter_lock = threading.Lock()
+        self._request_lock = None
+        self._requests = RequestRegistry()
 
     def resetCompletion(self):
-        self._event.clear()
-        self._error = None
+        with self._waiter_lock:
+            self._event.clear()
+            self._error = None
+            self._waiter = None
 
     def waitCompletion(self, operation_name=""):
         if not self._event.wait(MAX_TIMEOUT):
+            TIMEOUTS.inc((operation_name,))
             raise TimeoutError("%s超时" % operation_name)
         if self._error:
             raise RuntimeError(self._error)
 
+    async def waitCompletionAsync(self, operation_name=""):
+        '''
+        在事件循环中等待回调完成，由SPI回调线程通过call_soon_threadsafe唤醒
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._waiter_lock:
+            if self._event.is_set():
+                future.set_result(self._error)
+            else:
+                self._waiter = (loop, future)
+        try:
+            error = await asyncio.wait_for(future, MAX_TIMEOUT)
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc((operation_name,))
+            raise TimeoutError("%s超时" % operation_name)
+        finally:
+            self._waiter = None
+        if error:
+            raise RuntimeError(error)
+
+    def requestLock(self):
+        '''
+        同一时刻只允许一个请求占用完成状态，需在事件循环中调用
+        '''
+        if self._request_lock is None:
+            self._request_lock = asyncio.Lock()
+        return self._request_lock
+
+    async def request(self, send, operation_name="", timeout=MAX_TIMEOUT):
+        '''
+        以独立请求号发送请求，send接收请求号并返回API返回值；返回回调累加的结果行
+        '''
+        pending = self._requests.register(operation_name, timeout)
+        try:
+            self.checkApiReturn(send(pending.request_id))
+            return await pending.wait()
+        finally:
+            self._requests.discard(pending.request_id)
+
+    def gotRow(self, req_id, row):
+        return self._requests.append(req_id, row)
+
+    def completeRequest(self, req_id, error=None):
+        return self._requests.complete(req_id, error)
+
     def notifyCompletion(self, error=None):
-        self._error = error
-        self._event.set()
+        with self._waiter_lock:
+            self._error = error
+            self._event.set()
+            waiter = self._waiter
+        if waiter:
+            loop, future = waiter
+            loop.call_soon_threadsafe(_resolveFuture, future, error)
 
     def _cvtApiRetToError(self, ret):
         assert (-3 <= ret <= -1)
+        API_ERRORS.inc((str(ret),))
         return ("网络连接失败", "未处理请求超过许可数", "每秒发送请求数超过许可数")[-ret - 1]
 
     def checkApiReturn(self, ret):
@@ -33,8 +95,19 @@ class SpiHelper:
         if ret != 0:
             self.notifyCompletion(self._cvtApiRetToError(ret))
 
+    def checkRspInfoInRequest(self, info, req_id):
+        if not info or info.ErrorID == 0:
+            return True
+        self.completeRequest(req_id, info.ErrorMsg)
+        return False
+
     def checkRspInfoInCallback(self, info):
         if not info or info.ErrorID == 0:
             return True
         self.notifyCompletion(info.ErrorMsg)
         return False
+
+
+def _resolveFuture(future, result):
+    if not future.done():
+        future.set_result(result)
@@ -0,0 +1,158 @@
+import re
+import struct
+
+import numpy as np
+
+
+LEVELS = 5
+INVALID_PRICE = 1.797e+308
+
+# 所有列都存为float64，成交量、持仓量在2^53以内可精确表示；一行一次写入
+SCALAR_COLUMNS = ("seq", "trading_day", "update_ms",
+                  "last", "open", "high", "low", "close", "upper_limit", "lower_limit", "settlement",
+                  "pre_close", "pre_settlement", "volume", "turnover", "open_interest")
+LEVEL_COLUMNS = ("bid_price", "bid_volume", "ask_price", "ask_volume")
+COLUMNS = {name: i for i, name in enumerate(SCALAR_COLUMNS)}
+for _i, _name in enumerate(LEVEL_COLUMNS):
+    COLUMNS[_name] = slice(len(SCALAR_COLUMNS) + _i * LEVELS, len(SCALAR_COLUMNS) + (_i + 1) * LEVELS)
+WIDTH = len(SCALAR_COLUMNS) + len(LEVEL_COLUMNS) * LEVELS
+ROW = struct.Struct("=%dd" % WIDTH)
+PRICE_COLUMNS = ("last", "open", "high", "low", "close", "upper_limit", "lower_limit", "settlement",
+                 "pre_close", "pre_settlement", "bid_price", "ask_price")
+INTEGER_COLUMNS = ("seq", "trading_day", "update_ms", "volume", "bid_volume", "ask_volume")
+
+
+class QuoteStore:
+    '''
+    列式行情存储：按合约预分配二维float64数组，每个合约一行，tick原地写入。
+    合约到行号、交易所、品种的索引在登录后由合约表一次性建立，批量查询为向量化切片。
+    '''
+
+    def __init__(self, instruments):
+        if hasattr(instruments, "column"):
+            # InstrumentTable已按代码排序，直接取列，不必逐个生成合约字典
+            self._index = instruments.index()
+            self.codes = np.array(list(self._index), dtype=object)
+            self.exchange = np.array(instruments.column("exchange"), dtype="U8")
+            self.product = np.array(instruments.column("product"), dtype="U8")
+        else:
+            self.codes = np.array(sorted(instruments), dtype=object)
+            self._index = {code: row for row, code in enumerate(self.codes)}
+            self.exchange = np.array([instruments[code]["exchange"] for code in self.codes], dtype="U8")
+            self.product = np.array([_product(code) for code in self.codes], dtype="U8")
+        self._values = np.zeros((len(self.codes), WIDTH))
+        # 通过struct直接写入数组内存，比NumPy逐行赋值少一次中间数组转换
+        self._buffer = memoryview(self._values).cast("B")
+        self._writes = 0
+        self._clock_cache = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self._index
+
+    def row(self, code):
+        return self._index.get(code)
+
+    def write(self, tick):
+        '''
+        在行情回调线程中把Tick记录写入对应行
+        '''
+        row = self._index.get(tick.code)
+        if row is None:
+            return
+        clock = self._clock(tick.trading_day, tick.update_time)
+        self._writes += 1
+        ROW.pack_into(
+            self._buffer, row * ROW.size,
+            self._writes, clock[0], clock[1] + tick.update_millisec,
+            tick.last_price, tick.open_price, tick.highest_price, tick.lowest_price, tick.close_price,
+            tick.upper_limit_price, tick.lower_limit_price, tick.settlement_price,
+            tick.pre_close_price, tick.pre_settlement_price,
+            tick.volume, tick.turnover, tick.open_interest,
+            tick.bid_price1, tick.bid_price2, tick.bid_price3, tick.bid_price4, tick.bid_price5,
+            tick.bid_volume1, tick.bid_volume2, tick.bid_volume3, tick.bid_volume4, tick.bid_volume5,
+            tick.ask_price1, tick.ask_price2, tick.ask_price3, tick.ask_price4, tick.ask_price5,
+            tick.ask_volume1, tick.ask_volume2, tick.ask_volume3, tick.ask_volume4, tick.ask_volume5,
+        )
+
+    def _clock(self, trading_day, update_time):
+        '''
+        (交易日, 当日毫秒数)；同一秒内的大量tick共用一次解析结果
+        '''
+        key = (trading_day, update_time)
+        clock = self._clock_cache.get(key)
+        if clock is None:
+            if len(self._clock_cache) > 100000:
+                self._clock_cache.clear()
+            update_time = update_time or "00:00:00"
+            clock = self._clock_cache[key] = (
+                int(trading_day or 0),
+                (int(update_time[:2]) * 3600 + int(update_time[3:5]) * 60 + int(update_time[6:8])) * 1000)
+        return clock
+
+    def select(self, codes=None, exchange=None, product=None, subscribed=True):
+        '''
+        按条件返回行号数组；subscribed为True时只包含收到过行情的合约
+        '''
+        mask = self._values[:, COLUMNS["seq"]] > 0 if subscribed else np.ones(len(self.codes), dtype=bool)
+        if exchange:
+            mask &= self.exchange == exchange
+        if product:
+            mask &= self.product == product
+        if codes:
+            selected = np.zeros(len(self.codes), dtype=bool)
+            selected[[self._index[code] for code in codes if code in self._index]] = True
+            mask &= selected
+        return np.flatnonzero(mask)
+
+    def rows(self, rows):
+        '''
+        取若干行的拷贝，同一次查询的各字段都从这份拷贝中读取
+        '''
+        return self._values[rows]
+
+    def column(self, name, rows, values=None):
+        '''
+        取一列的拷贝，五档字段为(行数, 5)的二维数组；无效价格(DBL_MAX)置为NaN。values为rows(rows)的结果
+        '''
+        values = (self.rows(rows) if values is None else values)[:, COLUMNS[name]]
+        if name in PRICE_COLUMNS:
+            values = np.where(values >= INVALID_PRICE, np.nan, values)
+        elif name in INTEGER_COLUMNS:
+            values = values.astype(np.int64)
+        return values
+
+    def snapshot(self, fields=("last", "bid_price", "ask_price"), **filters):
+        '''
+        返回{合约代码: {字段: 值}}，五档字段为列表，NaN转换为None
+        '''
+        for name in fields:
+            if name not in COLUMNS:
+                raise ValueError("未知的行情字段<%s>" % name)
+        rows = self.select(**filters)
+        values = self.rows(rows)
+        columns = {name: _tolist(self.column(name, rows, values)) for name in fields}
+        return {code: {name: columns[name][i] for name in fields} for i, code in enumerate(self.codes[rows])}
+
+    def spreads(self, **filters):
+        '''
+        每个合约的一档买卖价差
+        '''
+        rows = self.select(**filters)
+        values = self.rows(rows)
+        spread = self.column("ask_price", rows, values)[:, 0] - self.column("bid_price", rows, values)[:, 0]
+        return dict(zip(self.codes[rows].tolist(), _tolist(spread)))
+
+
+def _product(code):
+    match = re.match(r"[A-Za-z]+", code)
+    return match.group(0) if match else ""
+
+
+def _tolist(values):
+    values = values.tolist()
+    if values and isinstance(values[0], list):
+        return [[None if x != x else x for x in row] for row in values]
+    return [None if x != x else x for x in values]
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+from app.internal.bus import Subscriber, TopicFilter
+from app.internal.constants import STREAM_MAX_CODES
+
+
+class StreamSubscriber(Subscriber):
+    '''
+    单个推送客户端：总线上的一个订阅方，按合约保存尚未发送的最新tick。
+    消费慢时同一合约的旧tick被新tick覆盖（conflation），待发送数据最多为订阅合约数。
+    '''
+
+    def __init__(self, loop, codes=()):
+        super().__init__("ws", TopicFilter(codes))
+        self.codes = self.topics.codes
+        self.conflated = 0
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._since = None
+        self._scheduled = False
+        self._ready = asyncio.Event()
+
+    def put(self, tick, now=None):
+        '''
+        在SPI回调线程中调用；每批数据只唤醒一次事件循环
+        '''
+        with self._lock:
+            if tick.code in self._pending:
+                self.conflated += 1
+            self._pending[tick.code] = tick
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self._since = now or time.monotonic()
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self):
+        '''
+        等待并取出当前所有待发送tick，返回{code: tick}；连接关闭后返回None
+        '''
+        await self._ready.wait()
+        if self.closed:
+            return None
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+            self._scheduled = False
+            self._since = None
+            self._ready.clear()
+        self.delivered += len(batch)
+        return batch
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def lag(self):
+        since = self._since
+        return time.monotonic() - since if since else 0.0
+
+    def stats(self):
+        return dict(super().stats(), conflated=self.conflated)
+
+
+class TickStream:
+    '''
+    行情推送：每个客户端是总线上按合约过滤的订阅方，订阅合约变化时通知总线重建路由
+    '''
+
+    def __init__(self, bus):
+        self._bus = bus
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def open(self, codes=()):
+        subscriber = StreamSubscriber(asyncio.get_running_loop())
+        self.add(subscriber, codes)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        self._bus.attach(subscriber)
+        return subscriber
+
+    def add(self, subscriber, codes):
+        if len(subscriber.codes | set(codes)) > STREAM_MAX_CODES:
+            raise ValueError("单个连接最多订阅%d个合约" % STREAM_MAX_CODES)
+        with self._lock:
+            subscriber.codes.update(codes)
+        self._bus.invalidate()
+
+    def remove(self, subscriber, codes):
+        with self._lock:
+            subscriber.codes.difference_update(codes)
+        self._bus.invalidate()
+
+    def close(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        self._bus.detach(subscriber)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {"clients": len(subscribers), "codes": len(set().union(*(i.codes for i in subscribers))),
+                "delivered": sum(i.delivered for i in subscribers),
+                "conflated": sum(i.conflated for i in subscribers)}
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import time
+
+from app.internal.constants import SUBSCRIBE_WINDOW
+
+
+logger = logging.getLogger(__name__)
+
+UNSUBSCRIBED = "unsubscribed"
+PENDING = "pending"
+SUBSCRIBED = "subscribed"
+ERROR = "error"
+
+
+class Subscription:
+    '''
+    一个合约的行情订阅：持有它的消费方、应答状态，以及请求、应答和收到第一个tick的时间
+    '''
+
+    __slots__ = ("code", "holders", "state", "error", "requested_at", "acked_at", "first_tick_at", "waiter")
+
+    def __init__(self, code):
+        self.code = code
+        self.holders = set()
+        self.state = UNSUBSCRIBED
+        self.error = None
+        self.requested_at = None
+        self.acked_at = None
+        self.first_tick_at = None
+        # 所在批次的future，批次发出并收到全部应答后完成
+        self.waiter = None
+
+    def to_dict(self):
+        return {"code": self.code, "state": self.state, "error": self.error,
+                "holders": sorted(_name(i) for i in self.holders),
+                "requested_at": self.requested_at, "acked_at": self.acked_at, "first_tick_at": self.first_tick_at}
+
+
+def _name(consumer):
+    return consumer if isinstance(consumer, str) else getattr(consumer, "name", type(consumer).__name__)
+
+
+class SubscriptionManager:
+    '''
+    按消费方引用计数的行情订阅：同一消费方重复订阅只计一次，最后一个消费方释放后才向CTP取消订阅。
+    window秒内到达的订阅、取消订阅合并成一次SubscribeMarketData/UnSubscribeMarketData，批次依次发出。
+    行情会话断线重连、重新登录后按当前持有的合约全部重新订阅。
+    除onRspSubscribe、onFrontDisconnected、onLogin、onTick外都需在事件循环中调用
+    '''
+
+    def __init__(self, window=SUBSCRIBE_WINDOW):
+        self.window = window
+        self.batches = 0
+        self._md = None
+        self._loop = None
+        self._codes = {}
+        self._consumers = {}
+        self._subscribe = set()
+        self._unsubscribe = set()
+        self._next = None
+        self._scheduled = False
+        self._sending = None
+
+    def __len__(self):
+        return len(self._codes)
+
+    def attach(self, md):
+        '''
+        登录后换成新的行情会话，之前持有的合约在事件循环中重新订阅；可在登录线程中调用
+        '''
+        self._md = md
+        md.setListener(self)
+        self.onFrontDisconnected()
+        if self._loop and self._codes:
+            self._loop.call_soon_threadsafe(self.resubscribe)
+
+    def detach(self):
+        self._md = None
+        self.onFrontDisconnected()
+
+    async def acquire(self, consumer, codes):
+        '''
+        consumer持有codes，未订阅的合约并入下一批订阅，等待所在批次的应答；
+        有合约订阅失败时抛出RuntimeError，持有关系保留，下次acquire时重试
+        '''
+        waiters = self._hold(consumer, codes)
+        await self._wait(codes, waiters)
+
+    async def refresh(self, codes):
+        '''
+        对已持有的合约重新发送订阅请求，CTP收到后会再推送一次最新行情
+        '''
+        waiters = set()
+        for code in codes:
+            subscription = self._codes.get(code)
+            if subscription is not None and subscription.holders:
+                waiters.add(self._enqueue(subscription))
+        await self._wait(codes, waiters)
+
+    def release(self, consumer, codes=None):
+        '''
+        consumer不再需要codes（默认为它持有的全部合约），没有其他持有者的合约并入下一批取消订阅
+        '''
+        held = self._consumers.get(consumer)
+        if not held:
+            return
+        codes = list(held) if codes is None else codes
+        for code in codes:
+            if code not in held:
+                continue
+            held.discard(code)
+            subscription = self._codes[code]
+            subscription.holders.discard(consumer)
+            if subscription.holders:
+                continue
+            if code in self._subscribe:
+                # 还没发出的订阅直接撤回
+                self._subscribe.discard(code)
+                del self._codes[code]
+            elif subscription.state in (SUBSCRIBED, PENDING):
+                self._unsubscribe.add(code)
+                self._schedule()
+            else:
+                del self._codes[code]
+        if not held:
+            del self._consumers[consumer]
+
+    def resubscribe(self):
+        '''
+        重新订阅所有被持有的合约，断线重连、重新登录后调用
+        '''
+        codes = [subscription for subscription in self._codes.values() if subscription.holders]
+        if codes:
+            logger.info("重新订阅%d个合约的行情", len(codes))
+        for subscription in codes:
+            self._enqueue(subscription)
+
+    def held(self, consumer):
+        '''
+        consumer当前持有的合约
+        '''
+        return set(self._consumers.get(consumer, ()))
+
+    def isSubscribed(self, code):
+        subscription = self._codes.get(code)
+        return subscription is not None and subscription.state == SUBSCRIBED
+
+    def codes(self, state=SUBSCRIBED):
+        return [code for code, subscription in self._codes.items() if subscription.state == state]
+
+    def onRspSubscribe(self, code, error=None):
+        '''
+        在SPI回调线程中调用，逐个合约记录订阅应答
+        '''
+        subscription = self._codes.get(code)
+        if subscription is None:
+            return
+        subscription.acked_at = time.time()
+        subscription.error = error
+        subscription.state = ERROR if error else SUBSCRIBED
+
+    def onFrontDisconnected(self):
+        '''
+        断线后CTP上的订阅全部失效，等重新登录后再订阅
+        '''
+        for subscription in list(self._codes.values()):
+            if subscription.state == SUBSCRIBED:
+                subscription.state = UNSUBSCRIBED
+
+    def onLogin(self):
+        '''
+        行情会话断线重连后重新登录成功，在SPI回调线程中调用
+        '''
+        if self._loop:
+            self._loop.call_soon_threadsafe(self.resubscribe)
+
+    def onTick(self, code):
+        subscription = self._codes.get(code)
+        if subscription is not None and subscription.first_tick_at is None:
+            subscription.first_tick_at = time.time()
+
+    def get(self, codes=None):
+        '''
+        各合约的订阅状态
+        '''
+        items = self._codes.values() if codes is None else (self._codes[i] for i in codes if i in self._codes)
+        return [subscription.to_dict() for subscription in items]
+
+    def stats(self):
+        states = {}
+        for subscription in self._codes.values():
+            states[subscription.state] = states.get(subscription.state, 0) + 1
+        consumers = {}
+        for consumer, held in self._consumers.items():
+            name = _name(consumer)
+            consumers[name] = consumers.get(name, 0) + len(held)
+        return {"codes": len(self._codes), "states": states, "consumers": consumers, "batches": self.batches,
+                "queued": {"subscribe": len(self._subscribe), "unsubscribe": len(self._unsubscribe)}}
+
+    def _hold(self, consumer, codes):
+        self._loop = asyncio.get_running_loop()
+        held = self._consumers.setdefault(consumer, set())
+        waiters = set()
+        for code in codes:
+            subscription = self._codes.get(code)
+            if subscription is None:
+                subscription = self._codes[code] = Subscription(code)
+            held.add(code)
+            subscription.holders.add(consumer)
+            self._unsubscribe.discard(code)
+            if subscription.state in (UNSUBSCRIBED, ERROR):
+                waiters.add(self._enqueue(subscription))
+            elif subscription.state == PENDING:
+                waiters.add(subscription.waiter)
+        waiters.discard(None)
+        return waiters
+
+    def _enqueue(self, subscription):
+        if self._next is None:
+            self._next = self._loop.create_future()
+        self._subscribe.add(subscription.code)
+        subscription.state = PENDING
+        subscription.waiter = self._next
+        self._schedule()
+        return self._next
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop = self._loop or asyncio.get_running_loop()
+            self._loop.create_task(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(self.window)
+        if self._sending is None:
+            self._sending = asyncio.Lock()
+        async with self._sending:
+            # 从这里开始到达的请求进入下一批
+            self._scheduled = False
+            subscribe, self._subscribe = self._subscribe, set()
+            unsubscribe, self._unsubscribe = self._unsubscribe, set()
+            future, self._next = self._next, None
+            if unsubscribe:
+                await self._sendUnsubscribe(unsubscribe)
+            if subscribe:
+                await self._sendSubscribe(subscribe, future)
+            elif future and not future.done():
+                future.set_result(None)
+
+    async def _sendUnsubscribe(self, codes):
+        codes = sorted(code for code in codes if code in self._codes and not self._codes[code].holders)
+        if not codes:
+            return
+        for code in codes:
+            # 发出后再被acquire的合约需要重新订阅
+            self._codes[code].state = UNSUBSCRIBED
+        self.batches += 1
+        try:
+            if self._md:
+                await self._md.unsubscribe(codes)
+        except Exception as e:
+            logger.warning("取消订阅%d个合约失败: %r", len(codes), e)
+        for code in codes:
+            subscription = self._codes.get(code)
+            if subscription is not None and not subscription.holders and code not in self._subscribe:
+                del self._codes[code]
+
+    async def _sendSubscribe(self, codes, future):
+        subscriptions = [self._codes[code] for code in sorted(codes)
+                         if code in self._codes and self._codes[code].holders]
+        now = time.time()
+        for subscription in subscriptions:
+            subscription.requested_at = now
+            subscription.acked_at = None
+            subscription.first_tick_at = None
+            subscription.error = None
+        try:
+            if not subscriptions:
+                pass
+            elif self._md is None:
+                raise RuntimeError('账户未登陆！')
+            else:
+                self.batches += 1
+                await self._md.subscribe([subscription.code for subscription in subscriptions])
+        except Exception as e:
+            logger.warning("订阅%d个合约失败: %r", len(subscriptions), e)
+            for subscription in subscriptions:
+                if subscription.state == PENDING:
+                    subscription.state = ERROR
+                    subscription.error = str(e)
+        for subscription in subscriptions:
+            if subscription.state == PENDING:
+                subscription.state = ERROR
+                subscription.error = "未收到订阅应答"
+            if subscription.waiter is future:
+                subscription.waiter = None
+        if future and not future.done():
+            future.set_result(None)
+
+    async def _wait(self, codes, waiters):
+        if waiters:
+            await asyncio.gather(*waiters)
+        errors = ["%s: %s" % (code, self._codes[code].error) for code in codes
+                  if code in self._codes and self._codes[code].state == ERROR]
+        if errors:
+            raise RuntimeError("订阅行情失败：%s" % "; ".join(errors))
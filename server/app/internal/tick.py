@@ -0,0 +1,200 @@
+from app.internal.constants import FILTER
+from app.internal.serializer import dumpb
+
+
+# (字段名, CTP字段名)，按此顺序从DepthMarketDataField拷贝
+TICK_FIELDS = (
+    ("trading_day", "TradingDay"), ("action_day", "ActionDay"), ("update_time", "UpdateTime"),
+    ("update_millisec", "UpdateMillisec"),
+    ("last_price", "LastPrice"), ("open_price", "OpenPrice"), ("close_price", "ClosePrice"),
+    ("highest_price", "HighestPrice"), ("lowest_price", "LowestPrice"),
+    ("upper_limit_price", "UpperLimitPrice"), ("lower_limit_price", "LowerLimitPrice"),
+    ("settlement_price", "SettlementPrice"), ("volume", "Volume"), ("turnover", "Turnover"),
+    ("open_interest", "OpenInterest"), ("pre_close_price", "PreClosePrice"),
+    ("pre_settlement_price", "PreSettlementPrice"), ("pre_open_interest", "PreOpenInterest"),
+    ("ask_price1", "AskPrice1"), ("ask_volume1", "AskVolume1"), ("bid_price1", "BidPrice1"), ("bid_volume1", "BidVolume1"),
+    ("ask_price2", "AskPrice2"), ("ask_volume2", "AskVolume2"), ("bid_price2", "BidPrice2"), ("bid_volume2", "BidVolume2"),
+    ("ask_price3", "AskPrice3"), ("ask_volume3", "AskVolume3"), ("bid_price3", "BidPrice3"), ("bid_volume3", "BidVolume3"),
+    ("ask_price4", "AskPrice4"), ("ask_volume4", "AskVolume4"), ("bid_price4", "BidPrice4"), ("bid_volume4", "BidVolume4"),
+    ("ask_price5", "AskPrice5"), ("ask_volume5", "AskVolume5"), ("bid_price5", "BidPrice5"), ("bid_volume5", "BidVolume5"),
+)
+
+
+class Tick:
+    '''
+    每个合约一个固定布局的tick记录，收到行情时原地覆盖，不再为每个tick构造字典。
+    to_dict()按需生成原先的字典格式并缓存到下一次更新；返回的字典为共享对象，不要修改。
+    to_json()同样缓存编码后的字节，多个推送连接共用一次编码。
+    _seq为奇数表示正在写入，读取方据此避免读到写了一半的记录。
+    '''
+
+    __slots__ = ("code", "_seq", "_dict", "_dict_seq", "_json", "_json_dict") + tuple(name for name, _ in TICK_FIELDS)
+
+    def __init__(self, code):
+        self.code = code
+        self._seq = 0
+        self._dict = None
+        self._dict_seq = -1
+        self._json = None
+        self._json_dict = None
+        for name, _ in TICK_FIELDS:
+            setattr(self, name, None)
+
+    def update(self, field):
+        self._seq += 1
+        self.trading_day = field.TradingDay
+        self.action_day = field.ActionDay
+        self.update_time = field.UpdateTime
+        self.update_millisec = field.UpdateMillisec
+        self.last_price = field.LastPrice
+        self.open_price = field.OpenPrice
+        self.close_price = field.ClosePrice
+        self.highest_price = field.HighestPrice
+        self.lowest_price = field.LowestPrice
+        self.upper_limit_price = field.UpperLimitPrice
+        self.lower_limit_price = field.LowerLimitPrice
+        self.settlement_price = field.SettlementPrice
+        self.volume = field.Volume
+        self.turnover = field.Turnover
+        self.open_interest = field.OpenInterest
+        self.pre_close_price = field.PreClosePrice
+        self.pre_settlement_price = field.PreSettlementPrice
+        self.pre_open_interest = field.PreOpenInterest
+        self.ask_price1 = field.AskPrice1
+        self.ask_volume1 = field.AskVolume1
+        self.bid_price1 = field.BidPrice1
+        self.bid_volume1 = field.BidVolume1
+        self.ask_price2 = field.AskPrice2
+        self.ask_volume2 = field.AskVolume2
+        self.bid_price2 = field.BidPrice2
+        self.bid_volume2 = field.BidVolume2
+        self.ask_price3 = field.AskPrice3
+        self.ask_volume3 = field.AskVolume3
+        self.bid_price3 = field.BidPrice3
+        self.bid_volume3 = field.BidVolume3
+        self.ask_price4 = field.AskPrice4
+        self.ask_volume4 = field.AskVolume4
+        self.bid_price4 = field.BidPrice4
+        self.bid_volume4 = field.BidVolume4
+        self.ask_price5 = field.AskPrice5
+        self.ask_volume5 = field.AskVolume5
+        self.bid_price5 = field.BidPrice5
+        self.bid_volume5 = field.BidVolume5
+        self._seq += 1
+
+    def copy(self):
+        '''
+        返回不再变化的副本，供异步消费方使用；读到写了一半的记录时重读
+        '''
+        tick = Tick.__new__(Tick)
+        tick.code = self.code
+        tick._dict = None
+        tick._dict_seq = -1
+        tick._json = None
+        tick._json_dict = None
+        while True:
+            seq = self._seq
+            if seq & 1:
+                continue
+            tick.trading_day = self.trading_day
+            tick.action_day = self.action_day
+            tick.update_time = self.update_time
+            tick.update_millisec = self.update_millisec
+            tick.last_price = self.last_price
+            tick.open_price = self.open_price
+            tick.close_price = self.close_price
+            tick.highest_price = self.highest_price
+            tick.lowest_price = self.lowest_price
+            tick.upper_limit_price = self.upper_limit_price
+            tick.lower_limit_price = self.lower_limit_price
+            tick.settlement_price = self.settlement_price
+            tick.volume = self.volume
+            tick.turnover = self.turnover
+            tick.open_interest = self.open_interest
+            tick.pre_close_price = self.pre_close_price
+            tick.pre_settlement_price = self.pre_settlement_price
+            tick.pre_open_interest = self.pre_open_interest
+            tick.ask_price1 = self.ask_price1
+            tick.ask_volume1 = self.ask_volume1
+            tick.bid_price1 = self.bid_price1
+            tick.bid_volume1 = self.bid_volume1
+            tick.ask_price2 = self.ask_price2
+            tick.ask_volume2 = self.ask_volume2
+            tick.bid_price2 = self.bid_price2
+            tick.bid_volume2 = self.bid_volume2
+            tick.ask_price3 = self.ask_price3
+            tick.ask_volume3 = self.ask_volume3
+            tick.bid_price3 = self.bid_price3
+            tick.bid_volume3 = self.bid_volume3
+            tick.ask_price4 = self.ask_price4
+            tick.ask_volume4 = self.ask_volume4
+            tick.bid_price4 = self.bid_price4
+            tick.bid_volume4 = self.bid_volume4
+            tick.ask_price5 = self.ask_price5
+            tick.ask_volume5 = self.ask_volume5
+            tick.bid_price5 = self.bid_price5
+            tick.bid_volume5 = self.bid_volume5
+            if seq == self._seq:
+                tick._seq = seq
+                return tick
+
+    @property
+    def price(self):
+        return None if self.last_price is None else FILTER(self.last_price)
+
+    def to_dict(self):
+        while True:
+            seq = self._seq
+            if seq == self._dict_seq:
+                return self._dict
+            if seq & 1:
+                continue
+            data = self._build()
+            if seq == self._seq:
+                self._dict = data
+                self._dict_seq = seq
+                return data
+
+    def to_json(self):
+        data = self.to_dict()
+        if self._json_dict is not data:
+            self._json = dumpb(data)
+            self._json_dict = data
+        return self._json
+
+    def _build(self):
+        day = self.trading_day or ""
+        return {"trade_time": day[:4] + '-' + day[4:6] + '-' + day[6:] + " " + (self.update_time or ""),
+                "update_sec": int(self.update_millisec or 0),
+                "price": self.price, "open": _filter(self.open_price), "close": _filter(self.close_price),
+                "highest": _filter(self.highest_price), "lowest": _filter(self.lowest_price),
+                "upper_limit": _filter(self.upper_limit_price), "lower_limit": _filter(self.lower_limit_price),
+                "settlement": _filter(self.settlement_price), "volume": self.volume,
+                "turnover": self.turnover, "open_interest": int(self.open_interest or 0),
+                "pre_close": _filter(self.pre_close_price),
+                "pre_settlement": _filter(self.pre_settlement_price),
+                "pre_open_interest": int(self.pre_open_interest or 0),
+                "ask1": (_filter(self.ask_price1), self.ask_volume1),
+                "bid1": (_filter(self.bid_price1), self.bid_volume1),
+                "ask2": (_filter(self.ask_price2), self.ask_volume2),
+                "bid2": (_filter(self.bid_price2), self.bid_volume2),
+                "ask3": (_filter(self.ask_price3), self.ask_volume3),
+                "bid3": (_filter(self.bid_price3), self.bid_volume3),
+                "ask4": (_filter(self.ask_price4), self.ask_volume4),
+                "bid4": (_filter(self.bid_price4), self.bid_volume4),
+                "ask5": (_filter(self.ask_price5), self.ask_volume5),
+                "bid5": (_filter(self.bid_price5), self.bid_volume5)}
+
+    def __repr__(self):
+        return "Tick(%s, %s)" % (self.code, self.to_dict())
+
+
+def encodeTicks(ticks):
+    '''
+    {code: Tick}编码为JSON文本，各tick复用缓存的编码结果
+    '''
+    return (b"{" + b",".join(dumpb(code) + b":" + tick.to_json() for code, tick in ticks.items()) + b"}").decode()
+
+
+def _filter(x):
+    return None if x is None else FILTER(x)
@@ -1,27 +1,43 @@
-import datetime
-import json
-import re
+import asyncio
 import time
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
 
 import ctpwrapper as CTP
 import ctpwrapper.ApiStructure as CTPStruct
-from pytz import timezone
 
 from app.internal.spi import SpiHelper
-from app.internal.constants import DATA_DIR, FILTER
+from app.internal.orders import OrderTracker
+from app.internal.book import OrderBook
+from app.internal.position import PositionEngine
+from app.internal.instruments import InstrumentTable, TABLE_PATH, META_PATH
+from app.internal.chain import OptionChain
+from app.internal.scheduler import QueryScheduler, TokenBucket, PRIORITY_POSITION, PRIORITY_ACCOUNT, PRIORITY_ORDER, \
+    PRIORITY_INSTRUMENT
+from app.internal.constants import DATA_DIR, FILTER, QUERY_RATE, QUERY_BURST, MAX_TIMEOUT, INSTRUMENT_TIMEOUT, \
+    ORDER_RATE, ORDER_BURST
 import os
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+ORDER_TYPES = ("limit", "market", "fak", "fok")
+
 
 class TraderImpl(SpiHelper, CTP.TraderApiPy):
-    def __init__(self, front, broker_id, app_id, auth_code, user_id, password):
+    # 合约表缓存路径，连接模拟前置时使用单独的缓存
+    instrument_paths = (TABLE_PATH, META_PATH)
+
+    def __init__(self, front, broker_id, app_id, auth_code, user_id, password,
+                 query_rate=QUERY_RATE, query_burst=QUERY_BURST, order_rate=ORDER_RATE, order_burst=ORDER_BURST,
+                 instruments=None):
         SpiHelper.__init__(self)
         CTP.TraderApiPy.__init__(self)
-        self._last_query_time = 0
+        # 按报单引用、单号等待回报的在途报单和撤单
+        self._tracker = OrderTracker()
+        self._scheduler = QueryScheduler(query_rate, query_burst)
+        # 报单、撤单共用的流控
+        self._order_bucket = TokenBucket(order_rate, order_burst)
         self._broker_id = broker_id
         self._app_id = app_id
         self._auth_code = auth_code
@@ -29,9 +45,13 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
         self._password = password
         self._front_id = None
         self._session_id = None
-        self._order_action = None
-        self._order_ref = 0
-        flow_dir = DATA_DIR + "td_flow/"
+        # 断线重连时在SPI线程中清空，前置在合约表加载之前就可能断开
+        self._book = OrderBook()
+        self._positions = None
+        # 首次初始化后记录事件循环，重连登录后在其中重新初始化
+        self._loop = None
+        # 多个账户在同一进程中登录时各自使用流文件目录
+        flow_dir = DATA_DIR + "td_flow/" + (user_id + "/" if user_id else "")
         os.makedirs(flow_dir, exist_ok=True)
         self.Create(flow_dir)
         self.RegisterFront(front)
@@ -40,21 +60,28 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
         self.Init()
         self.waitCompletion("登录交易会话")
         # del self._app_id, self._auth_code, self._password
-        self._getInstruments()
-        self.instruments_option = defaultdict(list)
-        self.instruments_future = defaultdict(list)
-        self._buildInstrumentsDict()
-        self.lastDataTime = None
+        self._instruments_option = None
+        self._instruments_future = None
+        self._option_chain = None
+        if instruments is None:
+            self._getInstruments()
+        else:
+            # 多账户时共用行情账户已加载的合约表
+            self._instruments = instruments
+            self.instruments_stale = False
         self.lastAccount = None
-        self.lastPositions = []
-        self.lastOrders = {}
-        self.lastTrades = {}
+        self.lastDrift = []
+        self._decimal_places = {}
+        self._positions = PositionEngine(self._instruments, self._decimalPlaces)
 
-    def _limitFrequency(self):
-        delta = time.time() - self._last_query_time
-        if delta < 1:
-            time.sleep(1 - delta)
-        self._last_query_time = time.time()
+    def _query(self, key, priority, send, operation_name, timeout=MAX_TIMEOUT):
+        '''
+        经查询调度器按优先级和流控发送查询，相同key的在途查询合并
+        '''
+        return self._scheduler.submit(key, priority, lambda: self.request(send, operation_name, timeout))
+
+    def queryStats(self):
+        return self._scheduler.stats()
 
     def __del__(self):
         self.Release()
@@ -68,14 +95,16 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
         logger.info("已连接交易服务器...")
         field = CTPStruct.ReqAuthenticateField(BrokerID=self._broker_id,
                                                AppID=self._app_id, AuthCode=self._auth_code, UserID=self._user_id)
-        logger.info(f"OnFrontConnected, {field=}")
+        logger.info("OnFrontConnected, field=%r", field)
         self.checkApiReturnInCallback(self.ReqAuthenticate(field, 0))
 
     def OnRspError(self, pRspInfo, nRequestID, bIsLast):
         logger.info("OnRspError:")
-        logger.info("requestID:", nRequestID)
+        logger.info("requestID: %s", nRequestID)
         logger.info(pRspInfo)
         logger.info(bIsLast)
+        if pRspInfo and pRspInfo.ErrorID != 0:
+            self.completeRequest(nRequestID, pRspInfo.ErrorMsg)
 
     def OnHeartBeatWarning(self, nTimeLapse):
         """心跳超时警告。当长时间未收到报文时，该方法被调用。
@@ -85,6 +114,10 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
 
     def OnFrontDisconnected(self, nReason):
         logger.info("已断开交易服务器:{}...".format(nReason))
+        # 私有流按QUICK方式订阅，断线期间的报单、成交回报不会补发，重连后重新查询
+        self._book.reset()
+        if self._positions is not None:
+            self._positions.reset()
 
     def OnRspAuthenticate(self, _, info, req_id, is_last):
         assert (req_id == 0)
@@ -94,17 +127,18 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
         logger.info("已通过交易终端认证...")
         field = CTPStruct.ReqUserLoginField(BrokerID=self._broker_id,
                                             UserID=self._user_id, Password=self._password)
-        logger.info(f"OnRspAuthenticate, {field=}")
+        logger.info("OnRspAuthenticate, field=%r", field)
         self.checkApiReturnInCallback(self.ReqUserLogin(field, 1))
 
     def OnRspUserLogin(self, field, info, req_id, is_last):
-        logger.info(f"OnRspUserLogin, {field=}")
+        logger.info("OnRspUserLogin, field=%r", field)
         assert (req_id == 1)
         assert (is_last)
         if not self.checkRspInfoInCallback(info):
             return
         self._front_id = field.FrontID
         self._session_id = field.SessionID
+        self._tracker.setSession(field.FrontID, field.SessionID, int(field.MaxOrderRef.strip() or 0))
         logger.info("已登录交易会话...")
         field = CTPStruct.SettlementInfoConfirmField(BrokerID=self._broker_id,
                                                      InvestorID=self._user_id)
@@ -117,22 +151,36 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
             return
         logger.info("已确认结算单...")
         self.notifyCompletion()
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.warmUp(), self._loop)
+
+    async def warmUp(self):
+        '''
+        登录或重连后查询一次持仓、资金、报单和成交作为初始状态，之后的读取不再等待CTP查询
+        '''
+        self._loop = asyncio.get_running_loop()
+        await self.getPositions()
+        await self.getAccount()
+        await self.getOrders()
+        await self.getTrades()
 
     def _getInstruments(self):
-        file_path = DATA_DIR + "instruments.dat"
+        '''
+        优先内存映射加载本地合约表；缓存不是当天的先用缓存登录，由refreshInstruments增量刷新；
+        没有缓存时才阻塞查询全部合约
+        '''
         now_date = time.strftime("%Y-%m-%d", time.localtime())
-        if os.path.exists(file_path):
-            fd = open(file_path)
-            cached_date = fd.readline()
-            if cached_date[: -1] == now_date:
-                self._instruments = json.load(fd)
-                fd.close()
-                logger.info("已加载全部共%d个合约..." % len(self._instruments))
-                return
-            fd.close()
-        self._instruments = {}
+        table = InstrumentTable.load(*self.instrument_paths)
+        if table is not None:
+            self._instruments = table
+            self.instruments_stale = table.date != now_date
+            if self.instruments_stale:
+                logger.info("合约缓存日期为%s，稍后刷新..." % table.date)
+            logger.info("已加载全部共%d个合约..." % len(table))
+            return
+        self._fetched = {}
         self.resetCompletion()
-        self._limitFrequency()
+        time.sleep(self._scheduler.reserve())
         self.checkApiReturn(self.ReqQryInstrument(CTPStruct.QryInstrumentField(), 3))
         last_count = 0
         while True:
@@ -140,71 +188,126 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
                 self.waitCompletion("获取所有合约")
                 break
             except TimeoutError as e:
-                count = len(self._instruments)
+                count = len(self._fetched)
                 if count == last_count:
                     raise e
                 logger.info("已获取%d个合约..." % count)
                 last_count = count
-        fd = open(file_path, "w")
-        fd.write(now_date + "\n")
-        json.dump(self._instruments, fd, ensure_ascii=False)
-        fd.close()
+        self._instruments = InstrumentTable.fromDict(self._fetched, now_date)
+        self._instruments.save(*self.instrument_paths)
+        self.instruments_stale = False
+        del self._fetched
         logger.info("已保存全部共%d个合约..." % len(self._instruments))
 
-    def _buildInstrumentsDict(self):
-        for symbol in self._instruments:
-            instrument = self._instruments[symbol]
-            instrument["symbol"] = symbol
-            if re.search(r"[\d\-][CP][\d\-]", symbol):
-                try:
-                    self.instruments_option[re.findall(r"([A-Za-z]{2,}\d{2,})", symbol)[0]].append(instrument)
-                except:
-                    self.instruments_option[re.findall(r'(^[A-Za-z]\d+)', symbol)[0]].append(instrument)
-            else:
-                self.instruments_future[instrument['exchange']].append(instrument)
+    async def refreshInstruments(self):
+        '''
+        重新查询全部合约并与本地合约表比较，只替换有变化的合约；返回新增、删除、变化的合约代码
+        '''
+        rows = await self._query("instruments", PRIORITY_INSTRUMENT,
+                                 lambda req_id: self.ReqQryInstrument(CTPStruct.QryInstrumentField(), req_id),
+                                 "获取所有合约", INSTRUMENT_TIMEOUT)
+        diff = self._instruments.apply(dict(rows), time.strftime("%Y-%m-%d", time.localtime()))
+        self._instruments.save(*self.instrument_paths)
+        self._instruments_option = None
+        self._instruments_future = None
+        self._option_chain = None
+        self.instruments_stale = False
+        logger.info("已刷新全部共%d个合约，新增%d个，删除%d个，变化%d个..." % (
+            len(self._instruments), len(diff["added"]), len(diff["removed"]), len(diff["changed"])))
+        return diff
+
+    @property
+    def instruments_future(self):
+        '''
+        {交易所: [期货合约]}，首次访问时由合约表的分类生成
+        '''
+        if self._instruments_future is None:
+            self._instruments_future = defaultdict(list, self._instruments.futures())
+        return self._instruments_future
+
+    @property
+    def instruments_option(self):
+        '''
+        {标的期货代码: [期权合约]}
+        '''
+        if self._instruments_option is None:
+            self._instruments_option = defaultdict(list, self._instruments.options())
+        return self._instruments_option
+
+    @property
+    def option_chain(self):
+        '''
+        期权链索引，首次访问时建立，合约表刷新后重建
+        '''
+        if self._option_chain is None:
+            self._option_chain = OptionChain(self._instruments)
+        return self._option_chain
+
+    def _gotInstrument(self, field):
+        if field.OptionsType == '1':  # THOST_FTDC_CP_CallOptions
+            option_type = "call"
+        elif field.OptionsType == '2':  # THOST_FTDC_CP_PutOptions
+            option_type = "put"
+        else:
+            option_type = None
+        expire_date = None if field.ExpireDate == "" else \
+            time.strftime("%Y-%m-%d", time.strptime(field.ExpireDate, "%Y%m%d"))
+        return field.InstrumentID, {"name": field.InstrumentName,
+                                    "exchange": field.ExchangeID, "multiple": field.VolumeMultiple,
+                                    "price_tick": field.PriceTick, "expire_date": expire_date,
+                                    "long_margin_ratio": FILTER(field.LongMarginRatio),
+                                    "short_margin_ratio": FILTER(field.ShortMarginRatio),
+                                    "option_type": option_type,
+                                    "strike_price": FILTER(field.StrikePrice),
+                                    "is_trading": bool(field.IsTrading)}
 
     def OnRspQryInstrument(self, field, info, req_id, is_last):
-        assert (req_id == 3)
+        if req_id != 3:
+            if not self.checkRspInfoInRequest(info, req_id):
+                return
+            if field:
+                self.gotRow(req_id, self._gotInstrument(field))
+            if is_last:
+                self.completeRequest(req_id)
+            return
         if not self.checkRspInfoInCallback(info):
             assert (is_last)
             return
         if field:
-            # logger.info(f"OnRspQryInstrument, {field=}")
-            if field.OptionsType == '1':  # THOST_FTDC_CP_CallOptions
-                option_type = "call"
-            elif field.OptionsType == '2':  # THOST_FTDC_CP_PutOptions
-                option_type = "put"
-            else:
-                option_type = None
-            expire_date = None if field.ExpireDate == "" else \
-                time.strftime("%Y-%m-%d", time.strptime(field.ExpireDate, "%Y%m%d"))
-            self._instruments[field.InstrumentID] = {"name": field.InstrumentName,
-                                                     "exchange": field.ExchangeID, "multiple": field.VolumeMultiple,
-                                                     "price_tick": field.PriceTick, "expire_date": expire_date,
-                                                     "long_margin_ratio": FILTER(field.LongMarginRatio),
-                                                     "short_margin_ratio": FILTER(field.ShortMarginRatio),
-                                                     "option_type": option_type,
-                                                     "strike_price": FILTER(field.StrikePrice),
-                                                     "is_trading": bool(field.IsTrading)}
+            code, instrument = self._gotInstrument(field)
+            self._fetched[code] = instrument
         if is_last:
-            logger.info("已获取全部共%d个合约..." % len(self._instruments))
+            logger.info("已获取全部共%d个合约..." % len(self._fetched))
             self.notifyCompletion()
 
-    def getAccount(self):
+    async def getAccount(self):
+        '''
+        实时资金：以查询到的资金为基准，由持仓引擎按成交和行情推算变化
+        '''
+        account = self._positions.account()
+        if account is None:
+            await self.getPositions()
+            await self._refreshAccount()
+            account = self._positions.account() or self.lastAccount
+        return [account, self._positions.updated_at]
+
+    async def _refreshAccount(self):
         # THOST_FTDC_BZTP_Future = 1
         try:
             field = CTPStruct.QryTradingAccountField(BrokerID=self._broker_id,
                                                      InvestorID=self._user_id, CurrencyID="CNY", BizType='1')
-            logger.info(f"getAccount, {field=}")
-            self.resetCompletion()
-            self._limitFrequency()
-            self.checkApiReturn(self.ReqQryTradingAccount(field, 8))
-            self.waitCompletion("获取资金账户")
+            logger.info("getAccount, field=%r", field)
+            rows = await self._query("account", PRIORITY_ACCOUNT,
+                                     lambda req_id: self.ReqQryTradingAccount(field, req_id), "获取资金账户")
+            if rows:
+                self._account = rows[-1]
+                self.lastAccount = self._account
+                if self._positions.seeded:
+                    self._positions.anchorAccount(self._account)
         except Exception as e:
-            logger.error(f"getAccount, {e=}, {self._account=}")
-        return [self.lastAccount, self.lastDataTime]
+            logger.error(f"getAccount, {e=}, {self.lastAccount=}")
 
-    def getQuote(self, code):
+    async def getQuote(self, code):
         start_date = time.strftime("%H:%M:%S", time.localtime(time.time() - 1000))
         end_date = time.strftime("%H:%M:%S", time.localtime())
         logger.info(f"{start_date=}. {end_date=},{self._instruments[code]['exchange']=}")
@@ -212,99 +315,74 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
                                         InvestorID=self._user_id, InstrumentID=code, InsertTimeStart=start_date,
                                         InsertTimeEnd=end_date,
                                         ExchangeID=self._instruments[code]["exchange"], QuoteSysID="123")
-        logger.info(f"getQuote, {field=}")
-        self.resetCompletion()
-        self._limitFrequency()
-        rq = self.ReqQryQuote(field, 8)
-        logger.info(f"rq, {rq=}")
-        self.checkApiReturn(rq)
-        self.waitCompletion("获取报价")
+        logger.info("getQuote, field=%r", field)
+        await self._query("quote:%s" % code, PRIORITY_ORDER,
+                          lambda req_id: self.ReqQryQuote(field, req_id), "获取报价")
         return self._account
 
     def OnRspQryTradingAccount(self, field, info, req_id, is_last):
-        assert (req_id == 8)
         assert (is_last)
-        logger.info(f"OnRspQryTradingAccount, {field=}")
-        if not self.checkRspInfoInCallback(info):
+        logger.info("OnRspQryTradingAccount, field=%r", field)
+        if not self.checkRspInfoInRequest(info, req_id):
             return
-        self._account = {"balance": round(field.Balance, 2), "margin": round(field.CurrMargin, 2),
-                         "available": round(field.Available, 2), "profit": round(field.PositionProfit, 2)}
+        if field:
+            self.gotRow(req_id, {"balance": round(field.Balance, 2), "margin": round(field.CurrMargin, 2),
+                                 "available": round(field.Available, 2), "profit": round(field.PositionProfit, 2)})
         logger.info("已获取资金账户...")
-        self.lastAccount = self._account
-        self.notifyCompletion()
+        self.completeRequest(req_id)
 
     def OnRspQryQuote(self, field, info, req_id, is_last):
-        # assert(req_id == 8)
-        # assert(is_last)
-        logger.info(f"OnRspQryQuote, {field=}， {info=},{req_id=},{is_last=}")
-        if not self.checkRspInfoInCallback(info):
+        logger.info("OnRspQryQuote, field=%r， info=%r,req_id=%r,is_last=%r", field, info, req_id, is_last)
+        if not self.checkRspInfoInRequest(info, req_id):
             return
-        # self._account = {"balance": field.Balance, "margin": field.CurrMargin,
-        #         "available": field.Available}
-        logger.info("已获取报价...")
-        self.notifyCompletion()
-
-    def getOrders(self):
-        self._orders = {}
-        try:
-            field = CTPStruct.QryOrderField(BrokerID=self._broker_id,
-                                            InvestorID=self._user_id)
-            logger.info(f"getOrders, {field=}")
-            self.resetCompletion()
-            self._limitFrequency()
-            self.checkApiReturn(self.ReqQryOrder(field, 4))
-            self.waitCompletion("获取所有报单")
-            _orders = sorted(self._orders.items(), key=lambda x: x[1]['insert_time'])
-            self._orders = OrderedDict(_orders)
-        except Exception as e:
-            logger.error(f"getOrders, {e=}, {self._orders=}")
-        try:
-            if self.lastOrders:
-                for order_id in self.lastOrders:
-                    instruments = self._instruments[self.lastOrders[order_id]['code']].copy()
-                    number_str = str(instruments.get("price_tick"))
-                    decimal_places = 2
-                    if number_str and '.' in number_str:
-                        decimal_places = len(number_str.split('.')[1])
-                    self.lastOrders[order_id]['decimal_places'] = decimal_places
-                    self.lastOrders[order_id]['volume'] = int(self.lastOrders[order_id]['volume'])
-                self.lastOrders = {i: j for i, j in sorted(self.lastOrders.items(), key=lambda x: x[1]['insert_time'] + x[0])}
-        except Exception as e:
-            logger.error(f"lastOrders, {e=}, {self.lastOrders=}")
-        return [self.lastOrders, self.lastDataTime]
-
-    def getTrades(self):
-        self._trades = {}
-        try:
-            field = CTPStruct.QryTradeField(BrokerID=self._broker_id,
-                                            InvestorID=self._user_id)
-            logger.info(f"getTrades, {field=}")
-            self.resetCompletion()
-            self._limitFrequency()
-            self.checkApiReturn(self.ReqQryTrade(field, 4))
-            self.waitCompletion("获取所有成交")
-            _trades = sorted(self._trades.items(), key=lambda x: x[1]['trade_time'])
-            self._trades = OrderedDict(_trades)
-        except Exception as e:
-            logger.error(f"getTrades, {e=}, {self._trades=}")
-        try:
-            if self.lastTrades:
-                for order_id in self.lastTrades:
-                    instruments = self._instruments[self.lastTrades[order_id]['code']].copy()
-                    number_str = str(instruments.get("price_tick"))
-                    decimal_places = 2
-                    if number_str and '.' in number_str:
-                        decimal_places = len(number_str.split('.')[1])
-                    self.lastTrades[order_id]['decimal_places'] = decimal_places
-                    self.lastTrades[order_id]['volume'] = int(self.lastTrades[order_id]['volume'])
-                self.lastTrades = {i: j for i, j in sorted(self.lastTrades.items(), key=lambda x: x[1]['trade_time'] + x[0])}
-        except Exception as e:
-            logger.error(f"lastTrades, {e=}, {self.lastTrades=}")
-        return [self.lastTrades, self.lastDataTime]
+        if is_last:
+            logger.info("已获取报价...")
+            self.completeRequest(req_id)
+
+    async def getOrders(self):
+        '''
+        返回报单簿快照；首次调用时查询一次全部报单作为初始状态，之后由OnRtnOrder增量维护
+        '''
+        if not self._book.orders_seeded:
+            try:
+                field = CTPStruct.QryOrderField(BrokerID=self._broker_id,
+                                                InvestorID=self._user_id)
+                logger.info("getOrders, field=%r", field)
+                rows = await self._query("orders", PRIORITY_ORDER,
+                                         lambda req_id: self.ReqQryOrder(field, req_id), "获取所有报单")
+                self._book.seedOrders(rows)
+            except Exception as e:
+                logger.error(f"getOrders, {e=}")
+        return [self._book.orders(), self._book.updated_at]
+
+    async def getTrades(self):
+        '''
+        返回成交记录快照；首次调用时查询一次全部成交作为初始状态，之后由OnRtnTrade增量维护
+        '''
+        if not self._book.trades_seeded:
+            try:
+                field = CTPStruct.QryTradeField(BrokerID=self._broker_id,
+                                                InvestorID=self._user_id)
+                logger.info("getTrades, field=%r", field)
+                rows = await self._query("trades", PRIORITY_ORDER,
+                                         lambda req_id: self.ReqQryTrade(field, req_id), "获取所有成交")
+                self._book.seedTrades(rows)
+            except Exception as e:
+                logger.error(f"getTrades, {e=}")
+        return [self._book.trades(), self._book.updated_at]
+
+    def _decimalPlaces(self, code):
+        if code not in self._decimal_places:
+            number_str = str(self._instruments.get(code, {}).get("price_tick"))
+            decimal_places = 2
+            if number_str and '.' in number_str:
+                decimal_places = len(number_str.split('.')[1])
+            self._decimal_places[code] = decimal_places
+        return self._decimal_places[code]
 
     def _gotOrder(self, order):
         if len(order.OrderSysID) == 0:
-            return
+            return None
         oid = "%s@%s" % (order.OrderSysID, order.InstrumentID)
         (direction, volume) = (int(order.Direction), order.VolumeTotalOriginal)
         assert (direction in (0, 1))
@@ -314,77 +392,97 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
         direction = "short" if direction else "long"
         # THOST_FTDC_OST_AllTraded = 0, THOST_FTDC_OST_Canceled = 5
         is_active = order.OrderStatus not in ('0', '5')
-        logger.info(f"_gotOrder = {order}")
-        assert (oid not in self._orders)
-        self._orders[oid] = {"code": order.InstrumentID, "direction": direction,
-                             "price": order.LimitPrice, "volume": volume, "insert_time": order.InsertTime,
-                             "cancel_time": order.CancelTime, "active_time": order.ActiveTime, "update_time": order.UpdateTime,
-                             "comb_offset_flag": order.CombOffsetFlag,
-                             "volume_traded": order.VolumeTraded, "is_active": is_active}
+        logger.debug("_gotOrder = %s", order)
+        return oid, {"code": order.InstrumentID, "direction": direction,
+                     "price": order.LimitPrice, "volume": int(volume), "insert_time": order.InsertTime,
+                     "cancel_time": order.CancelTime, "active_time": order.ActiveTime, "update_time": order.UpdateTime,
+                     "comb_offset_flag": order.CombOffsetFlag,
+                     "volume_traded": order.VolumeTraded, "is_active": is_active,
+                     "decimal_places": self._decimalPlaces(order.InstrumentID)}
 
     def _gotTrade(self, trade):
         if len(trade.TradeID) == 0:
-            return
-        logger.info(f"_gotTrade = {trade}")
+            return None
+        logger.debug("_gotTrade = %s", trade)
         oid = "%s@%s" % (trade.TradeID, trade.InstrumentID)
         (direction, volume) = (int(trade.Direction), trade.Volume)
         assert (direction in (0, 1))
         direction = "short" if direction else "long"
-        self._trades[oid] = {"code": trade.InstrumentID, "direction": direction, "order_id": trade.OrderSysID,
-                             "price": trade.Price, "volume": volume, "trade_date": trade.TradeDate,
-                             "trade_time": trade.TradeTime}
+        return oid, {"code": trade.InstrumentID, "direction": direction, "order_id": trade.OrderSysID,
+                     "price": trade.Price, "volume": int(volume), "trade_date": trade.TradeDate,
+                     "trade_time": trade.TradeTime, "decimal_places": self._decimalPlaces(trade.InstrumentID)}
 
     def OnRspQryOrder(self, field, info, req_id, is_last):
-        assert (req_id == 4)
-        if not self.checkRspInfoInCallback(info):
+        if not self.checkRspInfoInRequest(info, req_id):
             assert (is_last)
             return
         if field:
-            self._gotOrder(field)
+            row = self._gotOrder(field)
+            if row:
+                self.gotRow(req_id, row)
         if is_last:
             logger.info("已获取所有报单...")
-            self.lastDataTime = datetime.datetime.now(timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
-            self.lastOrders = self._orders
-            self.notifyCompletion()
+            self.completeRequest(req_id)
 
     def OnRspQryTrade(self, field, info, req_id, is_last):
-        assert (req_id == 4)
-        if not self.checkRspInfoInCallback(info):
+        if not self.checkRspInfoInRequest(info, req_id):
             assert (is_last)
             return
         if field:
-            self._gotTrade(field)
+            row = self._gotTrade(field)
+            if row:
+                self.gotRow(req_id, row)
         if is_last:
             logger.info("已获取所有成交...")
-            self.lastDataTime = datetime.datetime.now(timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
-            self.lastTrades = self._trades
-            self.notifyCompletion()
+            self.completeRequest(req_id)
 
-    def getPositions(self):
-        self._positions = []
-        try:
-            field = CTPStruct.QryInvestorPositionField(BrokerID=self._broker_id,
-                                                       InvestorID=self._user_id)
-            self.resetCompletion()
-            self._limitFrequency()
-            logger.info(f"getPositions, {field=}")
-            self.checkApiReturn(self.ReqQryInvestorPosition(field, 5))
-            self.waitCompletion("获取所有持仓")
-        except Exception as e:
-            logger.error(f"getPositions, {e=}, {self._positions=}")
-        try:
-            if self.lastPositions:
-                for position in self.lastPositions:
-                    instruments = self._instruments[position['code']].copy()
-                    number_str = str(instruments.get("price_tick"))
-                    decimal_places = 2
-                    if number_str and '.' in number_str:
-                        decimal_places = len(number_str.split('.')[1])
-                    position['decimal_places'] = decimal_places
-                self.lastPositions.sort(key=lambda x: x['code'])
-        except Exception as e:
-            logger.error(f"lastPositions, {e=}, {self.lastPositions=}")
-        return [self.lastPositions, self.lastDataTime]
+    async def getPositions(self):
+        '''
+        返回持仓引擎快照；首次调用时查询一次持仓作为初始状态
+        '''
+        if not self._positions.seeded:
+            try:
+                self._positions.seed(await self._queryPositions())
+            except Exception as e:
+                logger.error(f"getPositions, {e=}")
+        return [self._positions.positions(), self._positions.updated_at]
+
+    def sharedState(self):
+        '''
+        已初始化的持仓、资金、报单、成交快照，格式与对应的get接口相同；只读内存，不会触发CTP查询
+        '''
+        state = {}
+        if self._positions.seeded:
+            state["position"] = [self._positions.positions(), self._positions.updated_at]
+            account = self._positions.account()
+            if account is not None:
+                state["account"] = [account, self._positions.updated_at]
+        if self._book.orders_seeded:
+            state["orders"] = [self._book.orders(), self._book.updated_at]
+        if self._book.trades_seeded:
+            state["trades"] = [self._book.trades(), self._book.updated_at]
+        return state
+
+    async def reconcilePositions(self):
+        '''
+        与CTP持仓查询对账，记录并返回差异，随后以查询结果和最新资金为准
+        '''
+        drift = self._positions.reconcile(await self._queryPositions())
+        await self._refreshAccount()
+        if drift:
+            logger.warning(f"reconcilePositions, {drift=}")
+        self.lastDrift = drift
+        return drift
+
+    def _queryPositions(self):
+        field = CTPStruct.QryInvestorPositionField(BrokerID=self._broker_id,
+                                                   InvestorID=self._user_id)
+        logger.info("getPositions, field=%r", field)
+        return self._query("positions", PRIORITY_POSITION,
+                           lambda req_id: self.ReqQryInvestorPosition(field, req_id), "获取所有持仓")
+
+    def onTick(self, code, price):
+        self._positions.onTick(code, price)
 
     def _gotPosition(self, position):
         code = position.InstrumentID
@@ -393,81 +491,56 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
         elif position.PosiDirection == '3':  # THOST_FTDC_PD_Short
             direction = "short"
         else:
-            return
+            return None
         volume = position.Position
         if volume == 0:
-            return
-        logger.info(f"_gotPosition, {position=}")
+            return None
+        logger.debug("_gotPosition, position=%r", position)
         open_cost = round(position.OpenCost, 2)
         position_cost = round(position.PositionCost, 2)
         position_profit = round(position.PositionProfit, 2)
         multiple = self._instruments[code]['multiple']
-        self._positions.append({"code": code, "direction": direction,
-                                "volume": int(volume), "margin": round(position.UseMargin, 2),
-                                "cost": open_cost, "position_date": position.PositionDate,
-                                "yd_position": position.YdPosition, "today_position": position.TodayPosition,
-                                "long_frozen": position.LongFrozen, "short_frozen": position.ShortFrozen,
-                                "open_volume": position.OpenVolume, "close_volume": position.CloseVolume,
-                                "settlement_price": position.SettlementPrice,
-                                "position_profit": position_profit,
-                                "profit": position_profit + open_cost - position_cost,
-                                "open_cost_price": round(float(position.OpenCost) / float(volume) / float(multiple), 2),
-                                })
+        return {"code": code, "direction": direction,
+                "volume": int(volume), "margin": round(position.UseMargin, 2),
+                "cost": open_cost, "position_cost": position_cost, "position_date": position.PositionDate,
+                "yd_position": position.YdPosition, "today_position": position.TodayPosition,
+                "long_frozen": position.LongFrozen, "short_frozen": position.ShortFrozen,
+                "open_volume": position.OpenVolume, "close_volume": position.CloseVolume,
+                "settlement_price": position.SettlementPrice,
+                "position_profit": position_profit,
+                "profit": position_profit + open_cost - position_cost,
+                "open_cost_price": round(float(position.OpenCost) / float(volume) / float(multiple), 2),
+                "decimal_places": self._decimalPlaces(code),
+                }
 
     def OnRspQryInvestorPosition(self, field, info, req_id, is_last):
-        assert (req_id == 5)
-        if not self.checkRspInfoInCallback(info):
+        if not self.checkRspInfoInRequest(info, req_id):
             assert (is_last)
             return
         if field:
-            self._gotPosition(field)
+            row = self._gotPosition(field)
+            if row:
+                self.gotRow(req_id, row)
         if is_last:
-            self.lastPositions = self._positions
-            self.lastDataTime = datetime.datetime.now(timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
             logger.info("已获取所有持仓...")
-            self.notifyCompletion()
+            # 与OnRtnTrade同在SPI线程，此后的成交不在本次查询结果中
+            self._positions.hold()
+            self.completeRequest(req_id)
 
     def OnRtnOrder(self, order):
-        if self._order_action:
-            if self._order_action(order):
-                self._order_action = None
+        row = self._gotOrder(order)
+        if row:
+            self._book.onOrder(*row)
+        self._tracker.onOrder(order)
 
     def OnRtnTrade(self, trade):
-        logger.info(trade)
-
-    def _handleNewOrder(self, order):
-        order_ref = None if len(order.OrderRef) == 0 else int(order.OrderRef)
-        if (order.FrontID, order.SessionID, order_ref) != \
-                (self._front_id, self._session_id, self._order_ref):
-            return False
-        logger.info(f"_handleNewOrder, {order=}")
-        if order.OrderStatus == 'a':  # THOST_FTDC_OST_Unknown
-            return False
-        if order.OrderSubmitStatus == '4':  # THOST_FTDC_OSS_InsertRejected
-            self.notifyCompletion(order.StatusMsg)
-            return True
-        if order.TimeCondition == '1':  # THOST_FTDC_TC_IOC
-            # THOST_FTDC_OST_AllTraded = 0, THOST_FTDC_OST_Canceled = 5
-            if order.OrderStatus in ('0', '5'):
-                logger.info("已执行IOC单，成交量：%d" % order.VolumeTraded)
-                self._traded_volume = order.VolumeTraded
-                self.notifyCompletion()
-                return True
-        else:
-            assert (order.TimeCondition == '3')  # THOST_FTDC_TC_GFD
-            if order.OrderSubmitStatus in ("3", "0"):  # THOST_FTDC_OSS_Accepted
-                # THOST_FTDC_OST_AllTraded = 0, THOST_FTDC_OST_PartTradedQueueing = 1
-                # THOST_FTDC_OST_PartTradedNotQueueing = 2, THOST_FTDC_OST_NoTradeQueueing = 3
-                # THOST_FTDC_OST_NoTradeNotQueueing = 4, THOST_FTDC_OST_Canceled = 5
-                assert (order.OrderStatus in ('0', '1', '2', '3', '4', '5'))
-                assert (len(order.OrderSysID) != 0)
-                self._order_id = "%s@%s" % (order.OrderSysID, order.InstrumentID)
-                logger.info("已提交限价单（单号：<%s>）" % self._order_id)
-                self.notifyCompletion()
-                return True
-        return False
-
-    def _order(self, code, direction, volume, price, min_volume, target_price_type=None, target_offset_flag=None):
+        row = self._gotTrade(trade)
+        if row:
+            self._book.onTrade(*row)
+            self._positions.onTrade(trade.InstrumentID, int(trade.Direction), trade.OffsetFlag,
+                                    trade.Price, trade.Volume)
+
+    async def _order(self, code, direction, volume, price, min_volume, target_price_type=None, target_offset_flag=None):
         if code not in self._instruments:
             raise ValueError("合约<%s>不存在！" % code)
         exchange = self._instruments[code]["exchange"]
@@ -505,98 +578,223 @@ class TraderImpl(SpiHelper, CTP.TraderApiPy):
                 raise ValueError("最小成交量<%s>不能超过交易数量<%s>" % (min_volume, volume))
             # THOST_FTDC_OPT_LimitPrice, THOST_FTDC_TC_IOC, THOST_FTDC_VC_MV
             (price_type, time_cond, volume_cond) = ('2', '1', '2')
-        self._order_ref += 1
-        self._order_action = self._handleNewOrder
-        field = CTPStruct.InputOrderField(BrokerID=self._broker_id,
-                                          InvestorID=self._user_id, ExchangeID=exchange, InstrumentID=code,
-                                          Direction=direction,
-                                          CombOffsetFlag=offset_flag if not target_offset_flag else target_offset_flag,
-                                          TimeCondition=time_cond, VolumeCondition=volume_cond,
-                                          OrderPriceType=price_type if not target_price_type else target_price_type,
-                                          LimitPrice=price,
-                                          VolumeTotalOriginal=volume, MinVolume=min_volume,
-                                          CombHedgeFlag='1',  # THOST_FTDC_HF_Speculation
-                                          ContingentCondition='1',  # THOST_FTDC_CC_Immediately
-                                          ForceCloseReason='0',  # THOST_FTDC_FCC_NotForceClose
-                                          OrderRef="%12d" % self._order_ref)
-        logger.info(f"_order, {field=}")
-        self.resetCompletion()
-        rq = self.ReqOrderInsert(field, 6)
-        self.checkApiReturn(rq)
-        self.waitCompletion("录入报单")
+
+        def send(order_ref):
+            field = CTPStruct.InputOrderField(BrokerID=self._broker_id,
+                                              InvestorID=self._user_id, ExchangeID=exchange, InstrumentID=code,
+                                              Direction=direction,
+                                              CombOffsetFlag=offset_flag if not target_offset_flag else target_offset_flag,
+                                              TimeCondition=time_cond, VolumeCondition=volume_cond,
+                                              OrderPriceType=price_type if not target_price_type else target_price_type,
+                                              LimitPrice=price,
+                                              VolumeTotalOriginal=volume, MinVolume=min_volume,
+                                              CombHedgeFlag='1',  # THOST_FTDC_HF_Speculation
+                                              ContingentCondition='1',  # THOST_FTDC_CC_Immediately
+                                              ForceCloseReason='0',  # THOST_FTDC_FCC_NotForceClose
+                                              OrderRef="%12d" % order_ref)
+            logger.info("_order, field=%r", field)
+            return self.ReqOrderInsert(field, 6)
+
+        # 按报单引用登记后发送，不等待其他在途报单；GFD限价单返回单号，IOC类订单返回成交量
+        await self._throttle()
+        return await self.submitOrder(send, time_cond, "录入报单")
+
+    async def submitOrder(self, send, time_condition, operation_name="", timeout=MAX_TIMEOUT):
+        '''
+        登记后发送报单，send接收报单引用并返回API返回值；不占用完成状态，多笔报单可以同时在途
+        '''
+        pending = self._tracker.registerInsert(time_condition, operation_name, timeout)
+        try:
+            self.checkApiReturn(send(pending.order_ref))
+            return await pending.wait()
+        finally:
+            self._tracker.discard(pending)
+
+    async def cancelOrder(self, order_id, send, operation_name="", timeout=MAX_TIMEOUT):
+        '''
+        登记后发送撤单，按单号等待回报
+        '''
+        pending = self._tracker.registerAction(order_id, operation_name, timeout)
+        try:
+            self.checkApiReturn(send())
+            return await pending.wait()
+        finally:
+            self._tracker.discard(pending)
+
+    async def _throttle(self):
+        delay = self._order_bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
 
     def OnRspOrderInsert(self, field, info, req_id, is_last):
         assert (req_id == 6)
         assert (is_last)
-        logger.info(f"OnRspOrderInsert, {field=}")
+        logger.info("OnRspOrderInsert, field=%r", field)
         self.OnErrRtnOrderInsert(field, info)
 
-    def OnErrRtnOrderInsert(self, _, info):
-        success = self.checkRspInfoInCallback(info)
-        assert (not success)
+    def OnErrRtnOrderInsert(self, field, info):
+        if field and info and info.ErrorID != 0:
+            self._tracker.insertFailed(field.OrderRef, info.ErrorMsg)
 
-    def orderMarket(self, code, direction, volume, target_price_type=None, offset_flag=None):
-        self._order(code, direction, volume, 0, 0, target_price_type, offset_flag)
-        return self._traded_volume
+    async def orderMarket(self, code, direction, volume, target_price_type=None, offset_flag=None):
+        return await self._order(code, direction, volume, 0, 0, target_price_type, offset_flag)
 
-    def orderFAK(self, code, direction, volume, price, min_volume):
+    async def orderFAK(self, code, direction, volume, price, min_volume):
         assert (price > 0)
-        self._order(code, direction, volume, price, 1 if min_volume == 0 else min_volume)
-        return self._traded_volume
+        return await self._order(code, direction, volume, price, 1 if min_volume == 0 else min_volume)
 
-    def orderFOK(self, code, direction, volume, price):
-        return self.orderFAK(code, direction, volume, price, volume)
+    async def orderFOK(self, code, direction, volume, price):
+        return await self.orderFAK(code, direction, volume, price, volume)
 
-    def orderLimit(self, code, direction, volume, price, target_offset_flag=None):
+    async def orderLimit(self, code, direction, volume, price, target_offset_flag=None):
         assert (price > 0)
-        self._order(code, direction, volume, price, 0, target_offset_flag=target_offset_flag)
-        return self._order_id
+        return await self._order(code, direction, volume, price, 0, target_offset_flag=target_offset_flag)
 
-    def _handleDeleteOrder(self, order):
-        oid = "%s@%s" % (order.OrderSysID, order.InstrumentID)
-        if oid != self._order_id:
-            return False
-        logger.info(f"_handleDeleteOrder, {order=}")
-        if order.OrderSubmitStatus == '5':  # THOST_FTDC_OSS_CancelRejected
-            self._order_delete_status = {"order_id": self._order_id, "status": order.StatusMsg}
-            self.notifyCompletion(order.StatusMsg)
-            return True
-        # THOST_FTDC_OST_AllTraded = 0, THOST_FTDC_OST_Canceled = 5
-        if order.OrderStatus in ('0', '5'):
-            logger.info("已撤销限价单，单号：<%s>" % self._order_id)
-            self._order_delete_status = {"order_id": self._order_id, "status": order.StatusMsg}
-            # StatusMsg(已撤单) 不再抛出异常
-            self.notifyCompletion()
-            return True
-        return False
-
-    def deleteOrder(self, order_id):
-        self._order_delete_status = {}
-        items = order_id.split("@")
+    def _checkOrderId(self, order_id):
+        items = order_id.split("@") if isinstance(order_id, str) else []
         if len(items) != 2:
             raise ValueError("订单号<%s>格式错误" % order_id)
         (sys_id, code) = items
         if code not in self._instruments:
             raise ValueError("订单号<%s>中的合约号<%s>不存在" % (order_id, code))
+        return sys_id, code
+
+    async def deleteOrder(self, order_id):
+        (sys_id, code) = self._checkOrderId(order_id)
         field = CTPStruct.InputOrderActionField(BrokerID=self._broker_id,
                                                 InvestorID=self._user_id, UserID=self._user_id,
                                                 ActionFlag='0',  # THOST_FTDC_AF_Delete
                                                 ExchangeID=self._instruments[code]["exchange"],
                                                 InstrumentID=code, OrderSysID=sys_id)
-        logger.info(f"deleteOrder, {field=}")
-        self.resetCompletion()
-        self._order_id = order_id
-        self._order_action = self._handleDeleteOrder
-        self.checkApiReturn(self.ReqOrderAction(field, 7))
-        self.waitCompletion("撤销报单")
-        return self._order_delete_status
+        logger.info("deleteOrder, field=%r", field)
+        await self._throttle()
+        return await self.cancelOrder(order_id, lambda: self.ReqOrderAction(field, 7), "撤销报单")
+
+    def checkOrders(self, orders, limits=None):
+        '''
+        批量报单前整体校验：合约、买卖方向、数量符号、最小变动价位、涨跌停板，以及平仓数量累计不超过持仓。
+        limits为{合约代码: (跌停价, 涨停价)}。返回(规范化后的报单列表, [{"index", "code", "error"}])
+        '''
+        limits = limits or {}
+        checked, errors = [], []
+        closing = defaultdict(int)
+        for index, order in enumerate(orders):
+            try:
+                item = self._checkOrder(order, limits)
+                # 未指定开平标志时负数表示平仓，持仓已知时检查同方向持仓是否足够
+                if item["volume"] < 0 and not item["offset_flag"] and self._positions.seeded:
+                    key = (item["code"], item["direction"])
+                    closing[key] -= item["volume"]
+                    held = self._positions.volume(*key)
+                    if closing[key] > held:
+                        raise ValueError("合约<%s>%s平仓数量<%d>超过持仓<%d>" % (key[0], key[1], closing[key], held))
+                item["index"] = index
+                checked.append(item)
+            except (ValueError, TypeError) as e:
+                errors.append({"index": index, "code": order.get("code") if isinstance(order, dict) else None,
+                               "error": str(e)})
+        return checked, errors
+
+    def _checkOrder(self, order, limits):
+        if not isinstance(order, dict):
+            raise ValueError("报单<%s>格式错误" % order)
+        code = order.get("code")
+        if code not in self._instruments:
+            raise ValueError("合约<%s>不存在！" % code)
+        direction = order.get("direction", "long")
+        if direction not in ("long", "short"):
+            raise ValueError("错误的买卖方向<%s>" % direction)
+        volume = order.get("volume", 1)
+        if isinstance(volume, bool) or not isinstance(volume, (int, float)) or volume != int(volume) or volume == 0:
+            raise ValueError("交易数量<%s>必须是非零整数" % volume)
+        kind = order.get("type", "limit")
+        if kind not in ORDER_TYPES:
+            raise ValueError("错误的报单类型<%s>" % kind)
+        price = float(order.get("price", 0))
+        if kind == "market":
+            price = 0.0
+        else:
+            if price <= 0:
+                raise ValueError("价格<%s>必须大于0" % price)
+            price_tick = self._instruments[code]["price_tick"]
+            if price_tick and abs(price / price_tick - round(price / price_tick)) > 1e-6:
+                raise ValueError("价格<%s>不是最小变动价位<%s>的整数倍" % (price, price_tick))
+            lower, upper = limits.get(code) or (None, None)
+            if lower and price < lower or upper and price > upper:
+                raise ValueError("价格<%s>超出涨跌停板[%s, %s]" % (price, lower, upper))
+        min_volume = int(order.get("min_volume", 0))
+        if kind == "fak" and abs(min_volume) > abs(volume):
+            raise ValueError("最小成交量<%s>不能超过交易数量<%s>" % (min_volume, volume))
+        return {"code": code, "direction": direction, "volume": int(volume), "price": price, "type": kind,
+                "min_volume": min_volume, "offset_flag": order.get("offset_flag")}
+
+    def _submit(self, order):
+        kind, volume = order["type"], order["volume"]
+        if kind in ("limit", "market"):
+            min_volume = 0
+        elif kind == "fak":
+            min_volume = order["min_volume"] or 1
+        else:
+            min_volume = volume
+        return self._order(order["code"], order["direction"], volume, order["price"], min_volume,
+                           target_offset_flag=order["offset_flag"])
+
+    async def orderBatch(self, orders):
+        '''
+        提交checkOrders校验过的报单，按流控依次发出、不逐笔等待回报；
+        按完成顺序逐项产出{"index", "code", "result"或"error"}
+        '''
+        async def run(order):
+            item = {"index": order["index"], "code": order["code"]}
+            try:
+                item["result"] = await self._submit(order)
+            except Exception as e:
+                item["error"] = str(e)
+            return item
+
+        for future in asyncio.as_completed([run(order) for order in orders]):
+            yield await future
+
+    def checkOrderIds(self, order_ids):
+        '''
+        批量撤单前校验订单号格式与合约，返回[{"index", "order_id", "error"}]
+        '''
+        errors = []
+        for index, order_id in enumerate(order_ids):
+            try:
+                self._checkOrderId(order_id)
+            except ValueError as e:
+                errors.append({"index": index, "order_id": order_id, "error": str(e)})
+        return errors
+
+    async def activeOrders(self, code=None):
+        '''
+        报单簿中尚未完成、可以撤销的订单号；code为None时为全部合约
+        '''
+        orders, _ = await self.getOrders()
+        return [oid for oid, order in orders.items() if order["is_active"] and (code is None or order["code"] == code)]
+
+    async def cancelBatch(self, order_ids):
+        '''
+        同时撤销多个订单，按完成顺序逐项产出{"index", "order_id", "result"或"error"}
+        '''
+        async def run(index, order_id):
+            item = {"index": index, "order_id": order_id}
+            try:
+                item["result"] = await self.deleteOrder(order_id)
+            except Exception as e:
+                item["error"] = str(e)
+            return item
+
+        for future in asyncio.as_completed([run(i, order_id) for i, order_id in enumerate(order_ids)]):
+            yield await future
 
     def OnRspOrderAction(self, field, info, req_id, is_last):
-        logger.info(f"OnRspOrderAction, {field=}")
+        logger.info("OnRspOrderAction, field=%r", field)
         assert (req_id == 7)
         assert (is_last)
         self.OnErrRtnOrderAction(field, info)
 
-    def OnErrRtnOrderAction(self, _, info):
-        success = self.checkRspInfoInCallback(info)
-        assert (not success)
+    def OnErrRtnOrderAction(self, field, info):
+        if field and info and info.ErrorID != 0:
+            self._tracker.actionFailed("%s@%s" % (field.OrderSysID, field.InstrumentID), info.ErrorMsg)
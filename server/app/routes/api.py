@@ -1,5 +1,6 @@
 import asyncio
 import hashlib
+import json
 
 import aiohttp
 import datetime
@@ -13,7 +14,11 @@ from pytz import timezone
 logger = logging.getLogger(__name__)
 from sanic import Blueprint, response
 
-from app.internal.ctp import ctp_client
+from app.internal.ctp import ctp_client, sessions, shared, owner_socket
+from app.internal.tick import encodeTicks
+from app.internal.serializer import dumpb
+from app.internal.metrics import monitorLoopLag
+from app.internal.constants import RECONCILE_INTERVAL
 
 api = Blueprint('ctp_trade')
 
@@ -44,11 +49,51 @@ async def login_request():
             logger.info(f"login retry {i}, res: {res}")
             if 'time' in res:
                 break
+    # 行情账户已登录，只重试登录失败的其他账户
+    for account in res.get('errors', {}):
+        for i in range(10):
+            await asyncio.sleep(6)
+            retry = await get_json(base_url + '/login?account=' + account)
+            logger.info(f"login retry {account} {i}, res: {retry}")
+            if 'time' in retry:
+                break
     return res
 
 
 
 
+async def refresh_instruments_request():
+    try:
+        diff = await ctp_client.refreshInstruments()
+        logger.info(f"refresh instruments, {len(diff['added'])=}, {len(diff['removed'])=}, {len(diff['changed'])=}")
+    except Exception as e:
+        logger.error(f"refresh instruments error: {e}")
+
+
+async def warm_up_request():
+    for client in sessions:
+        try:
+            await client.warmUp()
+        except Exception as e:
+            logger.error(f"warm up {client.user_id} error: {e}")
+
+
+async def reconcile_request():
+    for client in sessions:
+        try:
+            drift = await client.reconcilePositions()
+            logger.info(f"reconcile {client.user_id}, {drift=}")
+        except Exception as e:
+            logger.error(f"reconcile {client.user_id} error: {e}")
+
+
+def account_client(request):
+    '''
+    按请求参数account选择账户，未指定时为account.yaml中的默认账户
+    '''
+    return sessions.get(request.args.get("account"))
+
+
 async def logout_request():
     base_url = 'http://127.0.0.1:7000'
     res = await get_json(base_url + '/logout')
@@ -63,20 +108,28 @@ async def before_server_start(app, loop):
     global session, scheduler, ctp_client
     jar = aiohttp.CookieJar(unsafe=True)
     timeout = aiohttp.ClientTimeout(total=15)
-    session = aiohttp.ClientSession(cookie_jar=jar, connector=aiohttp.TCPConnector(ssl=False), timeout=timeout)
+    # owner进程只监听unix socket，定时登录直接请求自己
+    connector = aiohttp.UnixConnector(path=owner_socket) if owner_socket else aiohttp.TCPConnector(ssl=False)
+    session = aiohttp.ClientSession(cookie_jar=jar, connector=connector, timeout=timeout)
     scheduler = AsyncIOScheduler()
     scheduler.add_job(login_request, 'cron', id='job_login', day_of_week='mon,tue,wed,thu,fri', hour='8,20', minute=40,
                       second=0)
     scheduler.add_job(login_request, trigger='date',
                       next_run_time=datetime.datetime.now(timezone('Asia/Shanghai')) + datetime.timedelta(seconds=10), id="pad_task")
+    scheduler.add_job(reconcile_request, 'interval', id='job_reconcile', seconds=RECONCILE_INTERVAL)
     scheduler.start()
+    app.add_task(monitorLoopLag())
+    if shared:
+        app.add_task(shared.run())
 
 
 @api.listener('after_server_stop')
 async def after_server_stop(app, loop):
     '''关闭session'''
     logger.info("after_server_stop")
-    ctp_client.logout()
+    sessions.logout()
+    if shared:
+        shared.close()
     await session.close()
     scheduler.shutdown()
 
@@ -89,8 +142,17 @@ async def html(request):
 @api.route('/login', methods=['GET'])
 async def login(request):
     try:
-        ctp_client.login()
-        return response.json({"time": datetime.datetime.now(timezone('Asia/Shanghai')).strftime('%Y-%m-%d %H:%M:%S')})
+        # 登录需要同步等待认证、结算确认和合约查询，放到线程池中避免阻塞事件循环
+        # 未指定account时登录全部账户，errors为登录失败的其他账户
+        errors = await asyncio.get_running_loop().run_in_executor(None, sessions.login, request.args.get("account"))
+        if ctp_client.instrumentsStale():
+            asyncio.create_task(refresh_instruments_request())
+        # 持仓、资金、报单、成交在登录后即初始化，不占用首次读取
+        asyncio.create_task(warm_up_request())
+        data = {"time": datetime.datetime.now(timezone('Asia/Shanghai')).strftime('%Y-%m-%d %H:%M:%S')}
+        if errors:
+            data["errors"] = errors
+        return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
 
@@ -98,16 +160,27 @@ async def login(request):
 @api.route('/logout', methods=['GET'])
 async def logout(request):
     try:
-        ctp_client.logout()
+        sessions.logout(request.args.get("account"))
         return response.json({"time": datetime.datetime.now(timezone('Asia/Shanghai')).strftime('%Y-%m-%d %H:%M:%S')})
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
 
 
+@api.route('/get_accounts', methods=['GET'])
+async def get_accounts(request):
+    '''
+    进程中托管的账户及登录状态；交易、持仓、报单类接口以account参数指定账户，未指定时为默认账户
+    '''
+    try:
+        return response.json(sessions.accounts(), ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
 @api.route('/get_account', methods=['GET'])
 async def get_account(request):
     try:
-        data = ctp_client.getAccount()
+        data = await account_client(request).getAccount()
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
@@ -116,7 +189,19 @@ async def get_account(request):
 @api.route('/get_position', methods=['GET'])
 async def get_postion(request):
     try:
-        data = ctp_client.getPositions()
+        data = await account_client(request).getPositions()
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/reconcile_position', methods=['GET'])
+async def reconcile_position(request):
+    '''
+    立即与CTP持仓查询对账，返回差异
+    '''
+    try:
+        data = await account_client(request).reconcilePositions()
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
@@ -136,7 +221,7 @@ async def order_limit(request):
     offset_flag = request.args.get("offset_flag")
 
     try:
-        data = ctp_client.orderLimit(code, direction, volume, price, offset_flag)
+        data = await account_client(request).orderLimit(code, direction, volume, price, offset_flag)
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
@@ -154,7 +239,7 @@ async def order_market(request):
     offset_flag = request.args.get("offset_flag")
 
     try:
-        data = ctp_client.orderMarket(code, direction, volume, price_type, offset_flag)
+        data = await account_client(request).orderMarket(code, direction, volume, price_type, offset_flag)
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
@@ -171,9 +256,10 @@ async def order_market(request):
     price_type = request.args.get("price_type", "bid1")
     plus = request.args.get("plus", 0)
     offset_flag = request.args.get("offset_flag")
-    price, e = ctp_client.get_custom_price(code, price_type, plus)
     try:
-        data = ctp_client.orderLimit(code, direction, volume, price, offset_flag)
+        client = account_client(request)
+        price, e = await client.get_custom_price(code, price_type, plus)
+        data = await client.orderLimit(code, direction, volume, price, offset_flag)
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
@@ -186,16 +272,73 @@ async def order_delete(request):
     '''
     order_id = request.args.get("order_id")
     try:
-        data = ctp_client.deleteOrder(order_id)
+        data = await account_client(request).deleteOrder(order_id)
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"status": str(e)}, ensure_ascii=False)
 
 
+async def stream_results(request, results):
+    '''
+    以NDJSON逐行返回批量操作每一项的结果，按完成顺序
+    '''
+    resp = await request.respond(content_type="application/x-ndjson")
+    async for item in results:
+        await resp.send(dumpb(item) + b"\n")
+    await resp.eof()
+
+
+def batch_items(body, name):
+    '''
+    请求体可以直接是列表，也可以是{name: 列表}
+    '''
+    items = body.get(name) if isinstance(body, dict) else body
+    if not isinstance(items, list) or not items:
+        raise ValueError("请求体中缺少%s列表" % name)
+    return items
+
+
+@api.route('/orders/batch', methods=['POST'])
+async def orders_batch(request):
+    '''
+    批量下单。请求体为报单列表或{"orders": [...]}，每项为{"code", "direction", "volume", "price", "type", "min_volume",
+    "offset_flag"}，type为limit（默认）、market、fak、fok之一，volume的正负与/order_limit相同。
+    先整体校验，任一项不合法时都不提交，返回{"error", "results": [{"index", "code", "error"}]}；
+    校验通过后按流控尽快提交，以NDJSON逐行返回{"index", "code", "result"或"error"}。
+    '''
+    try:
+        checked, errors = account_client(request).checkOrders(batch_items(request.json, "orders"))
+        if errors:
+            return response.json({"error": "报单校验失败", "results": errors}, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+    await stream_results(request, account_client(request).orderBatch(checked))
+
+
+@api.route('/orders/cancel_batch', methods=['POST'])
+async def orders_cancel_batch(request):
+    '''
+    批量撤单。请求体为{"order_ids": [...]}；或{"code": "MA301"}撤销该合约全部未完成报单；或{"all": true}撤销全部未完成报单。
+    以NDJSON逐行返回{"index", "order_id", "result"或"error"}。
+    '''
+    try:
+        client = account_client(request)
+        body = request.json
+        if isinstance(body, dict) and (body.get("all") or body.get("code")):
+            order_ids, errors = await client.cancelTargets(code=None if body.get("all") else body["code"])
+        else:
+            order_ids, errors = await client.cancelTargets(batch_items(body, "order_ids"))
+        if errors:
+            return response.json({"error": "订单号校验失败", "results": errors}, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+    await stream_results(request, client.cancelBatch(order_ids))
+
+
 @api.route('/get_orders', methods=['GET'])
 async def get_orders(request):
     try:
-        data = ctp_client.getOrders()
+        data = await account_client(request).getOrders()
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
@@ -204,20 +347,144 @@ async def get_orders(request):
 @api.route('/get_trades', methods=['GET'])
 async def get_trades(request):
     try:
-        data = ctp_client.getTrades()
+        data = await account_client(request).getTrades()
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_query_stats', methods=['GET'])
+async def get_query_stats(request):
+    '''
+    查询流控队列深度、排队时间
+    '''
+    try:
+        data = account_client(request).queryStats()
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_bus_stats', methods=['GET'])
+async def get_bus_stats(request):
+    '''
+    行情总线各订阅方的待处理数、丢弃数和延迟
+    '''
+    try:
+        return response.json(ctp_client.busStats(), ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/metrics', methods=['GET'])
+async def metrics(request):
+    '''
+    Prometheus指标：CTP请求、报单回报、tick回调耗时分布，按交易所的tick数，订阅数、队列深度、事件循环延迟，超时与API错误计数
+    '''
+    try:
+        return response.text(ctp_client.metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/replay', methods=['GET'])
+async def replay(request):
+    '''
+    回放已记录的行情：days为逗号分隔的交易日，codes可选，speed为倍速或max
+    '''
+    try:
+        days = request.args.get("days").split(',')
+        codes = request.args.get("codes")
+        speed = request.args.get("speed", "1")
+        speed = None if speed == "max" else float(speed)
+        data = await asyncio.get_running_loop().run_in_executor(
+            None, ctp_client.replay, days, codes.split(',') if codes else None, speed)
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
 
 
+@api.route('/refresh_instruments', methods=['GET'])
+async def refresh_instruments(request):
+    '''
+    重新查询全部合约，只替换有变化的合约
+    '''
+    try:
+        data = await ctp_client.refreshInstruments()
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+def payload_response(request, payload):
+    '''
+    返回预序列化的响应：ETag命中时返回304，否则按Accept-Encoding返回压缩后的字节
+    '''
+    if isinstance(payload, str):
+        return response.json(payload, ensure_ascii=False)
+    headers = {"ETag": payload.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if payload.matches(request.headers.get("if-none-match")):
+        return response.empty(status=304, headers=headers)
+    body, encoding = payload.encode(request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return response.raw(body, headers=headers, content_type="application/json")
+
+
 @api.route('/get_instruments_future', methods=['GET'])
 async def get_instruments_future(request):
     exchange = request.args.get("exchange", "")
     try:
-        if exchange == "":
-            data = ctp_client.get_instruments_future()
-        else:
-            data = ctp_client.get_instruments_future(exchange)
+        return payload_response(request, ctp_client.instrumentsPayload("future", exchange or None))
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_instruments_option', methods=['GET'])
+async def get_instruments_option(request):
+    '''
+    期权合约列表，future指定标的期货时按到期日、行权价排序
+    '''
+    try:
+        return payload_response(request, ctp_client.instrumentsPayload("option", request.args.get("future")))
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_option_chain', methods=['GET'])
+async def get_option_chain(request):
+    '''
+    期权链：underlying为标的期货，expire_date可选
+    '''
+    try:
+        data = ctp_client.getOptionChain(request.args.get("underlying"), request.args.get("expire_date"))
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_option_strikes', methods=['GET'])
+async def get_option_strikes(request):
+    '''
+    标的最新价附近上下各n档行权价的认购、认沽合约，price可选，默认取标的行情
+    '''
+    try:
+        price = request.args.get("price")
+        data = await ctp_client.getOptionStrikes(request.args.get("underlying"), int(request.args.get("n", 5)),
+                                                 request.args.get("expire_date"),
+                                                 None if price is None else float(price))
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_option_info', methods=['GET'])
+async def get_option_info(request):
+    '''
+    期权所属标的、到期日、行权价和平值行权价
+    '''
+    try:
+        data = await ctp_client.getOptionInfo(request.args.get("code"))
         return response.json(data, ensure_ascii=False)
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
@@ -226,14 +493,11 @@ async def get_instruments_future(request):
 @api.route('/get_instruments', methods=['GET'])
 async def get_instruments(request):
     try:
-        data = ctp_client.get_instruments_future()
-        instruments = []
-        for j in data.values():
-            instruments.extend([k['symbol'] for k in j if 'symbol' in k])
-        return response.json(instruments, ensure_ascii=False)
+        return payload_response(request, ctp_client.instrumentsPayload("symbols"))
     except Exception as e:
         return response.json({"error": str(e)}, ensure_ascii=False)
 
+
 @api.route('/get_instruments_detail', methods=['GET'])
 async def get_instruments_detail(request):
     code = request.args.get("code", "")
@@ -247,13 +511,55 @@ async def get_instruments_detail(request):
         return response.json({"error": str(e)}, ensure_ascii=False)
 
 
+@api.route('/get_snapshot', methods=['GET'])
+async def get_snapshot(request):
+    '''
+    批量行情快照：fields为逗号分隔的字段（如last,volume,bid_price），可按codes、exchange、product过滤
+    '''
+    fields = request.args.get("fields", "last,bid_price,ask_price").split(',')
+    codes = request.args.get("codes")
+    try:
+        data = ctp_client.snapshot(fields, codes.split(',') if codes else None,
+                                   request.args.get("exchange"), request.args.get("product"))
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_spreads', methods=['GET'])
+async def get_spreads(request):
+    '''
+    已订阅合约的一档买卖价差，可按codes、exchange、product过滤
+    '''
+    codes = request.args.get("codes")
+    try:
+        data = ctp_client.spreads(codes.split(',') if codes else None,
+                                  request.args.get("exchange"), request.args.get("product"))
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@api.route('/get_bars', methods=['GET'])
+async def get_bars(request):
+    '''
+    已订阅合约的K线：codes为逗号分隔的合约，interval为1s/1m/5m/15m/1h，n为根数
+    '''
+    codes = request.args.get("codes", "")
+    try:
+        data = ctp_client.getBars([code for code in codes.split(',') if code], request.args.get("interval", "1m"),
+                                  int(request.args.get("n", 100)))
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
 @api.route('/subscribe', methods=['GET'])
 async def subscribe(request):
     codes = request.args.get("codes")
     try:
         if codes != "":
-            ctp_client.subscribe(codes.split(','))
-            ctp_client.setReceiver()
+            await ctp_client.subscribe(codes.split(','))
             data = "已订阅{}合约".format(codes)
         else:
             data = {}
@@ -262,12 +568,24 @@ async def subscribe(request):
         return response.json({"error": str(e)}, ensure_ascii=False)
 
 
+@api.route('/get_subscriptions', methods=['GET'])
+async def get_subscriptions(request):
+    '''
+    行情订阅状态：各合约的持有者、应答状态和首个tick时间，codes可选
+    '''
+    codes = request.args.get("codes")
+    try:
+        return response.json(ctp_client.subscriptions(codes.split(',') if codes else None), ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
 @api.route('/unsubscribe', methods=['GET'])
 async def unsubscribe(request):
     codes = request.args.get("codes")
     try:
         if codes != "":
-            ctp_client.unsubscribe(codes.split(','))
+            await ctp_client.unsubscribe(codes.split(','))
             data = "已取消订阅{0}".format(codes)
         else:
             data = {}
@@ -276,6 +594,48 @@ async def unsubscribe(request):
         return response.json({"error": str(e)}, ensure_ascii=False)
 
 
+async def _read_stream_commands(ws, subscriber):
+    '''
+    处理客户端发来的{"subscribe": [...], "unsubscribe": [...]}，连接断开时结束推送
+    '''
+    try:
+        while True:
+            message = await ws.recv()
+            if message is None:
+                break
+            try:
+                command = json.loads(message)
+                await ctp_client.updateStream(subscriber, command.get("subscribe", []), command.get("unsubscribe", []))
+            except Exception as e:
+                await ws.send(json.dumps({"error": str(e)}, ensure_ascii=False))
+    finally:
+        subscriber.close()
+
+
+@api.websocket('/ws/quotes')
+async def ws_quotes(request, ws):
+    '''
+    行情推送：codes为逗号分隔的合约代码，每条消息为{合约代码: tick}。
+    客户端处理不及时时只保留每个合约最新的tick。
+    '''
+    codes = [i for i in request.args.get("codes", "").split(',') if i]
+    try:
+        subscriber = await ctp_client.openStream(codes)
+    except Exception as e:
+        await ws.send(json.dumps({"error": str(e)}, ensure_ascii=False))
+        return
+    reader = asyncio.ensure_future(_read_stream_commands(ws, subscriber))
+    try:
+        while True:
+            batch = await subscriber.get()
+            if batch is None:
+                break
+            await ws.send(encodeTicks(batch))
+    finally:
+        reader.cancel()
+        ctp_client.closeStream(subscriber)
+
+
 @api.route('/query_points', methods=['GET'])
 async def query_points(request):
     '''
@@ -283,9 +643,9 @@ async def query_points(request):
     '''
     code = request.args.get('code')
     try:
-        data = ctp_client.query_points(code)
+        data = await ctp_client.query_points(code)
         if not data:
-            data = ctp_client.query_points(code)
+            data = await ctp_client.query_points(code)
             if not data:
                 data = "订阅失败，超时10秒没有返回"
         return response.json(data, ensure_ascii=False)
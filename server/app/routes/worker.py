@@ -0,0 +1,158 @@
+import asyncio
+import logging
+
+import aiohttp
+from sanic import Blueprint, response
+
+from app.config import account
+from app.internal.shared import SharedReader
+
+
+logger = logging.getLogger(__name__)
+
+worker = Blueprint('ctp_worker')
+
+# 由owner重新生成或由worker自己设置的头不转发
+HOP_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "content-length", "upgrade",
+               "access-control-allow-origin"}
+OWNER_URL = "http://owner"
+
+
+@worker.listener('before_server_start')
+async def before_server_start(app, loop):
+    '''挂载共享内存，建立到owner进程的unix socket连接池'''
+    global reader, owner
+    reader = SharedReader(account.shared_prefix)
+    owner = aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=account.owner_socket),
+                                  timeout=aiohttp.ClientTimeout(total=None))
+
+
+@worker.listener('after_server_stop')
+async def after_server_stop(app, loop):
+    await owner.close()
+
+
+async def forward(request):
+    '''
+    原样转发到owner进程，响应体按块透传，NDJSON批量结果逐行返回
+    '''
+    url = OWNER_URL + request.path + ("?" + request.query_string if request.query_string else "")
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+    out = None
+    try:
+        async with owner.request(request.method, url, headers=headers, data=request.body or None) as resp:
+            out = await request.respond(status=resp.status, content_type=resp.headers.get("Content-Type"),
+                                        headers={k: v for k, v in resp.headers.items()
+                                                 if k.lower() not in HOP_HEADERS and k.lower() != "content-type"})
+            async for chunk in resp.content.iter_any():
+                await out.send(chunk)
+            await out.eof()
+    except aiohttp.ClientError as e:
+        logger.error(f"forward {request.path} error: {e!r}")
+        if out is not None:
+            # 已开始透传响应体，只能断开连接
+            raise
+        return response.json({"error": "owner进程不可用: %s" % e}, ensure_ascii=False, status=502)
+
+
+@worker.route('/get_snapshot', methods=['GET'])
+async def get_snapshot(request):
+    '''
+    行情快照直接读共享内存，参数与返回值同owner的/get_snapshot
+    '''
+    quotes = reader.quotes()
+    if quotes is None:
+        return await forward(request)
+    fields = request.args.get("fields", "last,bid_price,ask_price").split(',')
+    codes = request.args.get("codes")
+    try:
+        data = quotes.snapshot(fields, codes=codes.split(',') if codes else None,
+                               exchange=request.args.get("exchange"), product=request.args.get("product"))
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+@worker.route('/get_spreads', methods=['GET'])
+async def get_spreads(request):
+    quotes = reader.quotes()
+    if quotes is None:
+        return await forward(request)
+    codes = request.args.get("codes")
+    try:
+        data = quotes.spreads(codes=codes.split(',') if codes else None,
+                              exchange=request.args.get("exchange"), product=request.args.get("product"))
+        return response.json(data, ensure_ascii=False)
+    except Exception as e:
+        return response.json({"error": str(e)}, ensure_ascii=False)
+
+
+async def state_response(request, kind):
+    '''
+    返回owner发布的账户快照字节；尚未查询过（未发布）时转发，由owner查询CTP后发布
+    '''
+    try:
+        data = reader.state(kind, request.args.get("account"))
+    except Exception as e:
+        logger.error(f"read shared {kind} error: {e!r}")
+        data = None
+    if data is None:
+        return await forward(request)
+    return response.raw(data, content_type="application/json")
+
+
+@worker.route('/get_position', methods=['GET'])
+async def get_position(request):
+    return await state_response(request, "position")
+
+
+@worker.route('/get_account', methods=['GET'])
+async def get_account(request):
+    return await state_response(request, "account")
+
+
+@worker.route('/get_orders', methods=['GET'])
+async def get_orders(request):
+    return await state_response(request, "orders")
+
+
+@worker.route('/get_trades', methods=['GET'])
+async def get_trades(request):
+    return await state_response(request, "trades")
+
+
+@worker.websocket('/ws/quotes')
+async def ws_quotes(request, ws):
+    '''
+    行情推送由owner的TickStream产生，worker双向转发帧
+    '''
+    url = OWNER_URL + request.path + ("?" + request.query_string if request.query_string else "")
+    async with owner.ws_connect(url) as upstream:
+        async def commands():
+            while True:
+                message = await ws.recv()
+                if message is None:
+                    break
+                if isinstance(message, bytes):
+                    await upstream.send_bytes(message)
+                else:
+                    await upstream.send_str(message)
+            await upstream.close()
+
+        task = asyncio.create_task(commands())
+        try:
+            async for message in upstream:
+                if message.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    break
+                await ws.send(message.data)
+        finally:
+            task.cancel()
+
+
+@worker.route('/', methods=['GET'])
+@worker.route('/<path:path>', methods=['GET', 'POST'])
+async def proxy(request, path=""):
+    '''
+    下单、撤单、登录、订阅等其他接口都由owner进程处理
+    '''
+    return await forward(request)
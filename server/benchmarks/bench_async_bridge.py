@@ -0,0 +1,69 @@
+'''
+对比同步waitCompletion与异步waitCompletionAsync对事件循环的影响。
+
+用后台线程模拟SPI回调，在请求处理期间测量事件循环心跳的最大间隔：
+同步等待会把整个事件循环阻塞到回调返回，异步等待期间其他协程照常运行。
+
+    cd server && python -m benchmarks.bench_async_bridge
+'''
+import asyncio
+import threading
+import time
+
+from app.internal.spi import SpiHelper
+
+
+RTT = 0.2
+REQUESTS = 5
+
+
+class FakeSpi(SpiHelper):
+    def request(self):
+        threading.Timer(RTT, self.notifyCompletion).start()
+        return 0
+
+
+async def heartbeat(stop, gaps):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.005)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+
+async def sync_handler(spi):
+    spi.resetCompletion()
+    spi.checkApiReturn(spi.request())
+    spi.waitCompletion("同步请求")
+
+
+async def async_handler(spi):
+    async with spi.requestLock():
+        spi.resetCompletion()
+        spi.checkApiReturn(spi.request())
+        await spi.waitCompletionAsync("异步请求")
+
+
+async def run(handler):
+    spi = FakeSpi()
+    stop = asyncio.Event()
+    gaps = []
+    beat = asyncio.create_task(heartbeat(stop, gaps))
+    start = time.perf_counter()
+    await asyncio.gather(*[handler(spi) for _ in range(REQUESTS)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    return elapsed, max(gaps) if gaps else elapsed
+
+
+def main():
+    for name, handler in (("sync", sync_handler), ("async", async_handler)):
+        elapsed, max_gap = asyncio.run(run(handler))
+        print("%-6s requests=%d rtt=%.0fms total=%.0fms max_loop_stall=%.1fms" %
+              (name, REQUESTS, RTT * 1000, elapsed * 1000, max_gap * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+K线生成：按交易时段生成一整个交易日（夜盘加日盘）的tick，测试BarEngine每个tick的耗时、
+数千个合约写满环形数组后的内存，以及时段切分、成交量差分、查询N根K线的耗时。
+
+    cd server && python -m benchmarks.bench_bars
+'''
+import random
+import time
+
+from app.internal.bars import BarEngine, SESSIONS, INTERVALS
+from app.internal.constants import BAR_HISTORY
+from app.internal.tick import Tick
+
+
+CODES = 2000
+# 写满内存：每个合约每隔STEP秒一个tick，跑完整个交易日
+STEP = 60
+# 每tick耗时：活跃合约每秒两个tick
+LIQUID_CODES = 200
+LIQUID_SECONDS = 600
+SEED = 11
+DAY = "20261019"
+
+
+def session_times(kind, step):
+    for start, end in SESSIONS[kind]:
+        for ms in range(start, end + 1, step * 1000):
+            seconds = ms // 1000 % 86400
+            yield "%02d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def make_tick(code, update_time, price, volume):
+    tick = Tick(code)
+    tick.trading_day = DAY
+    tick.update_time = update_time
+    tick.last_price = price
+    tick.volume = volume
+    tick.turnover = volume * 10.0
+    tick.open_interest = 1000.0
+    return tick
+
+
+def check():
+    '''
+    10:15小节休息前后分属两根K线，夜盘K线归入交易日，各周期成交量之和等于首尾累计成交量之差
+    '''
+    engine = BarEngine(lambda code: ("SHFE", "rb"))
+    times = ["20:59:00", "21:00:01", "23:59:59", "00:00:30", "10:14:59", "10:15:00", "10:30:00", "14:59:59",
+             "15:00:00", "15:30:00"]
+    for i, update_time in enumerate(times):
+        engine.onTick(make_tick("rb2601", update_time, 3000.0 + i, 10 * (i + 1)))
+    hour = engine.bars("rb2601", "1h", 100)
+    assert [bar["time"] for bar in hour] == ["21:00:00", "23:00:00", "00:00:00", "10:00:00", "10:30:00",
+                                             "14:00:00"], hour
+    assert {bar["trading_day"] for bar in hour} == {DAY}
+    for interval in INTERVALS:
+        assert sum(bar["volume"] for bar in engine.bars("rb2601", interval, 1000)) == 80, interval
+    index = BarEngine(lambda code: ("CFFEX", "IF"))
+    index.onTick(make_tick("IF2601", "09:29:00", 4000.0, 0))
+    index.onTick(make_tick("IF2601", "11:30:00", 4001.0, 5))
+    assert [bar["time"] for bar in index.bars("IF2601", "1m", 10)] == ["09:30:00", "11:29:00"]
+    print("sessions ok")
+
+
+def run(engine, codes, times, repeat, rnd):
+    ticks = {code: make_tick(code, times[0], 3000.0, 0) for code in codes}
+    elapsed = 0
+    count = 0
+    for update_time in times:
+        batch = []
+        for _ in range(repeat):
+            for code in codes:
+                tick = ticks[code]
+                tick = make_tick(code, update_time, tick.last_price + rnd.randint(-2, 2),
+                                 tick.volume + rnd.randint(0, 9))
+                ticks[code] = tick
+                batch.append(tick)
+        started = time.perf_counter_ns()
+        for tick in batch:
+            engine.onTick(tick)
+        elapsed += time.perf_counter_ns() - started
+        count += len(batch)
+    return count, elapsed
+
+
+def main():
+    check()
+    rnd = random.Random(SEED)
+    engine = BarEngine(lambda code: ("SHFE", "rb"))
+    times = list(session_times("commodity", 1))[:LIQUID_SECONDS]
+    count, elapsed = run(engine, ["c%04d" % i for i in range(LIQUID_CODES)], times, 2, rnd)
+    print("%d codes x 2 ticks/s, %d ticks: %.0f ns/tick (%d intervals)" % (
+        LIQUID_CODES, count, elapsed / count, len(INTERVALS)))
+
+    engine = BarEngine(lambda code: ("SHFE", "rb"))
+    codes = ["c%04d" % i for i in range(CODES)]
+    count, elapsed = run(engine, codes, list(session_times("commodity", STEP)), 1, rnd)
+    print("%d codes x 1 tick/%ds, whole day, %d ticks: %.0f ns/tick" % (CODES, STEP, count, elapsed / count))
+    print("bar arrays: %.1f MB (%d bars x %d intervals per code at most)" % (
+        engine.memory() / 1e6, BAR_HISTORY, len(INTERVALS)))
+    for n in (10, 100, BAR_HISTORY):
+        started = time.perf_counter_ns()
+        for code in codes[:100]:
+            bars = engine.bars(code, "1m", n)
+        print("query %3d bars: %7.1f us" % (n, (time.perf_counter_ns() - started) / 100 / 1000))
+    assert len(bars) == BAR_HISTORY
+
+
+if __name__ == "__main__":
+    main()
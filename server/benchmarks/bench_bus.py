@@ -0,0 +1,70 @@
+'''
+行情总线：测试发布端（SPI回调线程）在挂上不同订阅方时每个tick的耗时，
+并检查一个处理很慢的订阅方只会丢弃自己缓冲区中的tick，不拖慢发布端和其他订阅方。
+
+    cd server && python -m benchmarks.bench_bus
+'''
+import time
+
+from app.internal.bus import TickBus
+from app.internal.tick import Tick
+from benchmarks.bench_tick import make_fields, CODES, SEED
+
+
+TICKS = 100000
+
+
+def publish(bus, fields):
+    ticks = {}
+    started = time.perf_counter_ns()
+    for field in fields:
+        tick = ticks.get(field.InstrumentID)
+        if tick is None:
+            tick = ticks[field.InstrumentID] = Tick(field.InstrumentID)
+        tick.update(field)
+        bus.publish(tick)
+    return (time.perf_counter_ns() - started) / len(fields)
+
+
+def wait_idle(subscribers, timeout=30):
+    deadline = time.monotonic() + timeout
+    while any(i.pending for i in subscribers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def main():
+    fields = make_fields(TICKS, CODES, SEED)
+    print("no subscribers:      %6.0f ns/tick" % publish(TickBus(), fields))
+
+    bus = TickBus()
+    counted = []
+    fast = bus.subscribe("fast", counted.append)
+    print("1 subscriber:        %6.0f ns/tick" % publish(bus, fields))
+    wait_idle([fast])
+    assert len(counted) == TICKS, len(counted)
+    bus.unsubscribe(fast)
+
+    bus = TickBus()
+    counted = []
+    product = []
+    fast = bus.subscribe("fast", counted.append)
+    # 只订阅一半合约，按代码过滤
+    half = bus.subscribe("half", product.append, codes=["c%04d" % i for i in range(0, CODES, 2)])
+    slow = bus.subscribe("slow", lambda tick: time.sleep(0.001), capacity=1000)
+    ns = publish(bus, fields)
+    print("fast+half+slow:      %6.0f ns/tick" % ns)
+    wait_idle([fast, half])
+    print("slow lag: %.0f ms, pending %d" % (slow.lag() * 1000, slow.pending))
+    assert len(counted) == TICKS and len(product) == TICKS // 2, (len(counted), len(product))
+    assert slow.dropped > 0 and slow.pending <= 1000
+    for item in bus.stats():
+        print(item["name"], {k: item[k] for k in ("pending", "delivered", "dropped", "lag_ms")})
+    # 副本不随原记录变化
+    last = {}
+    for tick in counted:
+        last[tick.code] = tick
+    assert all(last["c%04d" % (i % CODES)].volume == fields[i].Volume for i in range(TICKS - CODES, TICKS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+'''
+端到端基准：以模拟前置（account.yaml中的simulator）为后端，固定随机种子，测量
+  - ingest：OnRtnDepthMarketData → parse_hq → QuoteStore的tick吞吐（ticks/s），进程内直接调用
+  - startup：从启动服务进程到第一次/login成功的耗时
+  - latency：并发请求/order_limit、/order_delete、/get_position、/query_points的延迟分位数
+  - rss：服务进程在压缩的一个交易时段（每个合约session_ticks个tick）内的RSS增长
+结果以JSON输出；指定--baseline时与之前的结果比较，任一指标变差超过--tolerance时以状态1退出。
+
+    cd server && python -m benchmarks.bench_e2e --output e2e.json
+    cd server && python -m benchmarks.bench_e2e --only ingest,latency --baseline e2e.json
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+
+SEED = 18
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_URL = "http://127.0.0.1:7000"
+STAGES = ("ingest", "startup", "latency", "rss")
+# 服务启动后约10秒会自行调用一次/login（api.before_server_start），重新登录会重置订阅，需等它完成后再压测
+SELF_LOGIN_DELAY = 12
+# 指标名 -> 是否越大越好，用于与基准结果比较
+HIGHER_IS_BETTER = {"ticks_per_sec": True}
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": round(values[-1] * 1000, 3)}
+
+
+def sim_options(args):
+    return {"futures": args.codes, "options": 0, "tick_rate": args.tick_rate, "rtt": args.rtt,
+            "positions": 10, "orders": 0, "trades": 0, "seed": SEED}
+
+
+# ---- ingest ----
+
+def bench_ingest(args):
+    '''
+    进程内登录模拟前置，直接以回调线程的方式调用OnRtnDepthMarketData
+    '''
+    from app.internal.client import Client
+    from app.internal.simulator import SimExchange
+
+    options = dict(sim_options(args), tick_rate=0)
+    client = Client("", "", "sim", "", "", "bench", "", simulator=options)
+    client.login()
+    try:
+        exchange = SimExchange.shared()
+        rnd = random.Random(SEED)
+        codes = [c for c, i in exchange.instruments.items() if i["ProductClass"] == '1']
+        fields = [exchange._step(rnd, codes[i % len(codes)]) for i in range(min(args.ticks, 20000))]
+        receive = client._md.OnRtnDepthMarketData
+        for field in fields[:1000]:
+            receive(field)
+        started = time.perf_counter()
+        for i in range(args.ticks):
+            receive(fields[i % len(fields)])
+        elapsed = time.perf_counter() - started
+    finally:
+        client.logout()
+    return {"ticks": args.ticks, "codes": len(codes), "seconds": round(elapsed, 3),
+            "ticks_per_sec": round(args.ticks / elapsed)}
+
+
+# ---- 服务进程 ----
+
+def start_server(args):
+    env = dict(os.environ, PYTHONPATH=".",
+               CTP_SIMULATOR="@json " + json.dumps(sim_options(args)),
+               # 压测时不让报单流控成为瓶颈
+               CTP_ORDER_RATE="100000", CTP_ORDER_BURST="100000")
+    return subprocess.Popen([sys.executable, "app/ctp_service.py"], cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def rss_mb(pid):
+    '''
+    Linux下从/proc读取常驻内存，其他平台返回None
+    '''
+    try:
+        with open("/proc/%d/status" % pid) as fd:
+            for line in fd:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+async def get(session, path, **params):
+    async with session.get(BASE_URL + path, params=params) as resp:
+        return await resp.json(content_type=None)
+
+
+async def wait_login(session, started, timeout=120):
+    while time.perf_counter() - started < timeout:
+        try:
+            data = await get(session, "/login")
+            if isinstance(data, dict) and "time" in data:
+                return time.perf_counter() - started
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            pass
+        await asyncio.sleep(0.05)
+    raise TimeoutError("服务启动超时")
+
+
+async def load(session, path, params, concurrency):
+    '''
+    concurrency个协程并发请求，params为每个请求的参数列表；返回延迟统计与各请求的响应
+    '''
+    latencies, results = [], [None] * len(params)
+    errors = 0
+    queue = asyncio.Queue()
+    for item in enumerate(params):
+        queue.put_nowait(item)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            index, kwargs = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                data = await get(session, path, **kwargs)
+                latencies.append(time.perf_counter() - started)
+                results[index] = data
+                if isinstance(data, dict) and ("error" in data or path == "/order_delete" and "order_id" not in data):
+                    errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    stats = dict(count=len(params), errors=errors, concurrency=concurrency,
+                 requests_per_sec=round(len(params) / elapsed, 1), **percentiles(latencies))
+    return stats, results
+
+
+async def bench_server(args, stages):
+    results = {}
+    started = time.perf_counter()
+    proc = start_server(args)
+    try:
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            startup = await wait_login(session, started)
+            if "startup" in stages:
+                results["startup"] = {"seconds_to_login": round(startup, 3)}
+            if not set(stages) & {"latency", "rss"}:
+                return results
+            await asyncio.sleep(max(0, SELF_LOGIN_DELAY - (time.perf_counter() - started)))
+            await wait_login(session, time.perf_counter())
+            codes = (await get(session, "/get_instruments"))[:args.order_codes]
+            await get(session, "/subscribe", codes=",".join(codes))
+            if "latency" in stages:
+                results["latency"] = await bench_latency(session, args, codes)
+            if "rss" in stages:
+                results["rss"] = await bench_rss(session, args, proc.pid)
+    finally:
+        stop_server(proc)
+    return results
+
+
+async def bench_latency(session, args, codes):
+    latency = {}
+    ticks = {}
+    for code in codes:
+        ticks[code] = await get(session, "/query_points", code=code)
+    # 按跌停价挂买单，不会成交，随后全部撤销
+    orders = [{"code": code, "direction": "long", "volume": 1, "price": ticks[code]["lower_limit_price"]}
+              for code in codes for _ in range(args.requests // len(codes))]
+    latency["/order_limit"], order_ids = await load(session, "/order_limit", orders, args.concurrency)
+    order_ids = [i for i in order_ids if isinstance(i, str)]
+    latency["/order_delete"], _ = await load(session, "/order_delete", [{"order_id": i} for i in order_ids],
+                                             args.concurrency)
+    latency["/get_position"], _ = await load(session, "/get_position", [{}] * args.requests, args.concurrency)
+    latency["/query_points"], _ = await load(session, "/query_points",
+                                             [{"code": codes[i % len(codes)]} for i in range(args.requests)],
+                                             args.concurrency)
+    return latency
+
+
+async def bench_rss(session, args, pid):
+    '''
+    订阅全部期货合约，以模拟行情跑完一个压缩的交易时段，每秒采样RSS
+    '''
+    codes = await get(session, "/get_instruments")
+    await get(session, "/subscribe", codes=",".join(codes))
+    seconds = args.session_ticks / args.tick_rate
+    start = rss_mb(pid)
+    if start is None:
+        return {"skipped": "当前平台无法读取RSS"}
+    samples = [start]
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        await asyncio.sleep(1)
+        samples.append(rss_mb(pid))
+    return {"codes": len(codes), "ticks_per_code": args.session_ticks, "seconds": round(seconds, 1),
+            "start_mb": round(start, 1), "end_mb": round(samples[-1], 1), "peak_mb": round(max(samples), 1),
+            "growth_mb": round(samples[-1] - start, 1)}
+
+
+# ---- 结果比较 ----
+
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            yield from flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(results, baseline, tolerance):
+    '''
+    返回变差超过容忍比例的指标；只比较吞吐、耗时、延迟和内存增长
+    '''
+    old = dict(flatten(baseline.get("results", {})))
+    regressions = []
+    for name, value in flatten(results):
+        metric = name.rsplit(".", 1)[-1]
+        if name not in old or not old[name]:
+            continue
+        if metric not in HIGHER_IS_BETTER and not metric.endswith(("_ms", "seconds_to_login", "growth_mb")):
+            continue
+        change = (value - old[name]) / abs(old[name])
+        if HIGHER_IS_BETTER.get(metric, False):
+            change = -change
+        if change > tolerance:
+            regressions.append({"metric": name, "baseline": old[name], "current": value,
+                                "change": "%+.1f%%" % (change * 100)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准")
+    parser.add_argument("--only", default=",".join(STAGES), help="逗号分隔的阶段：%s" % ",".join(STAGES))
+    parser.add_argument("--output", help="结果JSON文件")
+    parser.add_argument("--baseline", help="用于比较的之前的结果JSON文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许变差的比例")
+    parser.add_argument("--codes", type=int, default=200, help="模拟期货合约数")
+    parser.add_argument("--ticks", type=int, default=200000, help="ingest阶段的tick数")
+    parser.add_argument("--tick-rate", type=float, default=50.0, help="服务进程中每个合约每秒的模拟tick数")
+    parser.add_argument("--rtt", type=float, default=0.002, help="模拟前置报单往返时延（秒）")
+    parser.add_argument("--requests", type=int, default=400, help="每个接口的请求数")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--order-codes", type=int, default=10, help="下单、行情延迟测试使用的合约数")
+    parser.add_argument("--session-ticks", type=int, default=28800,
+                        help="rss阶段每个合约的tick数，默认相当于4小时、每秒2个tick")
+    args = parser.parse_args()
+    stages = [s for s in args.only.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error("未知的阶段：%s" % ",".join(sorted(unknown)))
+
+    results = {}
+    if "ingest" in stages:
+        results["ingest"] = bench_ingest(args)
+    if set(stages) & {"startup", "latency", "rss"}:
+        results.update(asyncio.run(bench_server(args, stages)))
+    report = {"meta": {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                       "platform": platform.platform(), "seed": SEED, "args": vars(args)},
+              "results": results}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(text)
+    if args.baseline:
+        with open(args.baseline) as fd:
+            regressions = compare(results, json.load(fd), args.tolerance)
+        for item in regressions:
+            print("退化: %(metric)s %(baseline)s -> %(current)s (%(change)s)" % item)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+'''
+合约表热启动基准：约2.2万个合约（含期权）时，原先instruments.dat的json.load加逐个正则分类，
+与内存映射加载InstrumentTable的登录耗时对比；另外给出增量刷新的耗时，
+以及期权链索引与线性扫描期权列表查询平值附近行权价的耗时对比。
+
+    cd server && python -m benchmarks.bench_instruments
+'''
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+from app.internal.chain import OptionChain
+from app.internal.instruments import InstrumentTable
+from app.internal.store import QuoteStore
+
+
+EXCHANGES = ("SHFE", "DCE", "CZCE", "CFFEX", "INE", "GFEX")
+ROUNDS = 5
+
+
+def make_instruments(seed=5):
+    rnd = random.Random(seed)
+    instruments = {}
+    for p in range(60):
+        product = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(2))
+        exchange = EXCHANGES[p % len(EXCHANGES)]
+        for month in range(1, 13):
+            future = "%s26%02d" % (product, month)
+            instruments[future] = {"name": "期货%s" % future, "exchange": exchange, "multiple": 10,
+                                   "price_tick": 1.0, "expire_date": "2026-%02d-15" % month,
+                                   "long_margin_ratio": 0.1, "short_margin_ratio": 0.1, "option_type": None,
+                                   "strike_price": None, "is_trading": True}
+            for k in range(15):
+                for cp, option_type in (("C", "call"), ("P", "put")):
+                    strike = 3000 + k * 50
+                    symbol = "%s-%s-%d" % (future, cp, strike) if exchange == "DCE" else "%s%s%d" % (future, cp, strike)
+                    instruments[symbol] = {"name": "期权%s" % symbol, "exchange": exchange, "multiple": 10,
+                                           "price_tick": 0.5, "expire_date": "2026-%02d-10" % month,
+                                           "long_margin_ratio": None, "short_margin_ratio": None,
+                                           "option_type": option_type, "strike_price": float(strike),
+                                           "is_trading": True}
+    return instruments
+
+
+def legacy_login(path):
+    '''
+    原TraderImpl._getInstruments的缓存读取与_buildInstrumentsDict
+    '''
+    with open(path) as fd:
+        fd.readline()
+        instruments = json.load(fd)
+    options, futures = defaultdict(list), defaultdict(list)
+    for symbol in instruments:
+        instrument = instruments[symbol]
+        instrument["symbol"] = symbol
+        if re.search(r"[\d\-][CP][\d\-]", symbol):
+            try:
+                options[re.findall(r"([A-Za-z]{2,}\d{2,})", symbol)[0]].append(instrument)
+            except:
+                options[re.findall(r'(^[A-Za-z]\d+)', symbol)[0]].append(instrument)
+        else:
+            futures[instrument['exchange']].append(instrument)
+    QuoteStore(instruments)
+    return instruments
+
+
+def table_login(path, meta_path):
+    table = InstrumentTable.load(path, meta_path)
+    QuoteStore(table)
+    return table
+
+
+def linear_near(options, price, n):
+    '''
+    原先只能在未排序的期权列表上排序后查找
+    '''
+    strikes = sorted({i["strike_price"] for i in options})
+    atm = min(range(len(strikes)), key=lambda i: abs(strikes[i] - price))
+    selected = set(strikes[max(0, atm - n): atm + n + 1])
+    return [i for i in options if i["strike_price"] in selected]
+
+
+def best(fn, *args):
+    elapsed = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        fn(*args)
+        elapsed.append(time.perf_counter() - started)
+    return min(elapsed) * 1000
+
+
+def main():
+    instruments = make_instruments()
+    tmp = tempfile.mkdtemp()
+    try:
+        legacy_path = os.path.join(tmp, "instruments.dat")
+        with open(legacy_path, "w") as fd:
+            fd.write("2026-10-19\n")
+            json.dump(instruments, fd, ensure_ascii=False)
+        path, meta_path = os.path.join(tmp, "instruments.npy"), os.path.join(tmp, "instruments.json")
+        table = InstrumentTable.fromDict(instruments, "2026-10-19")
+        table.save(path, meta_path)
+
+        print("instruments=%d (%d options)" % (len(instruments), sum(1 for i in instruments.values() if i["option_type"])))
+        print("cache size: json %.1f MB, table %.1f MB" % (os.path.getsize(legacy_path) / 1e6, os.path.getsize(path) / 1e6))
+        print("warm login, json + regex:   %.1f ms" % best(legacy_login, legacy_path))
+        print("warm login, mapped table:   %.1f ms" % best(table_login, path, meta_path))
+        loaded = table_login(path, meta_path)
+        started = time.perf_counter()
+        futures, options = loaded.futures(), loaded.options()
+        print("first futures/options partition access: %.1f ms (%d exchanges, %d underlyings)" %
+              ((time.perf_counter() - started) * 1000, len(futures), len(options)))
+        assert loaded == {s: dict(i, symbol=s) for s, i in instruments.items()}
+
+        started = time.perf_counter()
+        chain = OptionChain(loaded)
+        print("option chain build: %.1f ms" % ((time.perf_counter() - started) * 1000))
+        queries = [(underlying, 3000 + i * 7 % 750) for i, underlying in enumerate(chain.underlyings())] * 20
+        started = time.perf_counter()
+        for underlying, price in queries:
+            linear_near(options[underlying], price, 3)
+        linear = (time.perf_counter() - started) / len(queries) * 1e6
+        started = time.perf_counter()
+        for underlying, price in queries:
+            chain.near(underlying, price, 3)
+        indexed = (time.perf_counter() - started) / len(queries) * 1e6
+        print("strikes within 3 of ATM: linear scan %.1f us, chain index %.1f us" % (linear, indexed))
+
+        fresh = {s: dict(i) for s, i in instruments.items()}
+        fresh.pop(next(iter(fresh)))
+        fresh["zz2612"] = dict(instruments[next(iter(instruments))], name="新合约")
+        for symbol in list(fresh)[:100]:
+            fresh[symbol]["long_margin_ratio"] = 0.12
+        started = time.perf_counter()
+        diff = loaded.apply(fresh, "2026-10-20")
+        print("diff refresh: %.1f ms, added=%d removed=%d changed=%d" % (
+            (time.perf_counter() - started) * 1000, len(diff["added"]), len(diff["removed"]), len(diff["changed"])))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+'''
+tick路径上的日志开销：按bench_tick的方式原地更新Tick，同时像OnRtnDepthMarketData那样为每个tick写一条INFO日志，
+对比原先同步写文件的f-string、延迟格式化但同步写、后台批量写出，以及后台写出加采样四种方式的每tick耗时。
+另外测试队列写满时是否按丢弃策略计数而不阻塞。
+
+    cd server && python -m benchmarks.bench_logging
+'''
+import logging
+import os
+import tempfile
+import time
+
+from app.internal.logs import LogWriter, QueuedHandler, SampledLogger
+from app.internal.metrics import LOG_DROPPED
+from benchmarks.bench_tick import make_fields, tick_one, CODES, SEED
+
+
+TICKS = 50000
+
+
+def run(name, on_tick, fields):
+    state = {}
+    for field in fields[:CODES]:
+        tick_one(state, field)
+    started = time.perf_counter_ns()
+    for field in fields:
+        on_tick(state, field)
+    elapsed = time.perf_counter_ns() - started
+    print("%-16s %7.0f ns/tick  %8.0f ticks/s" % (name, elapsed / len(fields), len(fields) * 1e9 / elapsed))
+
+
+def main():
+    fields = make_fields(TICKS, CODES, SEED)
+    directory = tempfile.mkdtemp()
+    logger = logging.getLogger("bench.subscribe")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.FileHandler(os.path.join(directory, "sync.log"))
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logger.addHandler(handler)
+
+    def fstring(state, field):
+        logger.info(f"OnRtnDepthMarketData, {field=}")
+        tick_one(state, field)
+
+    def deferred(state, field):
+        logger.info("OnRtnDepthMarketData, field=%r", field)
+        tick_one(state, field)
+
+    run("no logging", tick_one, fields)
+    run("f-string sync", fstring, fields)
+    run("deferred sync", deferred, fields)
+
+    writer = LogWriter(queue_size=len(fields) * 2)
+    logger.removeHandler(handler)
+    logger.addHandler(QueuedHandler(writer, [handler]))
+    run("async", deferred, fields)
+    started = time.perf_counter()
+    writer.close(60)
+    print("  writer drained in %.2f s" % (time.perf_counter() - started))
+
+    writer = LogWriter(queue_size=len(fields) * 2)
+    logger.handlers = [QueuedHandler(writer, [handler])]
+    sampled = SampledLogger(logger)
+
+    def sampling(state, field):
+        sampled.info("OnRtnDepthMarketData, field=%r", field)
+        tick_one(state, field)
+
+    run("async+sampled", sampling, fields)
+    writer.close()
+
+    # 队列容量远小于写入量时丢弃多出的记录，调用方不会因写线程跟不上而阻塞
+    writer = LogWriter(queue_size=100)
+    logger.handlers = [QueuedHandler(writer, [handler])]
+    before = LOG_DROPPED.value()
+    run("async, full", deferred, fields)
+    writer.close(60)
+    print("  dropped %d of %d records" % (LOG_DROPPED.value() - before, len(fields)))
+    handler.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+'''
+指标记录开销：单线程下Histogram.observe、Counter.inc每次的耗时，
+以及多个线程同时记录时按线程分片是否丢失计数，最后输出一段/metrics文本。
+
+    cd server && python -m benchmarks.bench_metrics
+'''
+import random
+import threading
+import time
+
+from app.internal.metrics import MetricsRegistry, Histogram, Counter, TICK_BUCKETS
+
+
+N = 500000
+THREADS = 4
+
+
+def per_call(fn, values):
+    started = time.perf_counter()
+    for value in values:
+        fn(value)
+    return (time.perf_counter() - started) / len(values) * 1e9
+
+
+def main():
+    rnd = random.Random(19)
+    values = [rnd.expovariate(10000) for _ in range(N)]
+    registry = MetricsRegistry()
+    ticks = registry.register(Histogram("bench_tick_seconds", "tick", buckets=TICK_BUCKETS))
+    exchanges = registry.register(Counter("bench_ticks_total", "ticks", ("exchange",)))
+    labels = ("SHFE",)
+
+    print("empty loop:          %6.0f ns" % per_call(lambda v: None, values))
+    print("Histogram.observe:   %6.0f ns" % per_call(ticks.observe, values))
+    print("Counter.inc:         %6.0f ns" % per_call(lambda v: exchanges.inc(labels), values))
+
+    def record():
+        for value in values:
+            ticks.observe(value)
+            exchanges.inc(labels)
+
+    threads = [threading.Thread(target=record) for _ in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    expected = N * (THREADS + 1)
+    print("%d threads x %d records: %.2f s" % (THREADS, N, elapsed))
+    assert ticks.count() == expected, (ticks.count(), expected)
+    assert exchanges.value(labels) == N * (THREADS + 1), exchanges.value(labels)
+    print("no lost updates: %d observations" % expected)
+    print(registry.render())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+'''
+并发报单测试：模拟前置在固定往返时延后按随机顺序返回OnRtnOrder，
+对比逐笔等待与同时提交N笔报单、再同时撤单的总耗时，并检查每笔报单拿到属于自己的单号。
+
+    cd server && python -m benchmarks.bench_order_pipeline
+'''
+import asyncio
+import heapq
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from app.internal.spi import SpiHelper
+from app.internal.orders import OrderTracker
+from app.internal.trade import TraderImpl
+
+
+ORDERS = 20
+RTT = 0.02
+FRONT_ID, SESSION_ID = 1, 12345
+
+
+class FakeFront(SpiHelper):
+    '''
+    在单独线程中按到期时间返回回报：先返回未知状态，半个往返后返回交易所接受或拒绝，
+    同一时刻到期的回报随机交错，模拟CTP回调线程
+    '''
+
+    def __init__(self, rtt, seed=15):
+        SpiHelper.__init__(self)
+        self._tracker = OrderTracker()
+        self._tracker.setSession(FRONT_ID, SESSION_ID)
+        self._rtt = rtt
+        self._random = random.Random(seed)
+        self._sys_ids = iter(range(1, 1 << 30))
+        self._heap = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def ReqOrderInsert(self, field, req_id):
+        order = SimpleNamespace(FrontID=FRONT_ID, SessionID=SESSION_ID, OrderRef=field.OrderRef,
+                                InstrumentID=field.InstrumentID, OrderSysID="", OrderStatus='a',
+                                OrderSubmitStatus='0', VolumeTraded=0, StatusMsg="报单已提交")
+        self._later(self._rtt / 2, self.OnRtnOrder, order)
+        if field.LimitPrice <= 0:
+            rejected = SimpleNamespace(**dict(vars(order), OrderSubmitStatus='4', OrderStatus='5',
+                                              StatusMsg="价格超出涨跌停板"))
+            self._later(self._rtt, self.OnRtnOrder, rejected)
+        else:
+            accepted = SimpleNamespace(**dict(vars(order), OrderSysID="%12d" % next(self._sys_ids),
+                                              OrderSubmitStatus='3', OrderStatus='3', StatusMsg="未成交"))
+            self._later(self._rtt, self.OnRtnOrder, accepted)
+        return 0
+
+    def ReqOrderAction(self, field, req_id):
+        canceled = SimpleNamespace(FrontID=FRONT_ID, SessionID=SESSION_ID, OrderRef="", OrderSysID=field.OrderSysID,
+                                   InstrumentID=field.InstrumentID, OrderStatus='5', OrderSubmitStatus='1',
+                                   VolumeTraded=0, StatusMsg="已撤单")
+        self._later(self._rtt, self.OnRtnOrder, canceled)
+        return 0
+
+    def OnRtnOrder(self, order):
+        self._tracker.onOrder(order)
+
+    # 与TraderImpl相同的报单、撤单登记和等待
+    submitOrder = TraderImpl.submitOrder
+    cancelOrder = TraderImpl.cancelOrder
+
+    def _later(self, delay, callback, arg):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._random.random(), callback, arg))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, callback, arg = heapq.heappop(self._heap)
+            callback(arg)
+
+    async def order(self, code, price):
+        '''
+        与TraderImpl._order相同的发送方式：按报单引用登记后发送
+        '''
+        def send(order_ref):
+            return self.ReqOrderInsert(SimpleNamespace(InstrumentID=code, LimitPrice=price,
+                                                       OrderRef="%12d" % order_ref), 6)
+
+        return await self.submitOrder(send, '3', "录入报单")
+
+    async def delete(self, order_id):
+        sys_id, code = order_id.split("@")
+        return await self.cancelOrder(order_id, lambda: self.ReqOrderAction(
+            SimpleNamespace(OrderSysID=sys_id, InstrumentID=code), 7), "撤销报单")
+
+
+async def sequential(front, codes):
+    started = time.perf_counter()
+    order_ids = [await front.order(code, 3500.0) for code in codes]
+    return time.perf_counter() - started, order_ids
+
+
+async def concurrent(front, codes):
+    started = time.perf_counter()
+    order_ids = await asyncio.gather(*[front.order(code, 3500.0) for code in codes])
+    return time.perf_counter() - started, order_ids
+
+
+async def main():
+    front = FakeFront(RTT)
+    codes = ["rb26%02d" % (i % 12 + 1) for i in range(ORDERS)]
+
+    elapsed, order_ids = await sequential(front, codes)
+    print("%d orders one by one:   %.1f ms (%.1f RTT)" % (ORDERS, elapsed * 1000, elapsed / RTT))
+    elapsed, order_ids = await concurrent(front, codes)
+    print("%d orders concurrently: %.1f ms (%.1f RTT)" % (ORDERS, elapsed * 1000, elapsed / RTT))
+    assert [i.split("@")[1] for i in order_ids] == codes
+    assert len(set(order_ids)) == ORDERS
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[front.delete(i) for i in order_ids])
+    print("%d cancels concurrently: %.1f ms" % (ORDERS, (time.perf_counter() - started) * 1000))
+    assert [r["order_id"] for r in results] == order_ids
+
+    results = await asyncio.gather(front.order("rb2601", 3500.0), front.order("rb2601", 0.0),
+                                   return_exceptions=True)
+    assert isinstance(results[0], str) and isinstance(results[1], RuntimeError), results
+    print("mixed accept/reject: %s, %s" % (results[0].strip(), results[1]))
+    assert len(front._tracker) == 0
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+'''
+模拟时钟下对比原先每次查询前sleep到1秒间隔的限频方式与QueryScheduler，
+在同一时刻涌入一批混合查询时各类查询的排队+往返延迟。
+
+    cd server && python -m benchmarks.bench_query_scheduler
+'''
+import asyncio
+import heapq
+import itertools
+import random
+
+from app.internal.scheduler import (QueryScheduler, percentile,
+                                    PRIORITY_POSITION, PRIORITY_ACCOUNT, PRIORITY_ORDER)
+
+
+SEED = 3
+RTT = 0.05
+# (查询, 优先级, 并发调用数)
+BURST = [("positions", PRIORITY_POSITION, 10), ("account", PRIORITY_ACCOUNT, 10),
+         ("orders", PRIORITY_ORDER, 10), ("trades", PRIORITY_ORDER, 10)]
+
+
+class SimClock:
+    '''
+    离散事件时钟：所有协程都挂起时，直接跳到最近的定时器
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers = []
+        self._seq = itertools.count()
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._timers, (self.now + delay, next(self._seq), future))
+        await future
+
+    async def run(self, coro):
+        task = asyncio.ensure_future(coro)
+        while not task.done():
+            for _ in range(20):
+                await asyncio.sleep(0)
+            if self._timers:
+                self.now, _, future = heapq.heappop(self._timers)
+                future.set_result(None)
+        return task.result()
+
+
+class LegacyLimiter:
+    '''
+    原TraderImpl._limitFrequency：每次查询与上一次间隔至少1秒，且不合并相同查询
+    '''
+
+    def __init__(self, clock):
+        self._clock = clock
+        self._last = 0
+
+    async def submit(self, key, priority, factory):
+        now = self._clock()
+        delay = max(0, self._last + 1 - now)
+        self._last = now + delay
+        if delay > 0:
+            await self._clock.sleep(delay)
+        return await factory()
+
+
+async def burst(clock, limiter):
+    latencies = {}
+
+    async def call(key, priority):
+        start = clock()
+        await limiter.submit(key, priority, lambda: clock.sleep(RTT))
+        latencies.setdefault(key, []).append(clock() - start)
+
+    calls = [(key, priority) for key, priority, n in BURST for _ in range(n)]
+    random.Random(SEED).shuffle(calls)
+    await asyncio.gather(*[call(key, priority) for key, priority in calls])
+    return latencies
+
+
+def report(name, latencies):
+    everything = sorted(sum(latencies.values(), []))
+    line = " ".join("%s=%.2fs" % (key, max(v)) for key, v in latencies.items())
+    print("%-9s p50=%.2fs p99=%.2fs | worst per query: %s" %
+          (name, percentile(everything, 0.5), percentile(everything, 0.99), line))
+
+
+def main():
+    clock = SimClock()
+    report("legacy", asyncio.run(clock.run(burst(clock, LegacyLimiter(clock)))))
+    clock = SimClock()
+    scheduler = QueryScheduler(1, 1, clock=clock, sleep=clock.sleep)
+    report("scheduler", asyncio.run(clock.run(burst(clock, scheduler))))
+    print("scheduler stats:", scheduler.stats())
+
+
+if __name__ == '__main__':
+    main()
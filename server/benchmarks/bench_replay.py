@@ -0,0 +1,58 @@
+'''
+行情回放基准：先用TickRecorder录制两个交易日的模拟行情，再以最快速度回放给
+行情快照、回放总线（挂着K线引擎）和一个空接收函数，输出持续吞吐、各接收函数的耗时，
+以及K线引擎的处理数、丢弃数和最大滞后；
+最后以10倍速回放几秒行情检查定速回放的滞后。
+
+    cd server && python -m benchmarks.bench_replay
+'''
+import json
+import shutil
+import tempfile
+
+from app.internal.instruments import product
+from app.internal.recorder import TickRecorder
+from app.internal.replay import TickReplay, ReplayTarget
+from app.internal.tick import Tick
+from benchmarks.bench_recorder import make_fields
+
+
+TICKS = 200000
+CODES = 2000
+DAYS = ("20261019", "20261020")
+
+
+def record(base_dir):
+    recorder = TickRecorder(base_dir)
+    recorder.start()
+    ticks = {}
+    for day in DAYS:
+        for field in make_fields(TICKS // len(DAYS), CODES, int(day)):
+            field.TradingDay = day
+            tick = ticks.setdefault(field.InstrumentID, Tick(field.InstrumentID))
+            tick.update(field)
+            recorder.record(tick)
+    recorder.stop()
+
+
+def main():
+    base_dir = tempfile.mkdtemp() + "/"
+    try:
+        record(base_dir)
+        codes = ["c%04d" % i for i in range(CODES)]
+        target = ReplayTarget(lambda code: ("SHFE", product(code)), {code: {"exchange": "SHFE"} for code in codes})
+        receivers = {"ReplayTarget.onTick": target.onTick,
+                     "noop": lambda tick: None}
+        report = TickReplay(DAYS, speed=None, base_dir=base_dir).run(receivers)
+        report["consumers"] = target.close()
+        print(json.dumps(report, indent=2))
+
+        report = TickReplay(DAYS[:1], codes[:50], speed=10, base_dir=base_dir).run({"noop": lambda tick: None})
+        print("10x, 50 codes: %d ticks in %.2fs, max lag %.2fms" %
+              (report["ticks"], report["elapsed"], report["max_lag_ms"]))
+    finally:
+        shutil.rmtree(base_dir)
+
+
+if __name__ == "__main__":
+    main()
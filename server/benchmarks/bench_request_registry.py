@@ -0,0 +1,75 @@
+'''
+请求号注册表压力测试：数百个并发查询的回调在SPI线程中随机交错返回，
+检查每个调用方只拿到属于自己的数据行。
+
+    cd server && python -m benchmarks.bench_request_registry
+'''
+import asyncio
+import queue
+import random
+import threading
+import time
+
+from app.internal.spi import SpiHelper
+
+
+QUERIES = 500
+SEED = 7
+
+
+class FakeSpi(SpiHelper):
+    '''
+    在单独线程中按随机交错顺序回放各请求的数据行，模拟CTP回调线程
+    '''
+
+    def __init__(self, seed):
+        SpiHelper.__init__(self)
+        self._random = random.Random(seed)
+        self._inbox = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def ReqQry(self, tag, rows, req_id):
+        self._inbox.put((req_id, tag, rows))
+        return 0
+
+    def _run(self):
+        streams = {}
+        while True:
+            try:
+                while True:
+                    req_id, tag, rows = self._inbox.get_nowait() if streams else self._inbox.get()
+                    streams[req_id] = [(tag, i) for i in range(rows)]
+            except queue.Empty:
+                pass
+            req_id = self._random.choice(list(streams))
+            stream = streams[req_id]
+            if stream:
+                self.gotRow(req_id, stream.pop(0))
+            else:
+                del streams[req_id]
+                self.completeRequest(req_id)
+
+
+async def query(spi, tag, rows):
+    result = await spi.request(lambda req_id: spi.ReqQry(tag, rows, req_id), "查询%s" % tag)
+    return tag, rows, result
+
+
+async def main():
+    spi = FakeSpi(SEED)
+    plan = random.Random(SEED)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[query(spi, tag, plan.randint(0, 20)) for tag in range(QUERIES)])
+    elapsed = time.perf_counter() - start
+    errors = 0
+    for tag, rows, result in results:
+        if result != [(tag, i) for i in range(rows)]:
+            errors += 1
+    print("queries=%d rows=%d mismatched=%d pending=%d elapsed=%.0fms" %
+          (QUERIES, sum(len(r[2]) for r in results), errors, len(spi._requests), elapsed * 1000))
+    return errors
+
+
+if __name__ == '__main__':
+    raise SystemExit(1 if asyncio.run(main()) else 0)
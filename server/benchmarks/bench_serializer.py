@@ -0,0 +1,117 @@
+'''
+响应编码基准：调用最频繁的五个接口（/query_points、/get_positions、/get_orders、/get_account、
+/ws/quotes推送）的响应体，原先json.dumps(ensure_ascii=False)与serializer.dumps的编码耗时和字节数对比；
+“重复”一列为数据未变化时再次读取（共享快照命中缓存）的耗时。
+
+    cd server && python -m benchmarks.bench_serializer
+'''
+import json
+import random
+import time
+
+from app.internal import serializer
+from app.internal.serializer import dumps, share
+from app.internal.tick import TICK_FIELDS, Tick, encodeTicks
+
+
+ROUNDS = 200
+
+
+class Field:
+    pass
+
+
+def make_field(rnd, code):
+    field = Field()
+    for name, ctp_name in TICK_FIELDS:
+        if name in ("trading_day", "action_day"):
+            value = "20261019"
+        elif name == "update_time":
+            value = "10:15:%02d" % rnd.randrange(60)
+        elif "volume" in name or name == "update_millisec":
+            value = rnd.randrange(1000)
+        else:
+            value = round(rnd.uniform(3000, 4000), 1)
+        setattr(field, ctp_name, value)
+    field.InstrumentID = code
+    return field
+
+
+def make_ticks(rnd, n):
+    ticks = {}
+    for i in range(n):
+        code = "rb26%02d" % (i % 12 + 1) if i < 12 else "ag%04d" % i
+        tick = Tick(code)
+        tick.update(make_field(rnd, code))
+        ticks[code] = tick
+    return ticks
+
+
+def make_orders(rnd, n):
+    return {"%012d@rb2601" % i: {"code": "rb2601", "direction": rnd.choice(("long", "short")),
+                                 "price": round(rnd.uniform(3000, 4000), 1), "volume": rnd.randrange(1, 10),
+                                 "insert_time": "09:%02d:%02d" % (i // 60 % 60, i % 60), "cancel_time": "",
+                                 "active_time": "", "update_time": "", "comb_offset_flag": "0",
+                                 "volume_traded": 0, "is_active": True, "decimal_places": 0}
+            for i in range(n)}
+
+
+def make_positions(rnd, n):
+    return [{"code": "ag%04d" % i, "direction": "long", "volume": 3, "margin": round(rnd.uniform(1e4, 1e5), 2),
+             "cost": 1.0e5, "position_cost": 1.0e5, "position_date": '1', "yd_position": 0, "today_position": 3,
+             "long_frozen": 0, "short_frozen": 0, "open_volume": 3, "close_volume": 0, "settlement_price": 0.0,
+             "position_profit": round(rnd.uniform(-500, 500), 2), "profit": 0.0, "open_cost_price": 3321.0,
+             "decimal_places": 0} for i in range(n)]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        body = fn()
+    return (time.perf_counter() - started) / ROUNDS * 1e6, body
+
+
+def legacy(data):
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+def main():
+    rnd = random.Random(14)
+    ticks = make_ticks(rnd, 200)
+    orders = share(make_orders(rnd, 500))
+    positions = share(make_positions(rnd, 40))
+    account = {"balance": 1234567.89, "margin": 234567.12, "available": 1000000.77, "profit": -1234.5,
+               "updated_at": "2026-10-19 10:15:00"}
+    tick = ticks["rb2601"]
+
+    def cold_ticks():
+        for t in ticks.values():
+            t._json_dict = None
+        return encodeTicks(ticks).encode()
+
+    # (接口, 原先编码的数据, 首次编码, 重复编码)
+    cases = [
+        ("/query_points", tick.to_dict(), lambda: serializer._encode(tick.to_dict()), tick.to_json),
+        ("/get_positions", [positions, "2026-10-19 10:15:00"],
+         lambda: serializer._encode([positions, "2026-10-19 10:15:00"]), lambda: dumps([positions, "2026-10-19 10:15:00"])),
+        ("/get_orders", [orders, "2026-10-19 10:15:00"],
+         lambda: serializer._encode([orders, "2026-10-19 10:15:00"]), lambda: dumps([orders, "2026-10-19 10:15:00"])),
+        ("/get_account", account, lambda: serializer._encode(account), lambda: dumps(account)),
+        ("/ws/quotes", {code: t.to_dict() for code, t in ticks.items()}, cold_ticks,
+         lambda: encodeTicks(ticks).encode()),
+    ]
+    print("backend=%s, %d rounds" % (serializer.BACKEND, ROUNDS))
+    print("%-16s %12s %12s %12s %10s %10s" % ("route", "json us", "fast us", "repeat us", "json B", "fast B"))
+    for route, data, cold, warm in cases:
+        json_us, json_body = timed(lambda: legacy(data))
+        cold_us, _ = timed(cold)
+        warm_us, body = timed(warm)
+        assert json.loads(body) == json.loads(json_body), route
+        print("%-16s %12.1f %12.1f %12.1f %10d %10d" % (route, json_us, cold_us, warm_us, len(json_body), len(body)))
+
+    nan = {"last_price": float("nan"), "upper": float("inf"), "volume": 1}
+    print("NaN/inf:", dumps(nan).decode())
+
+
+if __name__ == "__main__":
+    main()
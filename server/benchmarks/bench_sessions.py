@@ -0,0 +1,44 @@
+'''
+多账户托管：在一个进程中依次向SessionRegistry加入账户并登录模拟前置，
+输出每加入一批账户后的常驻内存、行情会话数和合约表实例数，检查它们是否随账户数线性增长。
+
+    cd server && python -m benchmarks.bench_sessions
+'''
+import gc
+import os
+
+from app.internal.client import Client
+from app.internal.quote import QuoteImpl
+from app.internal.sessions import SessionRegistry
+from benchmarks.bench_e2e import rss_mb
+
+
+STEPS = (1, 5, 20, 50)
+SEED = 24
+
+
+def main():
+    options = {"futures": 500, "options": 10, "tick_rate": 0, "rtt": 0.001, "positions": 10, "orders": 20,
+               "trades": 20, "seed": SEED}
+    sessions = SessionRegistry()
+    market = sessions.add(Client("", "", "sim", "", "", "acct0000", "", simulator=options))
+    market.login()
+    base = rss_mb(os.getpid())
+    try:
+        for count in STEPS:
+            while len(sessions) < count:
+                client = sessions.add(Client("", "", "sim", "", "", "acct%04d" % len(sessions), "",
+                                             simulator=options, market=market))
+                client.login()
+            gc.collect()
+            feeds = sum(1 for item in gc.get_objects() if isinstance(item, QuoteImpl))
+            tables = len({id(client._td._instruments) for client in sessions})
+            rss = rss_mb(os.getpid())
+            print("%3d accounts: rss %s MB (+%s), md sessions %d, instrument tables %d" % (
+                count, "%.1f" % rss if rss else "-", "%.1f" % (rss - base) if rss else "-", feeds, tables))
+    finally:
+        sessions.logout()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+'''
+共享内存分发：一个写入线程按行情速率向SharedQuoteStore写tick（每个tick的全部价格、数量字段取同一个值），
+多个读取进程挂载QuoteView反复做/get_snapshot的查询，输出
+  - 单进程QuoteStore与1、2、4个读取进程的总查询吞吐
+  - 顺序锁读取与不加检查直接拷贝时读到写了一半的行数
+  - 持仓快照经SharedBlob发布和读取的耗时
+多进程部署的HTTP层（app/ctp_workers.py）需要sanic和ctpwrapper，这里只测共享内存部分。
+
+    cd server && python -m benchmarks.bench_shared
+'''
+import multiprocessing
+import os
+import random
+import threading
+import time
+from multiprocessing import resource_tracker
+
+import numpy as np
+
+from app.internal.shared import SharedQuoteStore, QuoteView, SharedBlob
+from app.internal.store import QuoteStore, COLUMNS
+from app.internal.serializer import dumpb
+from app.internal.tick import Tick, TICK_FIELDS
+
+
+CODES = 2000
+READERS = (1, 2, 4)
+DURATION = 2.0
+FIELDS = ("last", "volume", "bid_price", "ask_price")
+POSITIONS = 200
+SEED = 25
+# 第一个价格列起都由同一个值写入，一行中出现不同的值就是读到了写了一半的行
+FIRST = COLUMNS["last"]
+VALUE_FIELDS = tuple(name for name, _ in TICK_FIELDS
+                     if name not in ("trading_day", "action_day", "update_time", "update_millisec"))
+
+
+def instruments():
+    return {"%s%04d" % ("abcdefgh"[i % 8], i): {"exchange": "SHFE"} for i in range(CODES)}
+
+
+def write_ticks(store, stop, counter):
+    random.seed(SEED)
+    ticks = [Tick(code) for code in store.codes]
+    for tick in ticks:
+        tick.trading_day = "20261019"
+        tick.update_time = "09:30:00"
+        tick.update_millisec = 0
+    n = 0
+    while not stop.is_set():
+        n += 1
+        tick = ticks[random.randrange(len(ticks))]
+        for name in VALUE_FIELDS:
+            setattr(tick, name, float(n))
+        store.write(tick)
+    counter.append(n)
+
+
+def read_quotes(quotes, checked, seconds, results):
+    view = QuoteView(quotes)
+    rows = np.arange(len(view))
+    count = torn = raw_torn = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        view.snapshot(FIELDS)
+        count += 1
+        if checked:
+            values = view.rows(rows)[:, FIRST:]
+            torn += int((values != values[:, :1]).any(axis=1).sum())
+            values = QuoteStore.rows(view, rows)[:, FIRST:]
+            raw_torn += int((values != values[:, :1]).any(axis=1).sum())
+    results.put((count, torn, raw_torn))
+
+
+def run_readers(store, readers, checked=False):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    quotes = {"name": store.name, "codes": store.codes.tolist(), "exchange": store.exchange.tolist(),
+              "product": store.product.tolist()}
+    processes = [context.Process(target=read_quotes, args=(quotes, checked, DURATION, results))
+                 for _ in range(readers)]
+    for process in processes:
+        process.start()
+    counts = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    # 读取进程与本进程共用resource_tracker，挂载后的注销把本进程创建的段也注销了，重新登记以便退出时清理
+    resource_tracker.register(store._shm._name, "shared_memory")
+    return [sum(item[i] for item in counts) for i in range(3)]
+
+
+def bench_blob():
+    rows = [{"code": "rb%04d" % i, "direction": "long", "volume": i, "price": 3500.0 + i, "profit": i * 1.5}
+            for i in range(POSITIONS)]
+    data = [rows, "2026-10-19 09:30:00"]
+    blob = SharedBlob.create("bench%d_position" % os.getpid())
+    try:
+        payload = dumpb(data)
+        loops = 20000
+        started = time.perf_counter()
+        for _ in range(loops):
+            dumpb(data)
+        encode = (time.perf_counter() - started) / loops
+        started = time.perf_counter()
+        for _ in range(loops):
+            blob.write(payload)
+        write = (time.perf_counter() - started) / loops
+        started = time.perf_counter()
+        for _ in range(loops):
+            blob.read()
+        read = (time.perf_counter() - started) / loops
+        print("blob: %d positions, %d bytes, encode %.1f us, write %.1f us, read %.1f us" % (
+            POSITIONS, len(payload), encode * 1e6, write * 1e6, read * 1e6))
+    finally:
+        blob.close()
+
+
+def main():
+    store = SharedQuoteStore(instruments(), "bench%d_quotes" % os.getpid())
+    stop = threading.Event()
+    written = []
+    writer = threading.Thread(target=write_ticks, args=(store, stop, written), daemon=True)
+    writer.start()
+    try:
+        # 基线：与owner同一进程直接查询（原单进程部署），受写入线程的GIL竞争影响
+        count = 0
+        deadline = time.perf_counter() + DURATION
+        while time.perf_counter() < deadline:
+            QuoteStore.snapshot(store, FIELDS)
+            count += 1
+        print("in-process: %d codes, %d cpus, %.0f snapshots/s" % (CODES, os.cpu_count(), count / DURATION))
+        for readers in READERS:
+            count, _, _ = run_readers(store, readers)
+            print("%d readers:  %.0f snapshots/s" % (readers, count / DURATION))
+        count, torn, raw_torn = run_readers(store, 2, checked=True)
+        print("torn rows in %d checked reads: seqlock %d, unchecked copy %d" % (count, torn, raw_torn))
+    finally:
+        stop.set()
+        writer.join()
+        store.unlink()
+    print("writer: %.0f ticks/s" % (written[0] / (DURATION * (len(READERS) + 2))))
+    bench_blob()
+
+
+if __name__ == "__main__":
+    main()
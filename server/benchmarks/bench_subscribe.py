@@ -0,0 +1,63 @@
+'''
+批量订阅：进程内登录模拟前置，对比逐个合约调用QuoteImpl.subscribe（原Client.subscribe、getPositions的方式）
+与各消费方并发调用Client.subscribe、由SubscriptionManager合并成批的耗时和请求次数，
+并统计从发出订阅到收到第一个tick的时间。
+
+    cd server && python -m benchmarks.bench_subscribe
+'''
+import asyncio
+import time
+
+from app.internal.client import Client
+
+
+CODES = 2000
+RTT = 0.002
+SEED = 23
+
+
+async def one_by_one(client, codes):
+    started = time.perf_counter()
+    for code in codes:
+        await client._md.subscribe([code])
+    elapsed = time.perf_counter() - started
+    await client._md.unsubscribe(codes)
+    return elapsed
+
+
+async def batched(client, codes):
+    before = client._subscriptions.batches
+    started = time.perf_counter()
+    # 每个合约一个消费方，模拟同时到达的推送连接、持仓、查询价格
+    await asyncio.gather(*(client.subscribe([code], "bench-%d" % i) for i, code in enumerate(codes)))
+    elapsed = time.perf_counter() - started
+    return elapsed, client._subscriptions.batches - before
+
+
+def main():
+    options = {"futures": CODES, "options": 0, "tick_rate": 2.0, "rtt": RTT, "positions": 0, "orders": 0,
+               "trades": 0, "seed": SEED}
+    client = Client("", "", "sim", "", "", "bench", "", simulator=options)
+    client.login()
+    try:
+        codes = [code for code, i in client._td._instruments.items() if i["option_type"] is None][:CODES]
+
+        async def run():
+            elapsed = await one_by_one(client, codes)
+            print("one by one: %d codes, %d requests, %.3f s" % (len(codes), len(codes), elapsed))
+            elapsed, batches = await batched(client, codes)
+            print("batched:    %d codes, %d requests, %.3f s" % (len(codes), batches, elapsed))
+            await asyncio.sleep(2)
+            states = client.subscriptions()["codes"]
+            delays = sorted(i["first_tick_at"] - i["requested_at"] for i in states if i["first_tick_at"])
+            if delays:
+                print("first tick: %d/%d codes, p50 %.1f ms, max %.1f ms" % (
+                    len(delays), len(states), delays[len(delays) // 2] * 1000, delays[-1] * 1000))
+
+        asyncio.run(run())
+    finally:
+        client.logout()
+
+
+if __name__ == "__main__":
+    main()
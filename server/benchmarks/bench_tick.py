@@ -0,0 +1,117 @@
+'''
+tick处理微基准：原先每个tick构造28键字典的方式、原地覆盖的Tick记录、
+以及再写入列式QuoteStore三者对比，输出每个tick的耗时(ns)和分配的字节数。
+
+    cd server && python -m benchmarks.bench_tick
+'''
+import random
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from app.internal.constants import FILTER
+from app.internal.tick import Tick, TICK_FIELDS
+from app.internal.store import QuoteStore
+
+
+TICKS = 200000
+CODES = 500
+SEED = 11
+
+
+def make_fields(n, codes, seed):
+    rnd = random.Random(seed)
+    fields = []
+    for i in range(n):
+        values = {ctp: rnd.random() * 5000 for _, ctp in TICK_FIELDS}
+        values.update({"TradingDay": "20261018", "ActionDay": "20261018",
+                       "UpdateTime": "09:%02d:%02d" % (i // 60 % 60, i % 60), "UpdateMillisec": 500,
+                       "InstrumentID": "c%04d" % (i % codes), "Volume": i, "OpenInterest": 1000.0,
+                       "PreOpenInterest": 1000.0})
+        fields.append(SimpleNamespace(**values))
+    return fields
+
+
+def legacy(field):
+    '''
+    原QuoteImpl.OnRtnDepthMarketData中的字典构造
+    '''
+    return {"trade_time": field.TradingDay[:4] + '-' + field.TradingDay[4:6] + '-' + field.TradingDay[
+                                                                                   6:] + " " + field.UpdateTime,
+            "update_sec": int(field.UpdateMillisec),
+            "code": field.InstrumentID, "price": FILTER(field.LastPrice),
+            "open": FILTER(field.OpenPrice), "close": FILTER(field.ClosePrice),
+            "highest": FILTER(field.HighestPrice), "lowest": FILTER(field.LowestPrice),
+            "upper_limit": FILTER(field.UpperLimitPrice),
+            "lower_limit": FILTER(field.LowerLimitPrice),
+            "settlement": FILTER(field.SettlementPrice), "volume": field.Volume,
+            "turnover": field.Turnover, "open_interest": int(field.OpenInterest),
+            "pre_close": FILTER(field.PreClosePrice),
+            "pre_settlement": FILTER(field.PreSettlementPrice),
+            "pre_open_interest": int(field.PreOpenInterest),
+            "ask1": (FILTER(field.AskPrice1), field.AskVolume1),
+            "bid1": (FILTER(field.BidPrice1), field.BidVolume1),
+            "ask2": (FILTER(field.AskPrice2), field.AskVolume2),
+            "bid2": (FILTER(field.BidPrice2), field.BidVolume2),
+            "ask3": (FILTER(field.AskPrice3), field.AskVolume3),
+            "bid3": (FILTER(field.BidPrice3), field.BidVolume3),
+            "ask4": (FILTER(field.AskPrice4), field.AskVolume4),
+            "bid4": (FILTER(field.BidPrice4), field.BidVolume4),
+            "ask5": (FILTER(field.AskPrice5), field.AskVolume5),
+            "bid5": (FILTER(field.BidPrice5), field.BidVolume5)}
+
+
+STORE = QuoteStore({"c%04d" % i: {"exchange": "SHFE"} for i in range(CODES)})
+
+
+def legacy_one(state, field):
+    x = legacy(field)
+    code = x.pop('code')
+    state.update({code: x})
+
+
+def tick_one(state, field):
+    code = field.InstrumentID
+    tick = state.get(code)
+    if tick is None:
+        tick = state[code] = Tick(code)
+    tick.update(field)
+
+
+def store_one(state, field):
+    tick_one(state, field)
+    STORE.write(state[field.InstrumentID])
+
+
+def measure(one, fields):
+    '''
+    返回(每个tick的纳秒数, 每个tick临时分配的字节数)
+    '''
+    state = {}
+    for field in fields[:CODES]:
+        one(state, field)
+    start = time.perf_counter_ns()
+    for field in fields:
+        one(state, field)
+    elapsed = time.perf_counter_ns() - start
+    sample = fields[CODES:CODES + 2000]
+    tracemalloc.start()
+    total = 0
+    for field in sample:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        one(state, field)
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return elapsed / len(fields), total / len(sample)
+
+
+def main():
+    fields = make_fields(TICKS, CODES, SEED)
+    for name, one in (("legacy", legacy_one), ("tick", tick_one), ("store", store_one)):
+        ns, allocated = measure(one, fields)
+        print("%-7s %7.0f ns/tick  %6.0f bytes/tick" % (name, ns, allocated))
+
+
+if __name__ == '__main__':
+    main()